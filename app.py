@@ -19,7 +19,9 @@ from werkzeug.serving import run_simple
 
 try:
     from .repository import Info, Search
-    from .repository.resources.fedora import Resource, Transaction
+    from .repository.resources.fedora import Resource, ResourceBatch
+    from .repository.resources.fedora import Container, ResourceExpansion
+    from .repository.resources.fedora import Transaction
     from .repository.resources.fedora3 import FedoraObject
     from .repository.resources.fuseki import TripleStore
     from .repository.resources.islandora import IslandoraDatastream
@@ -29,7 +31,9 @@ try:
     from .repository.utilities.migrating.foxml import FoxmlContentHandler
 except (SystemError, ImportError):
     from repository import Info, Search
-    from repository.resources.fedora import Resource, Transaction
+    from repository.resources.fedora import Resource, ResourceBatch
+    from repository.resources.fedora import Container, ResourceExpansion
+    from repository.resources.fedora import Transaction
     from repository.resources.fedora3 import FedoraObject
     from repository.resources.fuseki import TripleStore
     from repository.resources.islandora import IslandoraDatastream
@@ -98,13 +102,23 @@ api = application = falcon.API()
 
 api.add_route("/config", Config())
 api.add_route("/info", Info(config))
-api.add_route("/search", Search(config))
+# Resources share the Search instance, and its caches, mounted on /search
+search = Search(config)
+api.add_route("/search", search)
 api.add_route("/version", Version())
 if 'FEDORA' in config:
-    resource = Resource(config)
+    resource = Resource(config, search)
     api.add_route("/Resource/", resource)
+    api.add_route("/Resource/batch", ResourceBatch(config, resource.searcher))
     api.add_route("/Resource/{id}", resource)
-    api.add_route("/Transaction", Transaction(config))
+    api.add_route("/Resource/{id}/expand", 
+                  ResourceExpansion(config, resource.searcher))
+    container = Container(config, resource.searcher)
+    api.add_route("/Container/", container)
+    api.add_route("/Container/{id}", container)
+    transaction = Transaction(config, search)
+    api.add_route("/Transaction", transaction)
+    api.add_route("/Transaction/{token}", transaction)
 
 if 'FEDORA3' in config:
     api.add_route("/migrate/foxml", FoxmlContentHandler(config))
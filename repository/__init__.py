@@ -11,8 +11,12 @@ import re
 import urllib.request
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
 from .resources.fuseki import TripleStore
+from .utilities.fetch import fetch_graph
+from .utilities.cache import MemberCache
 from .utilities.namespaces import *
+from .utilities.registry import IdRegistry
 
 CONTEXT = {
     "authz": str(AUTHZ),
@@ -97,6 +101,170 @@ def default_graph():
         new_graph.namespace_manager.bind(key, value)
     return new_graph
 
+def is_server_managed(predicate, object_):
+    """Function returns True if a triple's predicate and object are managed
+    by Fedora and cannot be changed by a SPARQL update
+
+    Args:
+        predicate(rdflib.Term): Predicate
+        object_(rdflib.Term): Object
+    """
+    for namespace in [FEDORA, LDP]:
+        if str(predicate).startswith(str(namespace)):
+            return True
+        if predicate == RDF.type and str(object_).startswith(str(namespace)):
+            return True
+    return False
+
+def graph_diff(current, desired, predicates=None):
+    """Function compares a Resource's current graph with a desired graph and
+    returns the triples to remove and to add, skipping Fedora's server 
+    managed triples.
+
+    Args:
+        current(rdflib.Graph): Current graph of the Resource
+        desired(rdflib.Graph): Desired graph of the Resource
+        predicates: Only compare triples with these predicates, default is 
+                    None to compare all triples
+
+    Returns:
+        tuple: rdflib.Graph of removed triples, rdflib.Graph of added triples
+    """
+    def editable(graph):
+        triples = set()
+        for subject, predicate, object_ in graph:
+            if is_server_managed(predicate, object_):
+                continue
+            if predicates is not None and not predicate in predicates:
+                continue
+            triples.add((subject, predicate, object_))
+        return triples
+    current_triples, desired_triples = editable(current), editable(desired)
+    removed, added = default_graph(), default_graph()
+    for triple in current_triples - desired_triples:
+        removed.add(triple)
+    for triple in desired_triples - current_triples:
+        added.add(triple)
+    return removed, added
+
+def diff_sparql(removed, added):
+    """Function takes graphs of removed and added triples and returns a 
+    single SPARQL update for both Fedora and Fuseki. Blank nodes can't be
+    deleted by label, so removed triples with blank nodes are deleted
+    through variables bound by an OPTIONAL pattern of those triples.
+
+    Args:
+        removed(rdflib.Graph): Triples to delete
+        added(rdflib.Graph): Triples to insert
+
+    Returns:
+        string
+    """
+    variables = {}
+    def term(node):
+        if isinstance(node, rdflib.BNode):
+            if node not in variables:
+                variables[node] = "?b{}".format(len(variables))
+            return variables[node]
+        return node.n3()
+    deletes, patterns = [], []
+    for triple in removed:
+        line = "{} .\n".format(" ".join([term(node) for node in triple]))
+        deletes.append(line)
+        if any([isinstance(node, rdflib.BNode) for node in triple]):
+            patterns.append(line)
+    where = ""
+    if len(patterns) > 0:
+        where = "OPTIONAL {{\n{}}}\n".format("".join(patterns))
+    return """{}
+DELETE {{
+{}}} INSERT {{
+{}}} WHERE {{
+{}}}""".format(
+        generate_prefix(),
+        "".join(deletes),
+        added.serialize(format='nt').decode(),
+        where)
+
+def field_name(predicate):
+    """Function returns the Elastic search field for a predicate, matching
+    the JSON-LD keys compacted with CONTEXT used for indexing 
+
+    Args:
+        predicate(rdflib.URIRef): Predicate
+
+    Returns:
+        string
+    """
+    if predicate == RDF.type:
+        return 'type'
+    for prefix, namespace in CONTEXT.items():
+        if str(predicate).startswith(namespace):
+            name = str(predicate)[len(namespace):]
+            if len(name) > 0:
+                return "{}:{}".format(prefix, name)
+    return str(predicate)
+
+def to_term(value):
+    """Function takes a value from a request and returns a rdflib term, 
+    URLs and values in CONTEXT prefix notation (i.e. bf:title) are 
+    returned as URIRef, everything else as a Literal
+
+    Args:
+        value: Value from a request
+
+    Returns:
+        rdflib.URIRef or rdflib.Literal
+    """
+    if isinstance(value, dict):
+        if '@id' in value:
+            return to_term(value.get('@id'))
+        return rdflib.Literal(value.get('@value'))
+    if not isinstance(value, str):
+        return rdflib.Literal(value)
+    if URL_CHECK_RE.search(value):
+        return rdflib.URIRef(value)
+    prefix, _, name = value.partition(":")
+    if prefix in CONTEXT and len(name) > 0 and not " " in value:
+        return rdflib.URIRef("{}{}".format(CONTEXT[prefix], name))
+    return rdflib.Literal(value)
+
+def fields_sparql(subject, changes, graph=None):
+    """Function takes a subject and a list of predicate and objects tuples 
+    and returns a single SPARQL update that replaces all of the values of 
+    each predicate
+
+    Args:
+        subject(rdflib.URIRef): Subject
+        changes(list): List of predicate, list of objects tuples
+        graph(rdflib.URIRef): Named graph of the subject, defaults to None
+                              for the default graph
+
+    Returns:
+        string
+    """
+    added = default_graph()
+    operations = []
+    for predicate, objects in changes:
+        if graph is None:
+            operations.append("DELETE WHERE {{ {} {} ?object }}".format(
+                subject.n3(),
+                predicate.n3()))
+        else:
+            operations.append(
+                "WITH {0} DELETE {{ {1} {2} ?object }} "
+                "WHERE {{ {1} {2} ?object }}".format(
+                    graph.n3(),
+                    subject.n3(),
+                    predicate.n3()))
+        for object_ in objects:
+            added.add((subject, predicate, object_))
+    triples = added.serialize(format='nt').decode()
+    if graph is not None:
+        triples = "GRAPH {} {{\n{}}}\n".format(graph.n3(), triples)
+    operations.append("INSERT DATA {{\n{}}}".format(triples))
+    return "{}\n{}".format(generate_prefix(), " ;\n".join(operations))
+
 def generate_prefix():
     prefix = ''
     for key, value in CONTEXT.items():
@@ -114,12 +282,12 @@ def ingest_resource(req, resp, resource):
     """
     body = json.loads(resp.body)
     fcrepo_uri = rdflib.URIRef(body['uri'])
-    graph = rdflib.Graph().parse(body['uri'])
+    graph = fetch_graph(body['uri'])
     doc_id = str(graph.value(
         subject=fcrepo_uri,
         predicate=FEDORA.uuid))
 
-    TripleStore(resource.config).__load__(fuseki_sparql)
+    TripleStore(resource.config).__load__(graph)
 
 def ingest_turtle(graph):
     subjects = [s for s in set(graph.subjects())]
@@ -227,8 +395,14 @@ class Search(object):
                        "port": config["ELASTICSEARCH"]["port"]}
             if 'url_prefix' in config["ELASTICSEARCH"]:
                 options['url_prefix'] = config["ELASTICSEARCH"]['url_prefix']
-            self.search_index = Elasticsearch(options)
+            self.search_index = Elasticsearch([options])
         self.triplestore = TripleStore(config)
+        if 'REGISTRY' in config:
+            self.registry = IdRegistry(config['REGISTRY']['path'])
+        else:
+            self.registry = IdRegistry()
+        # Expanded graphs of Resources, see fedora.ResourceExpansion
+        self.expansions = MemberCache()
         self.body = None
 
     def __get_id_or_value__(self, value):
@@ -245,12 +419,59 @@ class Search(object):
         elif '@value' in value:
             return value.get('@value')
         elif '@id' in value:
-            result = self.triplestore.__get_id__(value.get('@id'))
-            if len(result) > 0:
-                return result[0]['uuid']['value']
-            return value.get('@id')
+            return self.id_from_url(value.get('@id')) or value.get('@id')
         return value
 
+    def __rebuild_registry__(self):
+        """Internal method rebuilds the local uuid and Fedora URL registry
+        from Fuseki
+
+        Returns:
+            int -- Number of registered Resources
+        """
+        return self.registry.rebuild(self.triplestore)
+
+    def id_from_url(self, url):
+        """Method returns the uuid of a Fedora URL from the local registry, 
+        falling back to Fuseki and registering the result
+
+        Args:
+            url -- Fedora URL
+        Returns:
+            string or None
+        """
+        uuid = self.registry.uuid(url)
+        if uuid is not None:
+            return uuid
+        result = self.triplestore.__get_id__(url)
+        if len(result) > 0:
+            uuid = result[0]['uuid']['value']
+            self.registry.add(uuid, url)
+            return uuid
+
+    def url_from_id(self, uuid):
+        """Method returns the Fedora URL of a uuid from the local registry, 
+        falling back to Fuseki and registering the result
+
+        Args:
+            uuid -- Fedora uuid
+        Returns:
+            string
+        Raises:
+            falcon.HTTPNotFound
+        """
+        url = self.registry.url(uuid)
+        if url is not None:
+            return url
+        result = self.triplestore.__get_subject__(uuid=uuid)
+        if len(result) < 1:
+            raise falcon.HTTPNotFound(
+                title="Resource not found",
+                description="No Resource with uuid {}".format(uuid))
+        url = result[0]['subject']['value']
+        self.registry.add(uuid, url)
+        return url
+
     def __generate_body__(self, graph, prefix=None):
         """Internal method generates the body for indexing into Elastic search
         based on the JSON-LD serializations of the Fedora Commons Resource graph.
@@ -291,6 +512,183 @@ class Search(object):
                             self.__set_or_expand__(key, val) 
 
 
+    def __bulk_index__(self, rows, prefix=None):
+        """Internal method indexes many Resources into Elastic search with 
+        a single bulk request.
+
+        Args:
+            rows -- list of subject, graph, doc_type, index tuples
+            prefix -- Prefix filter, will only index if object starts with a 
+                      prefix, default is None to index everything.
+        Returns:
+            list -- errors reported by Elastic search
+        """
+        locations = []
+        def actions():
+            for subject, graph, doc_type, index in rows:
+                self.__generate_body__(graph, prefix)
+                doc_id = str(graph.value(
+                             subject=subject,
+                             predicate=FEDORA.uuid))
+                if hasattr(self, '__generate_suggestion__'):
+                    self.__generate_suggestion__(subject, graph, doc_id)
+                locations.append((doc_id, index, doc_type))
+                yield {"_index": index,
+                       "_type": doc_type,
+                       "_id": doc_id,
+                       "_source": self.body}
+        success, errors = bulk(
+            self.search_index,
+            actions(),
+            raise_on_error=False)
+        failed = set([next(iter(error.values())).get('_id') 
+                      for error in errors])
+        self.registry.add_locations(
+            [row for row in locations if row[0] not in failed])
+        return errors
+
+    def __bulk_delete__(self, doc_ids):
+        """Internal method deletes many documents from Elastic search, 
+        the documents' indices and types are found with one ids query and
+        the documents deleted with one bulk request.
+
+        Args:
+            doc_ids -- list of Elastic search document IDs
+        Returns:
+            list -- errors reported by Elastic search
+        """
+        if len(doc_ids) < 1:
+            return []
+        result = self.search_index.search(
+            body={"query": {"ids": {"values": doc_ids}}},
+            size=len(doc_ids),
+            _source=False)
+        actions = [{"_op_type": "delete",
+                    "_index": hit["_index"],
+                    "_type": hit["_type"],
+                    "_id": hit["_id"]} for hit in result["hits"]["hits"]]
+        if len(actions) < 1:
+            return []
+        success, errors = bulk(
+            self.search_index,
+            actions,
+            raise_on_error=False)
+        return errors
+
+    def __delete_subtree__(self, fedora_urls):
+        """Internal method removes Resources deleted from Fedora, and every
+        Resource they contained, from Fuseki, Elastic search and the 
+        registry. The subtrees are collected with one Fuseki query, their
+        triples are removed with one SPARQL update and their documents with 
+        one bulk request. Documents are deleted by uuid and by Fedora URL, 
+        the id of BIBFRAME entities loaded by the MARC ingesters.
+
+        Args:
+            fedora_urls -- list of Fedora URLs
+        Returns:
+            dict -- deleted subjects and uuids, Elastic search errors
+        """
+        bindings = self.triplestore.__get_subtree__(fedora_urls)
+        subjects = sorted(set([row['subject']['value'] for row in bindings]))
+        uuids = sorted(set([row['uuid']['value'] for row in bindings 
+                            if 'uuid' in row]))
+        self.triplestore.__delete_subjects__(subjects)
+        errors = self.__bulk_delete__(uuids + subjects)
+        self.registry.remove_many(uuids)
+        return {"subjects": subjects, "uuids": uuids, "errors": errors}
+
+    def __locate__(self, doc_id):
+        """Internal method finds the index and document type of a document 
+        from the registry, falling back to searching every index in Elastic
+        search and registering the result, doc id should be unique across 
+        all indices.
+
+        Args:
+            doc_id -- Elastic search document ID
+        Returns:
+            tuple -- index, doc_type
+        Raises:
+            falcon.HTTPNotFound
+        """
+        location = self.registry.location(doc_id)
+        if location is not None:
+            return location
+        for row in self.search_index.indices.stats()['indices'].keys():
+            if self.search_index.exists(index=row, id=doc_id): 
+                result = self.search_index.get(index=row, id=doc_id)
+                self.registry.add_locations([(doc_id, row, result['_type'])])
+                return row, result['_type']
+        raise falcon.HTTPNotFound()
+
+    def __partial_update__(self, doc_id, subject, graph, predicates):
+        """Internal method updates only the fields of an indexed document
+        for a set of changed predicates with a single partial update, 
+        predicates without any values in the graph are emptied.
+
+        Args:
+            doc_id -- Elastic search document ID
+            subject -- rdflib.URIRef of the Resource
+            graph -- rdflib.Graph of the Resource after it changed
+            predicates -- Changed predicates
+        """
+        partial_graph = default_graph()
+        for predicate in predicates:
+            for object_ in graph.objects(subject=subject, predicate=predicate):
+                partial_graph.add((subject, predicate, object_))
+        # __generate_body__ only indexes graphs with fedora:created 
+        created = graph.value(subject=subject, predicate=FEDORA.created)
+        if created is not None:
+            partial_graph.add((subject, FEDORA.created, created))
+        self.__generate_body__(partial_graph)
+        doc = {}
+        for predicate in predicates:
+            name = field_name(predicate)
+            doc[name] = self.body.get(name, [])
+        index, doc_type = self.__locate__(doc_id)
+        self.search_index.update(
+            index=index,
+            doc_type=doc_type,
+            id=doc_id,
+            body={"doc": doc})
+
+    def __update_fields__(self, doc_id, changes):
+        """Internal method replaces the values of one or more fields of a 
+        Resource with one Elastic search partial update and one SPARQL update, 
+        the document's index and subject are only looked up once.
+
+        Args:
+            doc_id -- Elastic search document ID
+            changes -- List of dicts with a predicate and an object, object
+                       can be a list to set multiple values
+        """
+        fields, doc = [], {}
+        for change in changes:
+            predicate = to_term(change.get('predicate'))
+            if not isinstance(predicate, rdflib.URIRef):
+                raise falcon.HTTPInvalidParam(
+                    "{} is not a URL or prefixed name".format(predicate),
+                    "predicate")
+            objects = change.get('object')
+            if objects is None:
+                raise falcon.HTTPMissingParam("object")
+            if not isinstance(objects, list):
+                objects = [objects,]
+            fields.append((predicate, [to_term(row) for row in objects]))
+            doc[field_name(predicate)] = [self.__get_id_or_value__(row) 
+                                          for row in objects]
+        index, doc_type = self.__locate__(doc_id)
+        subject = rdflib.URIRef(self.url_from_id(doc_id))
+        graph = None
+        if self.triplestore.named_graphs:
+            graph = subject
+        self.triplestore.__update__(fields_sparql(subject, fields, graph))
+        self.expansions.invalidate(str(subject))
+        self.search_index.update(
+            index=index,
+            doc_type=doc_type,
+            id=doc_id,
+            body={"doc": doc})
+
     def __index__(self, subject, graph, doc_type, index, prefix=None): 
         self.__generate_body__(graph, prefix)
         doc_id = str(graph.value(
@@ -302,6 +700,7 @@ class Search(object):
             doc_type=doc_type,
             id=doc_id,
             body=self.body)
+        self.registry.add_locations([(doc_id, index, doc_type)])
 
     def __set_or_expand__(self, key, value):
         """Helper method takes a key and value and either creates a key
@@ -337,15 +736,7 @@ class Search(object):
         value = kwargs.get('value')
         if not value:
             raise falcon.HTTPMissingParam("field")
-        for row in self.search_index.indices.stats()['indices'].keys():
-            # Doc id should be unique across all indices 
-            if self.search_index.exists(index=row, id=doc_id): 
-                result = self.search_index.get(index=row, id=doc_id)
-                doc_type = result['_type']
-                index=row
-                break
-        if doc_type is None or index is None:
-            raise falcon.HTTPNotFound()                 
+        index, doc_type = self.__locate__(doc_id)
         self.search_index.update(
             index=index,
             doc_type=doc_type,
@@ -353,12 +744,10 @@ class Search(object):
             body={"doc": {
                 field: self.__get_id_or_value__(value)
             }})
-        result = self.triplestore.__get_subject__(uuid=doc_id)
-        if len(result) == 1:
-            self.triplestore.__update_triple__(
-                result[0]['subject']['value'], 
-                field, 
-                value)         
+        self.triplestore.__update_triple__(
+            self.url_from_id(doc_id), 
+            field, 
+            value)         
             
 
     def on_get(self, req, resp):
@@ -383,36 +772,52 @@ class Search(object):
         resp.status = falcon.HTTP_200
 
     def on_patch(self, req, resp):
-        """Method takes either sparql statement or predicate and object 
-        and updates the Resource.
+        """Method takes a uuid and either a predicate and object, as query
+        parameters or a form-encoded body, or a JSON body with a list of
+        changes, and replaces the values of those fields of the Resource in
+        a single update.
+
+        >> {"uuid": "...", 
+            "changes": [{"predicate": "bf:title", "object": "..."},
+                        {"predicate": "bf:subject", "object": ["...", "..."]}]}
 
         Args:
             req -- Request
             resp -- Response
         """
-        doc_uuid = req.get_param('uuid')
+        params = dict(req.params)
+        changes = []
+        content_type = (req.content_type or '').split(";")[0].strip()
+        if req.content_length:
+            body = req.bounded_stream.read().decode()
+            if content_type == 'application/x-www-form-urlencoded':
+                params.update(falcon.uri.parse_query_string(body))
+            else:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    raise falcon.HTTPBadRequest(
+                        "Invalid JSON",
+                        "PATCH body must be a JSON object or list of changes")
+                if isinstance(body, dict):
+                    params['uuid'] = body.get('uuid', params.get('uuid'))
+                    changes = body.get('changes', [])
+                else:
+                    changes = body
+        doc_uuid = params.get('uuid')
         if not doc_uuid:
             raise falcon.HTTPMissingParam('uuid')
-        predicate = req.get_param('predicate') or None
-        if not predicate:
-            raise falcon.HTTPMissingParam('predicate')
-        object_ = req.get_param('object') or None
-        if not object_:
-            raise falcon.HTTPMissingParam('object')
-        doc_type = req.get_param('doc_type') or None
-        if self.__update__(
-            doc_id=doc_uuid,
-            doc_type=doc_type,
-            field=predicate,
-            value=object_):
-            resp.status = falcon.HTTP_202
-            resp.body = json.dumps(True)
-        else:
-            raise falcon.HTTPInternalServerError(
-                "Error with PATCH for {}".format(doc_uuid),
-                "Failed setting {} to {}".format(
-                    predicate,
-                    object_))
+        if len(changes) < 1:
+            predicate = params.get('predicate') or None
+            if not predicate:
+                raise falcon.HTTPMissingParam('predicate')
+            object_ = params.get('object') or None
+            if not object_:
+                raise falcon.HTTPMissingParam('object')
+            changes.append({"predicate": predicate, "object": object_})
+        self.__update_fields__(doc_uuid, changes)
+        resp.status = falcon.HTTP_202
+        resp.body = json.dumps(True)
 
 
 class Repository(object):
@@ -1,16 +1,71 @@
 __author__ = "Jeremy Nelson"
+import datetime
+import email.parser
+import email.policy
 import falcon
+import hashlib
+import io
 import json
 import requests
 import rdflib
 import urllib.request
 import urllib.parse
-from .. import Repository, Search, default_graph, generate_prefix  
-from .. import create_sparql_insert_row, ingest_resource, ingest_turtle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .. import CONTEXT, Repository, Search, default_graph, generate_prefix  
+from .. import create_sparql_insert_row, diff_sparql, graph_diff, ingest_turtle
+from .. import is_server_managed, to_term
+from ..utilities.cache import DEFAULT_CACHE_SIZE, LRUCache
+from ..utilities.fetch import RDF_FORMATS, GraphCache, fetch_graph
+from ..utilities.fetch import pooled_session
 from ..utilities.namespaces import *
 
 PREFIX = generate_prefix()
 
+# Request mimetypes whose parameters are read by falcon, any other request
+# body POSTed to a Resource is streamed to Fedora as a binary
+FORM_MIMETYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Default number of concurrent Fedora requests for a batch
+BATCH_WORKERS = 4
+
+# Maximum hops and subjects per CONSTRUCT query of an expansion
+MAX_EXPANSION_DEPTH = 5
+EXPANSION_BATCH_SIZE = 100
+
+# Default and maximum number of children in a page of a Container
+CONTAINER_PAGE_SIZE = 100
+MAX_CONTAINER_PAGE_SIZE = 1000
+
+# Mimetypes of a Container listing, the first is the default
+CONTAINER_MIMETYPES = ['application/json', 'application/x-ndjson']
+
+# Mimetypes of a multi-get of Resources, the first is the default
+MULTI_GET_MIMETYPES = ['application/ld+json', 'application/n-quads']
+
+# Mimetypes a Resource's graph is serialized to mapped to the rdflib
+# format, the first is the default
+SERIALIZATIONS = [('application/ld+json', 'json-ld'),
+                  ('application/json', 'json-ld'),
+                  ('text/turtle', 'turtle'),
+                  ('application/n-triples', 'nt'),
+                  ('application/rdf+xml', 'xml')]
+
+# Request headers forwarded to Fedora and response headers passed back to
+# the client when streaming a binary
+BINARY_REQUEST_HEADERS = ['Range', 'If-Range', 'If-None-Match', 
+                          'If-Modified-Since']
+BINARY_RESPONSE_HEADERS = ['Accept-Ranges', 'Content-Disposition',
+                           'Content-Range', 'Content-Type', 'ETag',
+                           'Last-Modified']
+BINARY_STATUS = {
+    200: falcon.HTTP_200,
+    206: falcon.HTTP_206,
+    304: falcon.HTTP_304,
+    412: falcon.HTTP_412,
+    416: falcon.HTTP_416}
+
 NEW_SPARQL = """{}
 INSERT DATA {{{{
   <{{url}}> {{name}} {{value}} 
@@ -24,8 +79,110 @@ DELETE {{{{
 }}}} WHERE {{{{
 }}}}""".format(PREFIX)
 
+class DigestStream(object):
+    """Wraps a binary stream as an iterator of chunks for a chunked transfer
+    to Fedora, updating the stream's SHA-1 and MD5 digests as each chunk is
+    read so that a binary is never held in memory.
+
+    >> stream = DigestStream(open('master.tif', 'rb'))
+    >> requests.post(fedora_url, data=stream)
+    >> stream.sha1.hexdigest()
+    """
+
+    def __init__(self, stream, chunk_size=STREAM_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.sha1 = hashlib.sha1()
+        self.md5 = hashlib.md5()
+        self.length = 0
+
+    def __iter__(self):
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+            self.sha1.update(chunk)
+            self.md5.update(chunk)
+            self.length += len(chunk)
+            yield chunk
+
+def preferred_mimetype(req, mimetypes):
+    """Function returns the mimetype the client prefers, or None if it 
+    accepts none of them, the first mimetype is the default for */* and 
+    requests without an Accept header
+
+    Args:
+        req -- Request
+        mimetypes -- list of mimetypes
+    """
+    # falcon picks the last of equally acceptable mimetypes
+    return req.client_prefers(list(reversed(mimetypes)))
+
+def representation_etag(etag, rdf_format):
+    """Function returns the ETag of one serialization of a Resource from
+    the ETag Fedora returned for the Resource
+
+    Args:
+        etag -- Fedora ETag i.e. W/"0fe1..."
+        rdf_format -- rdflib format
+    """
+    weak = etag.startswith('W/')
+    value = etag[2:] if weak else etag
+    tag = '"{}-{}"'.format(value.strip('"'), rdf_format)
+    return 'W/' + tag if weak else tag
+
+def etag_matches(if_none_match, etag):
+    """Function returns True if an If-None-Match header matches an ETag 
+    using the weak comparison required for conditional GETs
+
+    Args:
+        if_none_match -- If-None-Match header value or None
+        etag -- ETag
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == '*' or tag.replace('W/', '', 1) == etag.replace('W/', '', 1):
+            return True
+    return False
+
 def serialize(req, resp, resource):
-    resp.body = json.dumps(req.context['rdf'])
+    """Hook negotiates the serialization of the Resource's graph, answers
+    conditional GETs with 304 and caches serialized graphs by ETag and 
+    format.
+    """
+    # Binaries are streamed, only serialize RDF
+    if 'rdf' not in req.context:
+        return
+    mimetypes = [row[0] for row in SERIALIZATIONS]
+    mimetype = preferred_mimetype(req, mimetypes)
+    if mimetype is None:
+        raise falcon.HTTPNotAcceptable(
+            "Resource is available as {}".format(", ".join(mimetypes)))
+    rdf_format = dict(SERIALIZATIONS)[mimetype]
+    resp.vary = ('Accept',)
+    etag = req.context.get('etag')
+    if etag is not None:
+        etag = representation_etag(etag, rdf_format)
+        resp.etag = etag
+        if etag_matches(req.get_header('If-None-Match'), etag):
+            resp.status = falcon.HTTP_304
+            return
+    resp.content_type = mimetype
+    body = None
+    if etag is not None:
+        body = resource.serializations.get(etag)
+    if body is None:
+        if rdf_format == 'json-ld':
+            body = req.context['rdf'].serialize(
+                format=rdf_format,
+                context=CONTEXT)
+        else:
+            body = req.context['rdf'].serialize(format=rdf_format)
+        if etag is not None:
+            resource.serializations.set(etag, body)
+    resp.data = body
 
 def replace_property(resource_url, name, old_value, new_value):
     """Internal method replaces a resource's existing property with a
@@ -54,6 +211,172 @@ def replace_property(resource_url, name, old_value, new_value):
         return True
     return False  
 
+def rest_url(fedora_config):
+    """Function returns the Fedora REST API base URL from the FEDORA
+    section of the configuration
+
+    Args:
+        fedora_config -- FEDORA section of the configuration
+    """
+    url = "http://{}:{}".format(
+        fedora_config['host'],
+        fedora_config['port'])
+    if 'url_prefix' in fedora_config:
+        url += "/{}".format(fedora_config['url_prefix'])
+    return url + "/rest"
+
+
+class FedoraTransaction(object):
+    """Fedora 4 Transaction, see
+    https://wiki.duraspace.org/display/FEDORA40/Transactions
+
+    Resources created in the transaction are loaded into Fuseki and indexed
+    into Elastic search only after Fedora commits the transaction.
+
+    >> transaction = fedora.FedoraTransaction(config, searcher)
+    >> transaction.begin()
+    >> fedora.Resource(config, searcher).__create__(rdf=graph,
+                                                   transaction=transaction)
+    >> transaction.commit()
+    """
+
+    def __init__(self, config, searcher=None, url=None):
+        """Initializes a FedoraTransaction
+
+        Args:
+            config -- Configuration object
+            searcher -- Search instance, defaults to None
+            url -- URL of an existing Fedora transaction, defaults to None
+        """
+        self.rest_url = rest_url(config['FEDORA'])
+        self.searcher = searcher
+        self.url = url
+        self.pending = []
+        self.refreshed = datetime.datetime.utcnow()
+
+    def __committed_url__(self, url):
+        """Internal method takes a URL inside the transaction and returns 
+        the URL of the resource once the transaction is committed
+
+        Args:
+            url -- Fedora URL in the transaction
+        """
+        return str(url).replace(self.url, self.rest_url, 1)
+
+    def __transaction_url__(self, url):
+        """Internal method takes a committed Fedora URL and returns the 
+        Resource's URL inside the transaction
+
+        Args:
+            url -- Fedora URL
+        """
+        return str(url).replace(self.rest_url, self.url, 1)
+
+    def __committed_graph__(self, graph):
+        """Internal method returns a copy of a graph with all URLs inside 
+        the transaction replaced by their committed URLs
+
+        Args:
+            graph -- rdflib.Graph
+        """
+        def committed(term):
+            if type(term) == rdflib.URIRef and str(term).startswith(self.url):
+                return rdflib.URIRef(self.__committed_url__(term))
+            return term
+        committed_graph = default_graph()
+        for subject, predicate, object_ in graph:
+            committed_graph.add(
+                (committed(subject), predicate, committed(object_)))
+        return committed_graph
+
+    def __post__(self, url, action):
+        result = requests.post(url)
+        if result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to {} Fedora transaction".format(action),
+                "Transaction {}, error:\n{}".format(url, result.text))
+        self.refreshed = datetime.datetime.utcnow()
+        return result
+
+    @property
+    def token(self):
+        if self.url:
+            return self.url.split("/")[-1]
+
+    def begin(self):
+        """Method starts a new Fedora transaction
+
+        Returns:
+            string -- transaction URL
+        """
+        result = self.__post__(
+            "/".join([self.rest_url, "fcr:tx"]),
+            "begin")
+        self.url = result.headers.get('Location')
+        self.pending = []
+        return self.url
+
+    def keep_alive(self, interval=None):
+        """Method refreshes the transaction so Fedora doesn't expire it
+
+        Args:
+            interval -- Only refresh if more than interval seconds have 
+                        passed since last refresh, default is None 
+        """
+        if interval is not None:
+            elapsed = datetime.datetime.utcnow() - self.refreshed
+            if elapsed.total_seconds() < interval:
+                return
+        self.__post__("/".join([self.url, "fcr:tx"]), "keep-alive")
+
+    def __committed_rows__(self):
+        """Internal method returns the subject, graph, doc_type and index of
+        each of the transaction's resources with their committed URLs
+
+        Returns:
+            list
+        """
+        return [(rdflib.URIRef(self.__committed_url__(subject)),
+                 self.__committed_graph__(graph),
+                 doc_type,
+                 index) for subject, graph, doc_type, index in self.pending]
+
+    def commit(self, load=True):
+        """Method commits the transaction in Fedora, then loads and indexes
+        all of the transaction's resources with their committed URLs
+
+        Args:
+            load -- Load into Fuseki and index into Elastic search, set to
+                    False when the caller has loaded the resources, 
+                    defaults to True
+        Returns:
+            list -- committed Fedora URLs
+        """
+        self.__post__("/".join([self.url, "fcr:tx", "fcr:commit"]), "commit")
+        if not load:
+            committed_urls = [self.__committed_url__(row[0]) 
+                              for row in self.pending]
+            self.pending = []
+            return committed_urls
+        committed_urls = []
+        for subject, graph, doc_type, index in self.__committed_rows__():
+            if self.searcher is not None:
+                self.searcher.registry.add(
+                    graph.value(subject=subject, predicate=FEDORA.uuid),
+                    subject)
+                if index:
+                    self.searcher.__index__(subject, graph, doc_type, index)
+                self.searcher.triplestore.__load__(graph, subject)
+            committed_urls.append(str(subject))
+        self.pending = []
+        return committed_urls
+
+    def rollback(self):
+        """Method rolls back the transaction, discarding all of its 
+        resources"""
+        self.__post__("/".join([self.url, "fcr:tx", "fcr:rollback"]), 
+                      "rollback")
+        self.pending = []
 
 
 class Resource(Repository):
@@ -66,20 +389,22 @@ class Resource(Repository):
 
     def __init__(self, config, searcher=None, url=None):
         super(Resource, self).__init__(config)
-        self.rest_url = "http://{}:{}".format(
-            self.fedora['host'],
-            self.fedora['port'])
-        if 'url_prefix' in self.fedora:
-            self.rest_url += "/{}".format(self.fedora['url_prefix'])
-        self.rest_url += "/rest"
+        self.rest_url = rest_url(self.fedora)
+        self.workers = int(self.fedora.get('batch_workers', BATCH_WORKERS))
+        self.graphs = GraphCache(
+            int(self.fedora.get('cache_size', DEFAULT_CACHE_SIZE)),
+            pooled_session(self.workers),
+            default_graph)
+        # Serialized graphs keyed by representation ETag
+        self.serializations = LRUCache(
+            int(self.fedora.get('cache_size', DEFAULT_CACHE_SIZE)))
         if searcher is None:
             self.searcher = Search(config)
         else:
             self.searcher = searcher
         if url:
             self.subject = rdflib.URIRef(url)
-            self.graph = default_graph()
-            self.graph.parse(url)
+            self.graph = fetch_graph(url, default_graph())
             self.uuid = str(self.graph.value(
                 subject=self.subject, 
                 predicate=FEDORA.uuid))
@@ -92,14 +417,22 @@ class Resource(Repository):
         the Resource into Elastic Search
 
 	keyword args:
-            binary -- Binary object for the Fedora Object, metadata will
-                be stored as metadata to Binary.
+            binary -- Binary object or file-like stream for the Fedora
+                Object, metadata will be stored as metadata to Binary.
+            digest -- Digest header value for binary i.e. sha1=<hex>, 
+                defaults to None
             doc_type -- Elastic search document type, defaults to None
 	    id -- Existing identifier defaults to None
             index -- Elastic search index, defaults to None
+            load -- Load into Fuseki and index into Elastic search, set to
+                False when the caller loads many Resources at once, 
+                defaults to True
             mimetype -- Mimetype for binary stream, defaults to application/octet-stream
             rdf -- RDF graph of new object, defaults to None
             rdf_type -- RDF Type, defaults to text/turtle
+            transaction -- FedoraTransaction to create Resource in, loading
+                into Fuseki and indexing waits until the transaction is
+                committed, defaults to None
         """
         if self.uuid:
             description = """Cannot call Resource.__create__, 
@@ -108,24 +441,31 @@ Fedora object {} already exists""".format(self.uuid)
                 "Fedora object already exists",
                 description)
         binary = kwargs.get('binary', None)
+        digest = kwargs.get('digest', None)
         doc_type = kwargs.get('doc_type', None)
         ident = kwargs.get('id', None)
         index = kwargs.get('index', None)
+        load = kwargs.get('load', True)
         mimetype = kwargs.get('mimetype', 'application/octet-stream')
         rdf = kwargs.get('rdf', None)
         rdf_type = kwargs.get('rdf_type', 'text/turtle') 
+        transaction = kwargs.get('transaction', None)
         resource_url = None
+        base_url = self.rest_url
+        if transaction is not None:
+            base_url = transaction.url
         if ident:
-            fedora_post_url = "/".join([self.rest_url, ident])
+            fedora_post_url = "/".join([base_url, ident])
         else:
-            fedora_post_url = self.rest_url
+            fedora_post_url = base_url
         # First check and add binary datastream
         if binary:
             resource_url = self.__new_binary__(
                 fedora_post_url, 
                 binary, 
                 mimetype,
-                rdf)
+                rdf,
+                digest)
         # Next handle any attached RDF
         if rdf and not binary:
             resource_url = self.__new_by_rdf__(
@@ -138,14 +478,20 @@ Fedora object {} already exists""".format(self.uuid)
                  fedora_post_url)
              resource_url = stub_result.text
         self.subject = rdflib.URIRef(resource_url)
-        self.graph = default_graph()
-        self.graph = self.graph.parse(resource_url)
+        self.graph = fetch_graph(resource_url, default_graph())
         self.uuid = str(self.graph.value(
                         subject=self.subject,
                         predicate=FEDORA.uuid))
+        if transaction is not None:
+            transaction.pending.append(
+                (self.subject, self.graph, doc_type, index))
+            return resource_url
+        self.searcher.registry.add(self.uuid, resource_url)
+        if not load:
+            return resource_url
         if index:
             self.searcher.__index__(self.subject, self.graph, doc_type, index)
-        self.searcher.triplestore.__load__(self.graph)
+        self.searcher.triplestore.__load__(self.graph, self.subject)
         return resource_url
 
 
@@ -168,36 +514,70 @@ Fedora object {} already exists""".format(self.uuid)
         return rdf_result.text
 
 
-    def __new_binary__(self, post_url, binary, mimetype, rdf=None):
+    def __new_binary__(self, post_url, binary, mimetype, rdf=None, digest=None):
         """Internal method takes a Fedora POST url and a binary file to 
         create a Fedora Object and returns the fcr:metadata URL for 
-        adding the binary's associated metadata.
+        adding the binary's associated metadata. The binary is streamed to
+        Fedora with chunked transfer-encoding while its SHA-1 and MD5 are 
+        computed, the SHA-1 is then checked against the digest Fedora 
+        stored for the binary.
 
         Args:
             post_url -- Fedora POST url
-            binary -- binary datastream
+            binary -- binary datastream, either bytes or a file-like object
             mimetype -- datastream's mimetype
             rdf -- Attached RDF metadata for binary, default is None
+            digest -- Digest header value passed to Fedora for fixity, 
+                      i.e. sha1=<hex>, default is None
         Returns:
             new url for binary datastream's metadata
+        Raises:
+            falcon.HTTPConflict -- If the binary fails the fixity check
         """
-        # Using urllib.request for binary upload
-        binary_request = urllib.request.Request(
+        if type(binary) == str:
+            binary = binary.encode()
+        if not hasattr(binary, 'read'):
+            binary = io.BytesIO(binary)
+        binary_stream = DigestStream(binary)
+        headers = {"Content-Type": mimetype}
+        if digest:
+            headers["Digest"] = digest
+        binary_result = requests.post(
             post_url,
-            data=binary,
-            headers={"Content-Type": mimetype})
-        binary_result = urllib.request.urlopen(binary_request)
-        if binary_result.status > 399:
+            data=binary_stream,
+            headers=headers)
+        if binary_result.status_code == 409:
+            # Fedora rejects a binary that doesn't match its Digest header
+            raise falcon.HTTPConflict(
+                "Fixity check failed for {}".format(post_url),
+                "Streamed {} bytes with sha1={}, Fedora returned:\n{}".format(
+                    binary_stream.length,
+                    binary_stream.sha1.hexdigest(),
+                    binary_result.text))
+        if binary_result.status_code > 399:
             raise falcon.HTTPInternalServerError(
                 "Error adding binary to {}".format(post_url),
                 "Error adding binary file {},error:\n{}".format(
                     post_url,
-                    binary_result.read()))
-        metadata_url = "/".join([binary_result.read().decode(), "fcr:metadata"])
+                    binary_result.text))
+        binary_url = binary_result.text.strip()
+        metadata_url = "/".join([binary_url, "fcr:metadata"])
+        metadata_uri = rdflib.URIRef(metadata_url)
+        metadata_rdf = fetch_graph(metadata_url, default_graph())
+        fedora_digest = metadata_rdf.value(
+            subject=rdflib.URIRef(binary_url),
+            predicate=PREMIS.hasMessageDigest)
+        sha1 = "urn:sha1:{}".format(binary_stream.sha1.hexdigest())
+        if fedora_digest is not None and str(fedora_digest) != sha1:
+            requests.delete(binary_url)
+            raise falcon.HTTPConflict(
+                "Fixity check failed for {}".format(binary_url),
+                "Streamed {} bytes with {} md5={}, Fedora stored {}".format(
+                    binary_stream.length,
+                    sha1,
+                    binary_stream.md5.hexdigest(),
+                    fedora_digest))
         if rdf:
-            metadata_uri = rdflib.URIRef(metadata_url)
-            metadata_rdf = default_graph()
-            metadata_rdf.parse(metadata_url)
             for p, o in rdf.predicate_objects():
                 metadata_rdf.add((metadata_uri, p, o))
             rdf_put_result = requests.put(
@@ -268,119 +648,777 @@ current value of {} with new value of {}""".format(
 
 
 
-    def on_delete(self, req, resp, id):
+    def __delete__(self, fedora_urls):
+        """Internal method deletes Resources and every Resource they contain
+        from Fedora, Fuseki and Elastic search. Fedora deletes each subtree 
+        with a single DELETE and a batch of Resources is deleted in one 
+        transaction, then Search.__delete_subtree__ removes the subtrees 
+        from Fuseki and Elastic search.
+
+        Args:
+            fedora_urls -- list of Fedora URLs
+        Returns:
+            dict -- deleted subjects and uuids, Elastic search errors
+        """
+        if len(fedora_urls) == 1:
+            fedora_result = requests.delete(fedora_urls[0])
+            if fedora_result.status_code > 399:
+                raise falcon.HTTPInternalServerError(
+                    "Failed to delete {}".format(fedora_urls[0]),
+                    fedora_result.text)
+        else:
+            transaction = FedoraTransaction(self.config, self.searcher)
+            transaction.begin()
+            try:
+                for fedora_url in fedora_urls:
+                    fedora_result = requests.delete(
+                        transaction.__transaction_url__(fedora_url))
+                    if fedora_result.status_code > 399:
+                        raise falcon.HTTPInternalServerError(
+                            "Failed to delete {}".format(fedora_url),
+                            fedora_result.text)
+            except:
+                transaction.rollback()
+                raise
+            transaction.commit()
+        result = self.searcher.__delete_subtree__(fedora_urls)
+        for subject in result["subjects"]:
+            self.__invalidate__(subject)
+        return result
+
+    def on_delete(self, req, resp, id=None):
         """DELETE Method either deletes one or more predicate and objects from a
         Resource, or if both predicate and object are None, deletes the Resource
-        itself. Should cascade through to Triplestore and Elasticsearch.
+        and every Resource it contains. Cascades through to Triplestore and 
+        Elasticsearch. Without an id, the ids parameter is a comma separated
+        list of Resources to delete.
 
         Args:
             req -- Request
             resp -- Response
 	        id -- A unique ID for the Resource, should be UUID
         """
-        fedora_url = self.search.get(id)
+        if id is None:
+            ids = [row for param in req.get_param_as_list('ids') or []
+                   for row in param.split(",") if len(row) > 0]
+            if not ids:
+                raise falcon.HTTPMissingParam('ids')
+        else:
+            ids = [id,]
+        fedora_urls = [self.searcher.url_from_id(row) for row in ids]
         predicate = req.get_param('predicate') or None
         object_ = req.get_param('object') or None
         # If both predicate and object are none, delete the Resource from the
         # repository
         if predicate is None and object_ is None:
-            delete_request = urllib.request.Request(
-                fedora_url,
-                method='DELETE')
-            result = urllib.request.urlopen(delete_request)
-            return True
+            result = self.__delete__(fedora_urls)
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({
+                "message": "Deleted {} Resources".format(
+                    len(result['subjects'])),
+                "uuids": result['uuids'],
+                "errors": result['errors']})
+
+    def __stream_binary__(self, req, resp, fedora_url):
+        """Internal method proxies a Fedora binary as a stream without 
+        loading it into memory, forwarding any Range and conditional 
+        headers to Fedora and passing Content-Length, Content-Range and 
+        ETag back to the client. Falcon hands the stream to the WSGI 
+        server's wsgi.file_wrapper when one is available.
+
+        Args:
+            req -- Request
+            resp -- Response
+            fedora_url -- Fedora URL of binary or its fcr:metadata
+        """
+        binary_url = fedora_url.split("/fcr:metadata")[0]
+        # Content is passed through as is, don't let requests decompress it
+        headers = {"Accept-Encoding": "identity"}
+        for name in BINARY_REQUEST_HEADERS:
+            value = req.get_header(name)
+            if value:
+                headers[name] = value
+        fedora_result = requests.get(binary_url, headers=headers, stream=True)
+        if fedora_result.status_code == 404:
+            fedora_result.close()
+            raise falcon.HTTPNotFound()
+        if fedora_result.status_code not in BINARY_STATUS:
+            fedora_result.close()
+            raise falcon.HTTPInternalServerError(
+                "Error streaming binary {}".format(binary_url),
+                "Fedora returned {} for {}".format(
+                    fedora_result.status_code,
+                    binary_url))
+        resp.status = BINARY_STATUS[fedora_result.status_code]
+        for name in BINARY_RESPONSE_HEADERS:
+            if name in fedora_result.headers:
+                resp.set_header(name, fedora_result.headers[name])
+        if fedora_result.status_code in [304, 412, 416]:
+            fedora_result.close()
+            return
+        content_length = fedora_result.headers.get('Content-Length')
+        if content_length:
+            resp.set_stream(fedora_result.raw, int(content_length))
+        else:
+            resp.stream = fedora_result.raw
+
+    def __invalidate__(self, fedora_url):
+        """Internal method removes a changed Resource from the graph cache 
+        and every cached expansion that contains it
+
+        Args:
+            fedora_url -- Fedora URL of the Resource
+        """
+        self.graphs.invalidate(fedora_url)
+        self.searcher.expansions.invalidate(str(fedora_url))
+
+    def __serialize_item__(self, id, fedora_url, graph, mimetype):
+        """Internal method serializes one Resource of a multi-get, a JSON-LD
+        named graph compacted with CONTEXT or N-Quads in the Resource's 
+        named graph
+
+        Args:
+            id -- Unique ID for the Resource
+            fedora_url -- Fedora URL of the Resource
+            graph -- rdflib.Graph of the Resource
+            mimetype -- application/ld+json or application/n-quads
+        Returns:
+            bytes
+        """
+        if mimetype == 'application/n-quads':
+            dataset = rdflib.ConjunctiveGraph()
+            named_graph = dataset.get_context(rdflib.URIRef(fedora_url))
+            for triple in graph:
+                named_graph.add(triple)
+            return dataset.serialize(format='nquads')
+        compacted = json.loads(graph.serialize(
+            format='json-ld',
+            context=CONTEXT).decode())
+        compacted.pop('@context', None)
+        return json.dumps({"@id": fedora_url,
+                           "fedora:uuid": id,
+                           "@graph": compacted.get('@graph', [compacted])
+                           }).encode()
+
+    def __stream_many__(self, ids, mimetype):
+        """Internal method fetches the graphs of many Resources concurrently
+        through the graph cache and yields each serialized Resource as soon
+        as it is retrieved
+
+        Args:
+            ids -- List of unique IDs for the Resources
+            mimetype -- application/ld+json or application/n-quads
+        """
+        def fetch(id):
+            fedora_url = self.searcher.url_from_id(id)
+            return id, fedora_url, self.graphs.get(fedora_url)[1]
+
+        def error(id, message):
+            if mimetype == 'application/n-quads':
+                return "# {} {}\n".format(id, message).encode()
+            return json.dumps({"fedora:uuid": id, "error": message}).encode()
+
+        if mimetype == 'application/ld+json':
+            yield '{{"@context": {}, "@graph": ['.format(
+                json.dumps(CONTEXT)).encode()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(fetch, id): id for id in ids}
+            for i, future in enumerate(as_completed(futures)):
+                if i > 0 and mimetype == 'application/ld+json':
+                    yield b','
+                try:
+                    id, fedora_url, graph = future.result()
+                    yield self.__serialize_item__(
+                        id, 
+                        fedora_url, 
+                        graph, 
+                        mimetype)
+                except falcon.HTTPError as http_error:
+                    yield error(futures[future], http_error.title)
+                except Exception as exception:
+                    yield error(futures[future], str(exception))
+        if mimetype == 'application/ld+json':
+            yield b']}'
 
     @falcon.after(serialize)
-    def on_get(self, req, resp, id):
-        """GET Method response, returns JSON, XML, N3, or Turtle representations
+    def on_get(self, req, resp, id=None):
+        """GET Method response, returns JSON-LD, Turtle, N-Triples or RDF/XML
+        representations by the request's Accept header, supporting 
+        If-None-Match with ETags for each representation. If the binary 
+        parameter is true, streams the Resource's binary with support for
+        Range requests. Without an id, the ids parameter
+        is a comma separated list of Resources that are fetched concurrently
+        and streamed as JSON-LD or N-Quads.
 
 	    Args:
             req -- Request
             resp -- Response
 	        id -- A unique ID for the Resource, should be UUID
         """
-        fedora_url = self.search.url_from_id(id)
-        req.context['rdf'] = rdflib.Graph().parse(fedora_url)
+        if id is None:
+            ids = [row for param in req.get_param_as_list('ids') or []
+                   for row in param.split(",") if len(row) > 0]
+            if not ids:
+                raise falcon.HTTPMissingParam('ids')
+            mimetype = preferred_mimetype(req, MULTI_GET_MIMETYPES)
+            if mimetype is None:
+                raise falcon.HTTPNotAcceptable(
+                    "Resources are available as {}".format(
+                        ", ".join(MULTI_GET_MIMETYPES)))
+            resp.status = falcon.HTTP_200
+            resp.content_type = mimetype
+            resp.stream = self.__stream_many__(ids, mimetype)
+            return
+        fedora_url = self.searcher.url_from_id(id)
+        if req.get_param_as_bool('binary'):
+            self.__stream_binary__(req, resp, fedora_url)
+            return
+        req.context['etag'], req.context['rdf'] = self.graphs.get(fedora_url)
+        resp.status = falcon.HTTP_200
+
+    def __desired_graph__(self, req, fedora_url):
+        """Internal method parses the request body as the desired RDF graph
+        for a Resource, <> in the body is the Resource
+
+        Args:
+            req -- Request
+            fedora_url -- Fedora URL of the Resource
+        """
+        rdf_format = RDF_FORMATS.get((req.content_type or '').split(";")[0])
+        if rdf_format is None:
+            raise falcon.HTTPUnsupportedMediaType(
+                "Body must be RDF or application/sparql-update")
+        desired = default_graph()
+        desired.parse(
+            data=req.bounded_stream.read(),
+            format=rdf_format,
+            publicID=fedora_url)
+        return desired
 
-    def on_patch(self, req, resp, id, sparql):
-        fedora_url = self.search.url_from_id(id)
+    def __update_by_diff__(self, id, fedora_url, desired, predicates=None):
+        """Internal method diffs a desired graph against the Resource's 
+        current graph and applies only the difference with one SPARQL 
+        update to Fedora, the same update to Fuseki, and one partial update
+        of the changed fields in Elastic search.
 
-        fedora_url_request = urllib.request.Request(
+        Args:
+            id -- Unique ID for the Resource
+            fedora_url -- Fedora URL of the Resource
+            desired -- rdflib.Graph of the Resource's desired state
+            predicates -- Only update these predicates, default is None
+                          to replace the Resource's entire graph
+        Returns:
+            tuple -- rdflib.Graphs of removed and added triples
+        """
+        current = fetch_graph(fedora_url, default_graph())
+        removed, added = graph_diff(current, desired, predicates)
+        if len(removed) + len(added) < 1:
+            return removed, added
+        sparql = diff_sparql(removed, added)
+        fedora_result = requests.patch(
             fedora_url,
             data=sparql.encode(),
-            method='PATCH',
-            headers={'Content-Type': 'application/sparql-update'}
-        )
-
-        if self.opener:
-            result = self.opener(fedora_url_request)
+            headers={'Content-Type': 'application/sparql-update'})
+        if fedora_result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to update {}".format(fedora_url),
+                "Error:\n{}\nSPARQL:\n{}".format(
+                    fedora_result.text,
+                    sparql))
+        self.__invalidate__(fedora_url)
+        changed = set(removed.predicates()).union(set(added.predicates()))
+        updated = current - removed + added
+        if self.searcher.triplestore.named_graphs:
+            self.searcher.triplestore.__load__(updated, fedora_url)
         else:
-            result = urllib.request.urlopen(fedora_url_request)
+            self.searcher.triplestore.__update__(sparql)
+        self.searcher.__partial_update__(
+            id,
+            rdflib.URIRef(fedora_url),
+            updated,
+            changed)
+        return removed, added
+
+    def on_patch(self, req, resp, id):
+        """PATCH method either forwards a SPARQL update to Fedora or takes
+        an RDF graph and updates only the predicates in the graph to the 
+        graph's values.
+
+        Args:
+            req -- Request
+            resp -- Response
+            id -- Unique ID for the Resource
+        """
+        fedora_url = self.searcher.url_from_id(id)
+        if (req.content_type or '').startswith('application/sparql-update'):
+            fedora_result = requests.patch(
+                fedora_url,
+                data=req.bounded_stream.read(),
+                headers={'Content-Type': 'application/sparql-update'})
+            if fedora_result.status_code > 399:
+                raise falcon.HTTPInternalServerError(
+                    "Failed to update {}".format(fedora_url),
+                    fedora_result.text)
+            self.__invalidate__(fedora_url)
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({"message": "{} updated".format(id)})
+            return
+        desired = self.__desired_graph__(req, fedora_url)
+        removed, added = self.__update_by_diff__(
+            id,
+            fedora_url,
+            desired,
+            set(desired.predicates()))
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps({"message": "{} updated".format(id)})
+        resp.body = json.dumps({"message": "{} updated".format(id),
+                                "removed": len(removed),
+                                "added": len(added)})
 
-    @falcon.after(ingest_resource)
     def on_post(self, req, resp):
         """POST Method response, accepts optional binary file and RDF as
-        request parameters in the POST
+        request parameters in the POST. Any other request body is streamed
+        to Fedora as a binary with the request's Content-Type, passing
+        through the request's Digest header for fixity.
 
         Args:
             req -- Request
             resp -- Response
         """
-        binary = req.get_param('binary') or None
-        rdf = req.get_param('rdf') or None
-        resource_id = req.get_param('id', None)
-        if not resource_uri:
-            fedora_add_request = urllib.request.Request(
-                post_url,
-                method="POST")
-            resource_uri = self.__open_request__(fedora_add_request)
+        resource = Resource(self.config, self.searcher)
+        resource_id = req.get_param('id') or None
+        content_type = req.content_type or ''
+        if content_type and not content_type.startswith(FORM_MIMETYPES):
+            resource_url = resource.__create__(
+                binary=req.bounded_stream,
+                digest=req.get_header('Digest'),
+                id=resource_id,
+                mimetype=content_type)
+        else:
+            resource_url = resource.__create__(
+                binary=req.get_param('binary') or None,
+                id=resource_id,
+                rdf=req.get_param('rdf') or None)
         resp.status = falcon.HTTP_201
         resp.body = json.dumps({
             "message": "Created Fedora Resource id={}".format(
-                resource_uri.split("/")[-1]),
-            "uri": resource_uri
+                resource.uuid),
+            "uri": resource_url
             })
 
 
 
     def on_put(self, req, resp, id):
-        """PUT method takes an id, a list of predicate and object tuples and
-        updates Repository
+        """PUT method takes an id and the desired RDF graph of the Resource,
+        diffs it against the current graph and updates Repository with only
+        the changed triples
 
         Args:
             req -- Request
             resp -- Response
             id -- Unique ID for the Resource
         """
-        fedora_url = self.search.url_from_id(id)
+        fedora_url = self.searcher.url_from_id(id)
+        desired = self.__desired_graph__(req, fedora_url)
+        removed, added = self.__update_by_diff__(id, fedora_url, desired)
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "{} updated".format(id),
+                                "removed": len(removed),
+                                "added": len(added)})
 
-        fedora_url_request = urllib.request.Request(
-            fedora_url,
-            data=sparql.encode(),
-            method='PUT',
-            headers={'Content-Type': 'application/sparql-update'}
-        )
-        if self.opener:
-            result = self.opener(fedora_url_request)
+class ResourceBatch(Resource):
+    """Creates many Fedora Resources from one request, the payload is 
+    either N-Quads with a named graph for each Resource or a multipart 
+    body with an RDF document in each part. Resources are created 
+    concurrently in one Fedora transaction, loaded into Fuseki with one 
+    update before the transaction is committed and then indexed into 
+    Elastic search with one bulk request. If Fuseki fails, the transaction
+    is rolled back and no Resource is created.
+    """
+
+    def __init__(self, config, searcher=None):
+        super(ResourceBatch, self).__init__(config, searcher)
+
+    def __items__(self, req):
+        """Internal method parses the request body into a list of item name
+        and rdflib.Graph pairs
+
+        Args:
+            req -- Request
+        """
+        content_type = req.content_type or ''
+        raw = req.bounded_stream.read()
+        items = []
+        if content_type.startswith('multipart/'):
+            message = email.parser.BytesParser(
+                policy=email.policy.HTTP).parsebytes(
+                    "Content-Type: {}\r\n\r\n".format(
+                        content_type).encode() + raw)
+            for i, part in enumerate(message.iter_parts()):
+                rdf_format = RDF_FORMATS.get(part.get_content_type())
+                if rdf_format is None:
+                    raise falcon.HTTPUnsupportedMediaType(
+                        "Part {} is {}, must be RDF".format(
+                            i,
+                            part.get_content_type()))
+                name = part.get_param(
+                    'name',
+                    header='content-disposition') or str(i)
+                graph = default_graph()
+                graph.parse(data=part.get_payload(decode=True), 
+                            format=rdf_format)
+                items.append((name, graph))
+        elif content_type.startswith('application/n-quads'):
+            dataset = rdflib.ConjunctiveGraph()
+            dataset.parse(data=raw, format='nquads')
+            for context in dataset.contexts():
+                graph = default_graph()
+                for triple in context:
+                    graph.add(triple)
+                items.append((str(context.identifier), graph))
         else:
-            result = urllib.request.urlopen(fedora_url_request)
-        return True
+            raise falcon.HTTPUnsupportedMediaType(
+                "Batch must be multipart or application/n-quads")
+        return items
 
-class Container(Resource):
-    
-    def __init__(self, config):
-        super(Container, config).__init__(config)
+    def __create_item__(self, item, doc_type, index, transaction):
+        """Internal method creates a single item's Resource in the Fedora 
+        transaction
 
-    def on_get(self, req, resp):
-        pass
+        Args:
+            item -- name, rdflib.Graph tuple
+            doc_type -- Elastic search document type
+            index -- Elastic search index
+            transaction -- FedoraTransaction of the batch
+        Returns:
+            dict -- Result for the item
+        """
+        name, graph = item
+        resource = Resource(self.config, self.searcher)
+        try:
+            resource_url = resource.__create__(
+                rdf=graph,
+                doc_type=doc_type,
+                index=index,
+                transaction=transaction)
+        except Exception as error:
+            return {"item": name, "status": 500, "error": str(error)}
+        return {"item": name,
+                "status": 201,
+                "uri": transaction.__committed_url__(resource_url),
+                "uuid": resource.uuid}
 
     def on_post(self, req, resp):
-        pass
+        """POST Method creates all Resources in the request body, returns 
+        201 if every Resource is created or 207 with per-item results
+
+        Args:
+            req -- Request
+            resp -- Response
+        """
+        doc_type = req.get_param('doc_type') or None
+        index = req.get_param('index') or None
+        items = self.__items__(req)
+        transaction = FedoraTransaction(self.config, self.searcher)
+        transaction.begin()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(
+                    lambda item: self.__create_item__(
+                        item, 
+                        doc_type, 
+                        index, 
+                        transaction),
+                    items))
+            rows = transaction.__committed_rows__()
+        except:
+            transaction.rollback()
+            raise
+        try:
+            if len(rows) > 0:
+                self.searcher.triplestore.__load_many__(
+                    [row[1] for row in rows])
+        except falcon.HTTPError as error:
+            transaction.rollback()
+            for result in results:
+                if result['status'] == 201:
+                    result.pop('uri')
+                    result.pop('uuid')
+                    result['status'] = 500
+                    result['error'] = "Rolled back, {}".format(error.title)
+            rows = []
+        else:
+            try:
+                transaction.commit(load=False)
+            except falcon.HTTPError:
+                self.searcher.triplestore.__delete_subjects__(
+                    [str(row[0]) for row in rows])
+                raise
+        for subject, graph, row_doc_type, row_index in rows:
+            self.searcher.registry.add(
+                graph.value(subject=subject, predicate=FEDORA.uuid),
+                subject)
+        if len(rows) > 0 and index:
+            for error in self.searcher.__bulk_index__(rows):
+                for result in results:
+                    if result.get('uuid') == error.get(
+                        'index', {}).get('_id'):
+                        result['index_error'] = error
+        if len(rows) == len(results):
+            resp.status = falcon.HTTP_201
+        else:
+            resp.status = falcon.HTTP_207
+        resp.body = json.dumps({"results": results})
+
+
+class ResourceExpansion(Resource):
+    """Expands a Resource into the graph of its neighbourhood in Fuseki, 
+    following links out from the root Resource up to a number of hops. 
+    Each hop is one batch of CONSTRUCT queries, expanded graphs are cached
+    until any Resource in them changes.
+
+    >> GET /Resource/{id}/expand?depth=2&predicates=bf:workTitle,bf:creator
+    """
+
+    def __init__(self, config, searcher=None):
+        super(ResourceExpansion, self).__init__(config, searcher)
+        self.max_depth = int(self.fedora.get(
+            'max_expansion_depth', 
+            MAX_EXPANSION_DEPTH))
+
+    def __expand__(self, root_url, depth, predicates=None):
+        """Internal method returns the graph of every Resource within a 
+        number of hops from the root Resource and the URLs of those 
+        Resources
+
+        Args:
+            root_url -- Fedora URL of the root Resource
+            depth -- Number of hops to follow
+            predicates -- Only follow links with these predicates, defaults
+                          to None to follow every link that isn't managed
+                          by Fedora
+        Returns:
+            tuple -- rdflib.Graph, set of member URLs
+        """
+        graph = default_graph()
+        members, frontier = set(), [rdflib.URIRef(root_url)]
+        for hop in range(depth + 1):
+            members.update(frontier)
+            for start in range(0, len(frontier), EXPANSION_BATCH_SIZE):
+                graph += self.searcher.triplestore.__neighbourhood__(
+                    frontier[start:start+EXPANSION_BATCH_SIZE])
+            if hop == depth:
+                break
+            next_frontier = set()
+            for subject in frontier:
+                for predicate, object_ in graph.predicate_objects(subject):
+                    if not isinstance(object_, rdflib.URIRef) or \
+                       object_ in members:
+                        continue
+                    if predicates is None:
+                        if predicate == RDF.type or \
+                           is_server_managed(predicate, object_):
+                            continue
+                    elif not predicate in predicates:
+                        continue
+                    next_frontier.add(object_)
+            frontier = sorted(next_frontier)
+            if len(frontier) < 1:
+                break
+        return graph, set([str(member) for member in members])
+
+    def on_get(self, req, resp, id):
+        """GET Method returns the expanded graph of a Resource as JSON-LD
+        or N-Quads
+
+        Args:
+            req -- Request
+            resp -- Response
+            id -- Unique ID for the root Resource
+        """
+        # Depth 0 expands only the root Resource
+        depth = req.get_param_as_int(
+            'depth',
+            min_value=0,
+            max_value=self.max_depth,
+            default=1)
+        predicates = None
+        names = [row for param in req.get_param_as_list('predicates') or []
+                 for row in param.split(",") if len(row) > 0]
+        if len(names) > 0:
+            predicates = frozenset([to_term(name) for name in names])
+        mimetype = preferred_mimetype(req, MULTI_GET_MIMETYPES)
+        if mimetype is None:
+            raise falcon.HTTPNotAcceptable(
+                "Expansions are available as {}".format(
+                    ", ".join(MULTI_GET_MIMETYPES)))
+        root_url = self.searcher.url_from_id(id)
+        key = (root_url, depth, predicates)
+        graph = self.searcher.expansions.get(key)
+        if graph is None:
+            graph, members = self.__expand__(root_url, depth, predicates)
+            self.searcher.expansions.set(key, graph, members)
+        resp.status = falcon.HTTP_200
+        resp.content_type = mimetype
+        resp.body = self.__serialize_item__(
+            id, 
+            root_url, 
+            graph, 
+            mimetype).decode()
+
+
+class Container(Resource):
+    """Lists the children of a Fedora LDP container a page at a time from
+    Fuseki, paging with a cursor of the last child's URL. Pages are
+    returned as JSON with a next cursor, or as NDJSON with one child per 
+    line, where all=true streams every child of the container page by page.
+
+    >> GET /Container/{id}?limit=100&after=http://localhost:8080/rest/...
+    """
+
+    def __init__(self, config, searcher=None):
+        super(Container, self).__init__(config, searcher)
+
+    def __children__(self, container_url, after, limit, every=False):
+        """Internal method yields children of a container as dicts with 
+        their URL and uuid, a page at a time
+
+        Args:
+            container_url -- Fedora URL of the container
+            after -- Cursor, URL of the last child already listed
+            limit -- Number of children per page
+            every -- Continue until the last page, defaults to False
+        """
+        while True:
+            bindings = self.searcher.triplestore.__get_children__(
+                container_url,
+                after,
+                limit)
+            for row in bindings:
+                child = {"@id": row['child']['value']}
+                if 'uuid' in row:
+                    child['fedora:uuid'] = row['uuid']['value']
+                yield child
+            if not every or len(bindings) < limit:
+                break
+            after = bindings[-1]['child']['value']
+
+    def on_get(self, req, resp, id=None):
+        """GET Method lists a page of a container's children, the root of
+        the repository without an id
+
+        Args:
+            req -- Request
+            resp -- Response
+            id -- Unique ID for the container, defaults to None
+        """
+        if id is None:
+            # Fedora's root is the REST URL with a trailing slash
+            container_url = self.rest_url.rstrip("/") + "/"
+        else:
+            container_url = self.searcher.url_from_id(id)
+        limit = req.get_param_as_int('limit') or CONTAINER_PAGE_SIZE
+        if limit < 1 or limit > MAX_CONTAINER_PAGE_SIZE:
+            raise falcon.HTTPInvalidParam(
+                "limit must be between 1 and {}".format(
+                    MAX_CONTAINER_PAGE_SIZE),
+                'limit')
+        after = req.get_param('after') or ""
+        mimetype = preferred_mimetype(req, CONTAINER_MIMETYPES)
+        if mimetype is None:
+            raise falcon.HTTPNotAcceptable(
+                "Containers are available as {}".format(
+                    ", ".join(CONTAINER_MIMETYPES)))
+        resp.status = falcon.HTTP_200
+        resp.content_type = mimetype
+        if mimetype == 'application/x-ndjson':
+            every = req.get_param_as_bool('all') or False
+            resp.stream = ("{}\n".format(json.dumps(child)).encode() 
+                           for child in self.__children__(
+                               container_url, 
+                               after, 
+                               limit, 
+                               every))
+            return
+        children = list(self.__children__(container_url, after, limit))
+        next_cursor = None
+        if len(children) == limit:
+            next_cursor = children[-1]["@id"]
+            resp.add_link(
+                "{}?{}".format(
+                    req.path, 
+                    urllib.parse.urlencode({"limit": limit,
+                                            "after": next_cursor})),
+                "next")
+        resp.body = json.dumps({"@id": container_url,
+                                "ldp:contains": children,
+                                "next": next_cursor})
 
 
 class Transaction(Repository):
+    """REST API for Fedora Transactions, POST begins a new transaction,
+    GET keeps the transaction alive, PUT commits and DELETE rolls back
+    the transaction."""
+
+    def __init__(self, config, searcher=None):
+        super(Transaction, self).__init__(config)
+        # Committed Resources are registered and indexed by the Search 
+        # instance the Resources share
+        if searcher is not None:
+            self.search = searcher
+
+    def __transaction__(self, token):
+        if token is None:
+            raise falcon.HTTPMissingParam('token')
+        return FedoraTransaction(
+            self.config,
+            self.search,
+            "/".join([rest_url(self.fedora), token]))
+
+    def on_delete(self, req, resp, token=None):
+        """DELETE Method rolls back a Fedora transaction
+
+        Args:
+            req -- Request
+            resp -- Response
+            token -- Fedora transaction token i.e. tx:1234
+        """
+        self.__transaction__(token).rollback()
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Rolled back {}".format(token)})
 
     def on_get(self, req, resp, token=None):
-        pass
+        """GET Method keeps a Fedora transaction alive
+
+        Args:
+            req -- Request
+            resp -- Response
+            token -- Fedora transaction token i.e. tx:1234
+        """
+        self.__transaction__(token).keep_alive()
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Refreshed {}".format(token)})
+
+    def on_post(self, req, resp, token=None):
+        """POST Method begins a new Fedora transaction
+
+        Args:
+            req -- Request
+            resp -- Response
+        """
+        transaction = FedoraTransaction(self.config, self.search)
+        transaction.begin()
+        resp.status = falcon.HTTP_201
+        resp.body = json.dumps({"token": transaction.token,
+                                "url": transaction.url})
+
+    def on_put(self, req, resp, token=None):
+        """PUT Method commits a Fedora transaction
+
+        Args:
+            req -- Request
+            resp -- Response
+            token -- Fedora transaction token i.e. tx:1234
+        """
+        self.__transaction__(token).commit()
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Committed {}".format(token)})
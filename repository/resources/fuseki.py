@@ -8,9 +8,10 @@ import requests
 from ..utilities.namespaces import *
 
 PREFIX = """PREFIX fedora: <{}>
+PREFIX ldp: <{}>
 PREFIX owl: <{}>
 PREFIX rdf: <{}>
-PREFIX xsd: <{}>""".format(FEDORA, OWL, RDF, XSD)
+PREFIX xsd: <{}>""".format(FEDORA, LDP, OWL, RDF, XSD)
 
 
 DEDUP_SPARQL = """{}
@@ -44,6 +45,104 @@ INSERT {{{{
 WHERE {{{{
 }}}}""".format(PREFIX)
 
+# Replaces the object in whichever named graph holds the triple
+REPLACE_GRAPH_OBJECT_SPARQL = """{}
+DELETE {{{{
+    GRAPH ?graph {{{{ <{{0}}> {{1}} {{2}} . }}}}
+}}}}
+INSERT {{{{
+    GRAPH ?graph {{{{ <{{0}}> {{1}} {{3}} . }}}}
+}}}}
+WHERE {{{{
+    GRAPH ?graph {{{{ <{{0}}> {{1}} {{2}} . }}}}
+}}}}""".format(PREFIX)
+
+GRAPH_NAMES_SPARQL = """SELECT DISTINCT ?graph
+WHERE {{
+  GRAPH ?graph {{ }}
+}} ORDER BY ?graph
+LIMIT {}
+OFFSET {}"""
+
+
+UUIDS_SPARQL = """{}
+SELECT ?subject ?uuid
+WHERE {{{{
+  ?subject fedora:uuid ?uuid .
+}}}} ORDER BY ?subject
+LIMIT {{}}
+OFFSET {{}}""".format(PREFIX)
+
+# BIBFRAME and MADS access points and labels for the local authority index
+ACCESS_POINTS_SPARQL = """{}
+SELECT ?subject ?type ?value
+WHERE {{{{
+  {{{{ ?subject <http://bibframe.org/vocab/authorizedAccessPoint> ?value }}}}
+  UNION
+  {{{{ ?subject <http://www.w3.org/2000/01/rdf-schema#label> ?value }}}}
+  ?subject rdf:type ?type .
+  VALUES ?type {{{{
+    <http://bibframe.org/vocab/Person>
+    <http://bibframe.org/vocab/Topic>
+    <http://bibframe.org/vocab/Title>
+    <http://www.loc.gov/mads/rdf/v1#PersonalName>
+    <http://www.loc.gov/mads/rdf/v1#Topic>
+    <http://www.loc.gov/mads/rdf/v1#ComplexSubject>
+    <http://www.loc.gov/mads/rdf/v1#Geographic> }}}}
+}}}} ORDER BY ?subject
+LIMIT {{}}
+OFFSET {{}}""".format(PREFIX)
+
+
+NEIGHBOURHOOD_SPARQL = """CONSTRUCT {{
+  ?subject ?predicate ?object .
+}}
+WHERE {{
+  VALUES ?subject {{ {} }}
+  ?subject ?predicate ?object .
+}}"""
+
+
+# Resources contained by the roots and their hash resources i.e. <url#hash>,
+# each side of the UNION binds the roots itself as SPARQL evaluates groups
+# bottom up. Descendants are found by the fedora:hasParent in their own
+# graphs, see CHILDREN_SPARQL
+SUBTREE_SPARQL = """{}
+SELECT DISTINCT ?subject ?uuid
+WHERE {{{{
+  {{{{
+    VALUES ?root {{{{ {{0}} }}}}
+    ?subject fedora:hasParent* ?root .
+  }}}} UNION {{{{
+    VALUES ?root {{{{ {{0}} }}}}
+    ?member fedora:hasParent* ?root .
+    ?member ?predicate ?subject .
+    FILTER(isIRI(?subject) && 
+           STRSTARTS(STR(?subject), CONCAT(STR(?member), "#")))
+  }}}}
+  OPTIONAL {{{{ ?subject fedora:uuid ?uuid }}}}
+}}}}""".format(PREFIX)
+
+# Page of a container's children after a cursor, ordered by URL. Children
+# are found by the fedora:hasParent in their own graphs, the container's
+# ldp:contains triples are only as current as the container's graph
+CHILDREN_SPARQL = """{}
+SELECT ?child ?uuid
+WHERE {{{{
+  ?child fedora:hasParent <{{0}}> .
+  OPTIONAL {{{{ ?child fedora:uuid ?uuid }}}}
+  FILTER(STR(?child) > "{{1}}")
+}}}} ORDER BY ?child
+LIMIT {{2}}""".format(PREFIX)
+
+DELETE_SUBJECTS_SPARQL = """DELETE {{
+  ?subject ?predicate ?object .
+}}
+WHERE {{
+  VALUES ?subject {{ {} }}
+  ?subject ?predicate ?object .
+}}"""
+
 
 SAME_AS_SPARQL = """{}
 SELECT DISTINCT ?subject
@@ -57,8 +156,22 @@ INSERT DATA {{{{
    {{}}
 }}}}""".format(PREFIX)
 
+UPDATE_GRAPH_SPARQL = """{}
+INSERT DATA {{{{ GRAPH <{{}}> {{{{
+   {{}}
+}}}} }}}}""".format(PREFIX)
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
 PREFIX_CHECK_RE = re.compile(r'\w+[:][a-zA-Z]')
 
+# Subject, predicate and object of an N-Triples or N-Quads line followed by
+# the optional graph name, literals may contain spaces and IRIs
+NQUAD_RE = re.compile(
+    rb'^(\S+\s+\S+\s+'
+    rb'(?:<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[\w-]+|\^\^<[^>]*>)?))'
+    rb'\s*(<[^>]*>|_:\S+)?\s*\.$')
+
 
 URL_CHECK_RE = re.compile(
     r'^(?:http|ftp)s?://' # http:// or https://
@@ -76,7 +189,11 @@ class TripleStore(object):
 
     >> import fuseki
     >> triplestore = fuseki.TripleStore(config)
-    
+
+    With named_graphs set in the FUSEKI section, each Fedora Resource is 
+    stored in its own named graph, keyed by its URL, so it is replaced by 
+    dropping and loading one graph. The Fuseki dataset must then be 
+    configured with tdb:unionDefaultGraph so queries see every graph.
     """
 
     def __init__(self, config={}):
@@ -85,10 +202,14 @@ class TripleStore(object):
         Args:
             config -- dictionary or loaded configparser
         """
+        self.named_graphs = False
         if not "FUSEKI" in config:
             url = "http://localhost:3030"
             datastore = 'ds'
         else: 
+            self.named_graphs = str(config["FUSEKI"].get(
+                "named_graphs", 
+                False)).lower() in ["true", "yes", "on", "1"]
             url = "http://{}:{}".format(
                 config["FUSEKI"]["host"],
                 config["FUSEKI"]["port"])
@@ -97,6 +218,21 @@ class TripleStore(object):
             datastore = config["FUSEKI"]["datastore"]
         self.update_url = "/".join([url, datastore, "update"])
         self.query_url = "/".join([url, datastore, "query"])
+        self.data_url = "/".join([url, datastore, "data"])
+
+    def __graph_name__(self, rdf):
+        """Internal method returns the named graph of a Resource's graph,
+        the URL of the subject with a Fedora uuid
+
+        Args:
+            rdf -- rdflib.Graph
+        Returns:
+            string or None
+        """
+        subjects = sorted([str(subject) for subject in 
+                           rdf.subjects(predicate=FEDORA.uuid)], key=len)
+        if len(subjects) > 0:
+            return subjects[0]
 
 
     def __get_id__(self, fedora_url):
@@ -177,6 +313,119 @@ WHERE {{{{
                 description)
         
 
+    def __get_children__(self, container_url, after="", limit=100):
+        """Internal method returns a page of a container's children ordered
+        by URL, paging with the last child's URL as the cursor. Fuseki still
+        filters and sorts the container's children for each page, so a page
+        costs more the larger the container is.
+
+        Args:
+            container_url -- Fedora URL of the container
+            after -- Return children with URLs after this cursor, defaults
+                     to the first page
+            limit -- Maximum number of children, defaults to 100
+        Returns:
+            List of dicts with child and, if it has one, uuid
+        """
+        result = requests.post(
+            self.query_url,
+            data={"query": CHILDREN_SPARQL.format(
+                      container_url, 
+                      str(after).replace('\\', '\\\\').replace('"', '\\"'),
+                      int(limit)),
+                  "output": "json"})
+        if result.status_code < 400:
+            return result.json().get('results').get('bindings')
+        raise falcon.HTTPInternalServerError(
+            "Failed to retrieve children",
+            "Container={} After={}\nError: {}".format(
+                container_url,
+                after,
+                result.text))
+
+    def __get_subtree__(self, urls):
+        """Internal method returns the subjects and uuids of Resources and 
+        every Resource they contain, including hash resources
+
+        Args:
+            urls -- list of Fedora URLs
+        Returns:
+            List of dicts with subject and, if it has one, uuid
+        """
+        result = requests.post(
+            self.query_url,
+            data={"query": SUBTREE_SPARQL.format(
+                      " ".join(["<{}>".format(url) for url in urls])),
+                  "output": "json"})
+        if result.status_code < 400:
+            return result.json().get('results').get('bindings')
+        raise falcon.HTTPInternalServerError(
+            "Failed to retrieve subtree",
+            "URLs={}\nError: {}".format(urls, result.text))
+
+    def __delete_subjects__(self, subjects):
+        """Internal method deletes every triple of a list of subjects with
+        one SPARQL update, with named graphs the subjects' graphs are 
+        dropped
+
+        Args:
+            subjects -- list of subject URLs
+        """
+        if len(subjects) < 1:
+            return
+        if self.named_graphs:
+            self.__update__(" ;\n".join(
+                ["DROP SILENT GRAPH <{}>".format(subject) 
+                 for subject in subjects]))
+            return
+        self.__update__(DELETE_SUBJECTS_SPARQL.format(
+            " ".join(["<{}>".format(subject) for subject in subjects])))
+
+    def __get_uuids__(self, offset=0, limit=10000):
+        """Internal method returns a page of subjects and their Fedora uuids
+
+        Args:
+            offset -- Offset of the first subject, defaults to 0
+            limit -- Maximum number of subjects, defaults to 10000
+        Returns:
+            List of dicts with subject and uuid
+        """
+        result = requests.post(
+            self.query_url,
+            data={"query": UUIDS_SPARQL.format(limit, offset),
+                  "output": "json"})
+        if result.status_code < 400:
+            return result.json().get('results').get('bindings')
+        raise falcon.HTTPInternalServerError(
+            "Failed to retrieve uuids",
+            "Offset={} Limit={}\nError: {}".format(
+                offset,
+                limit,
+                result.text))
+
+    def __get_access_points__(self, offset=0, limit=10000):
+        """Internal method returns a page of BIBFRAME and MADS subjects with
+        their types, authorized access points and labels
+
+        Args:
+            offset -- Offset of the first binding, defaults to 0
+            limit -- Maximum number of bindings, defaults to 10000
+        Returns:
+            List of dicts with subject, type and value
+        """
+        result = requests.post(
+            self.query_url,
+            data={"query": ACCESS_POINTS_SPARQL.format(limit, offset),
+                  "output": "json"})
+        if result.status_code < 400:
+            return result.json().get('results').get('bindings')
+        raise falcon.HTTPInternalServerError(
+            "Failed to retrieve access points",
+            "Offset={} Limit={}\nError: {}".format(
+                offset,
+                limit,
+                result.text))
+
     def __match__(self, **kwargs):
         """Internal method attempts to match an existing subject
         in the triple-store based on the subject's type and a 
@@ -211,17 +460,51 @@ WHERE {{{{
                     type_,
                     result.text))
 
+    def __neighbourhood__(self, subjects):
+        """Internal method returns every triple of a list of subjects with
+        one CONSTRUCT query
+
+        Args:
+            subjects -- list of subject URLs
+        Returns:
+            rdflib.Graph
+        Raises:
+            falcon.HTTPInternalServerError
+        """
+        sparql = NEIGHBOURHOOD_SPARQL.format(
+            " ".join(["<{}>".format(subject) for subject in subjects]))
+        result = requests.post(
+            self.query_url,
+            data={"query": sparql},
+            headers={"Accept": "application/n-triples"})
+        if result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to construct neighbourhood",
+                "Subjects={}\nError: {}".format(
+                    len(subjects),
+                    result.text))
+        graph = rdflib.Graph()
+        graph.parse(data=result.content, format='nt')
+        return graph
+
 #    def __replace_all__(self, **kwargs):
 #        """Internal Method replaces all occurrences in t
 
-    def __load__(self, rdf):
-        """Internal Method loads a RDF graph into Fuseki
+    def __load__(self, rdf, name=None):
+        """Internal Method loads a RDF graph into Fuseki, with named graphs
+        the Resource's named graph is replaced by the graph.
 
         Args:
             rdf -- rdflib.Graph
+            name -- Named graph, defaults to the Resource's URL
         Raises:
             falcon.HTTPInternalServerError
         """
+        if self.named_graphs:
+            name = name or self.__graph_name__(rdf)
+            if name is not None:
+                self.__replace_graph__(name, rdf)
+                return
         fuseki_result = requests.post(self.update_url,
             data={"update": UPDATE_TRIPLESTORE_SPARQL.format(
                              rdf.serialize(format='nt').decode())})
@@ -232,6 +515,177 @@ WHERE {{{{
                     fuseki_result.text,
                     rdf))
 
+    def __load_many__(self, graphs):
+        """Internal Method loads many RDF graphs into Fuseki with a single 
+        SPARQL update, streaming the graphs' N-Triples in the request body
+        as each graph is serialized.
+
+        Args:
+            graphs -- list of rdflib.Graph
+        Raises:
+            falcon.HTTPInternalServerError
+        """
+        def update():
+            if not self.named_graphs:
+                yield "{}\nINSERT DATA {{\n".format(PREFIX).encode()
+                for graph in graphs:
+                    yield graph.serialize(format='nt')
+                yield b"}"
+                return
+            names = [self.__graph_name__(graph) for graph in graphs]
+            yield "{}\n".format(PREFIX).encode()
+            for name in names:
+                if name is not None:
+                    yield "DROP SILENT GRAPH <{}> ;\n".format(name).encode()
+            yield b"INSERT DATA {\n"
+            for name, graph in zip(names, graphs):
+                if name is not None:
+                    yield "GRAPH <{}> {{\n".format(name).encode()
+                yield graph.serialize(format='nt')
+                if name is not None:
+                    yield b"}\n"
+            yield b"}"
+        fuseki_result = requests.post(
+            self.update_url,
+            data=update(),
+            headers={"Content-Type": "application/sparql-update"})
+        if fuseki_result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to load RDF into {}".format(self.update_url),
+                "Error loading {} graphs:\n{}".format(
+                    len(graphs),
+                    fuseki_result.text))
+
+    def __load_nquads__(self, nquads):
+        """Internal method bulk loads N-Quads, i.e. a file written by an
+        offline transform, with the SPARQL Graph Store Protocol in one
+        streamed request. Without named graphs the graph names are dropped
+        and the triples loaded into the default graph.
+
+        Args:
+            nquads -- iterable of N-Quads lines as bytes
+        Raises:
+            falcon.HTTPInternalServerError
+        """
+        def triples():
+            for line in nquads:
+                line = line.strip()
+                if len(line) < 1 or line.startswith(b"#"):
+                    continue
+                # Only a quad's fourth term is dropped, lines without a
+                # graph name are already triples
+                quad = NQUAD_RE.match(line)
+                if quad is None:
+                    yield line + b"\n"
+                    continue
+                yield quad.group(1) + b" .\n"
+        if self.named_graphs:
+            fuseki_result = requests.post(
+                self.data_url,
+                data=nquads,
+                headers={"Content-Type": "application/n-quads"})
+        else:
+            fuseki_result = requests.post(
+                self.data_url,
+                params={"default": ""},
+                data=triples(),
+                headers={"Content-Type": "application/n-triples"})
+        if fuseki_result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to load N-Quads into {}".format(self.data_url),
+                "Error:\n{}".format(fuseki_result.text))
+
+    def __replace_graph__(self, name, rdf):
+        """Internal method replaces a named graph with the SPARQL Graph 
+        Store Protocol, dropping the graph's triples and loading the new
+        graph in one request
+
+        Args:
+            name -- Named graph URL
+            rdf -- rdflib.Graph
+        Raises:
+            falcon.HTTPInternalServerError
+        """
+        fuseki_result = requests.put(
+            self.data_url,
+            params={"graph": str(name)},
+            data=rdf.serialize(format='nt'),
+            headers={"Content-Type": "application/n-triples"})
+        if fuseki_result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to replace graph {}".format(name),
+                "Error:\n{}".format(fuseki_result.text))
+
+    def __graph_names__(self, page_size=10000):
+        """Internal method yields the name of every named graph, a page at 
+        a time
+
+        Args:
+            page_size -- Number of graph names per SPARQL query
+        """
+        offset = 0
+        while True:
+            result = requests.post(
+                self.query_url,
+                data={"query": GRAPH_NAMES_SPARQL.format(page_size, offset),
+                      "output": "json"})
+            if result.status_code > 399:
+                raise falcon.HTTPInternalServerError(
+                    "Failed to retrieve named graphs",
+                    result.text)
+            bindings = result.json().get('results').get('bindings')
+            for row in bindings:
+                yield row['graph']['value']
+            if len(bindings) < page_size:
+                break
+            offset += page_size
+
+    def __export__(self):
+        """Internal method yields the dataset as N-Quads, graph by graph 
+        with named graphs so no more than one Resource is held in memory, 
+        otherwise Fuseki's N-Quads dump of the dataset is streamed.
+        """
+        if not self.named_graphs:
+            result = requests.get(
+                self.data_url,
+                headers={"Accept": "application/n-quads"},
+                stream=True)
+            result.raise_for_status()
+            for chunk in result.iter_content(EXPORT_CHUNK_SIZE):
+                yield chunk
+            return
+        for name in self.__graph_names__():
+            result = requests.get(
+                self.data_url,
+                params={"graph": name},
+                headers={"Accept": "application/n-triples"},
+                stream=True)
+            result.raise_for_status()
+            context = " <{}> .\n".format(name).encode()
+            for line in result.iter_lines():
+                line = line.strip()
+                if len(line) < 1 or line.startswith(b"#"):
+                    continue
+                yield line[:-1].rstrip() + context
+
+    def __update__(self, sparql):
+        """Internal Method runs a SPARQL update against Fuseki
+
+        Args:
+            sparql -- SPARQL update
+        Raises:
+            falcon.HTTPInternalServerError
+        """
+        fuseki_result = requests.post(
+            self.update_url,
+            data={"update": sparql})
+        if fuseki_result.status_code > 399:
+            raise falcon.HTTPInternalServerError(
+                "Failed to update {}".format(self.update_url),
+                "Error:\n{}\nSPARQL:\n{}".format(
+                    fuseki_result.text,
+                    sparql))
+
     def __replace_object__(self, subject, predicate, old_object, new_object):
         """Internal method attempts to replace an existing triple's object with
         a new object
@@ -247,7 +701,11 @@ WHERE {{{{
                 return '<{}>'.format(object_)
             elif type(old_object) == rdflib.Literal:
                 return '"{}"'.format(object_)
-        sparql = REPLACE_OBJECT_SPARQL.format(
+        if self.named_graphs:
+            sparql_template = REPLACE_GRAPH_OBJECT_SPARQL
+        else:
+            sparql_template = REPLACE_OBJECT_SPARQL
+        sparql = sparql_template.format(
             subject,
             get_string_rep(predicate),
             get_string_rep(old_object),
@@ -313,26 +771,28 @@ WHERE {{{{
             insert_str += ' {} '.format(object_)
         else:
             insert_str += ' "{}" '.format(object_)
-        sparql = UPDATE_TRIPLESTORE_SPARQL.format(insert_str)
-        result = requests.post(
-            self.update_url,
-            data={"sparql": sparql, "output": "json"})
-        if result.status_code < 400:
-            raise falcon.HTTPInternalServerError(
-                "Failed to update triple",
-                "Failed to update {} {} {} to Fuseki.\nError={}".format(
-                    subject,
-                    predicate,
-                    object_,
-                    result.text))
+        if self.named_graphs:
+            # Hash subjects are stored in their Resource's graph
+            sparql = UPDATE_GRAPH_SPARQL.format(
+                str(subject).split("#")[0],
+                insert_str)
+        else:
+            sparql = UPDATE_TRIPLESTORE_SPARQL.format(insert_str)
+        self.__update__(sparql)
 
     def on_get(self, req, resp):
-        """GET method returns information related to the Fuseki Instance
+        """GET method returns information related to the Fuseki Instance, 
+        or with the export parameter streams the dataset as N-Quads
 
         Args:
            req -- HTTP Request
            resp -- HTTP Response
         """ 
+        if req.get_param_as_bool('export'):
+            resp.status = falcon.HTTP_200
+            resp.content_type = "application/n-quads"
+            resp.stream = self.__export__()
+            return
         resp.status = falcon.HTTP_200
         resp.body = json.dumps({"message": "Fuseki is active",
                                 "query_url": self.query_url})
@@ -28,6 +28,7 @@ from .. import CONTEXT, Search, generate_prefix
 from ..resources.fedora import Resource
 from .namespaces import *
 from .cover_art import by_isbn
+from .fetch import fetch_graph
 
 logging.basicConfig(filename='bibframe-error.log',
                     format='%(asctime)s %(funcName)s %(message)s',
@@ -178,7 +179,7 @@ class Ingester(GraphIngester):
     def __process_subject__(self, row):
         subject, graph = row[0], row[1]
         bf_type = self.__get_specific_type__(subject)
-        existing_uri = self.searcher.triplestore.__sameAs__(str(subject))
+        existing_uri = self.__existing_url__(subject)
         if existing_uri:
             subject = rdflib.URIRef(existing_uri)
         
@@ -200,8 +201,7 @@ class Ingester(GraphIngester):
             subject = row[0]
             fedora_url = self.searcher.triplestore.__sameAs__(str(subject))
             fedora_uri = rdflib.URIRef(fedora_url)
-            graph = default_graph()
-            graph.parse(fedora_url)
+            graph = fetch_graph(fedora_url, default_graph())
             doc_type = guess_search_doc_type(graph, fedora_uri) 
             self.searcher.__index__(
                 fedora_uri,
@@ -255,10 +255,8 @@ class BIBFRAMESearch(Search):
              image_url = str(cover_url).split(
                  "fcr:metadata")[0]
              # Update instance with schema:image
-             instance_result = self.triplestore.__get_id__(instance_url) 
-             instance_id=instance_result[0].get('uuid').get('value')
-             cover_result = self.triplestore.__get_id__(cover_url)
-             cover_id=cover_result[0].get('uuid').get('value')
+             instance_id = self.id_from_url(instance_url)
+             cover_id = self.id_from_url(cover_url)
              self.__update__(doc_id=instance_id, 
                              field="schema:image", 
                              value=cover_id)
@@ -354,10 +352,10 @@ class BIBFRAMESearch(Search):
                         fedora_url = row.get('subject').get('value')
                         graph = default_graph()
                         try:
-                            graph.parse(fedora_url)
+                            fetch_graph(fedora_url, graph)
                         except rdflib.plugin.PluginException:
                             fedora_url = "{}/fcr:metadata".format(fedora_url)
-                            graph.parse(fedora_url)
+                            fetch_graph(fedora_url, graph)
                         except:
                             logging.error("RDF Parse for {} Error {}".format(
                                 fedora_url,
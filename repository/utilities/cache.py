@@ -0,0 +1,159 @@
+"""Thread-safe in-process caches shared by the REST API's resources"""
+__author__ = "Jeremy Nelson"
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class LRUCache(object):
+    """Least recently used cache of a fixed number of entries, safe to share
+    across the threads of the REST API.
+
+    >> cache = LRUCache(2)
+    >> cache.set("a", 1)
+    >> cache.get("a")
+    1
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        """Initializes the cache
+
+        Args:
+            size -- Maximum number of entries, 0 disables the cache
+        """
+        self.size = int(size)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def clear(self):
+        """Removes every entry"""
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, key, default=None):
+        """Returns an entry and marks it as the most recently used
+
+        Args:
+            key -- Key of the entry
+            default -- Returned if the key isn't cached, defaults to None
+        """
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def pop(self, key, default=None):
+        """Removes and returns an entry
+
+        Args:
+            key -- Key of the entry
+            default -- Returned if the key isn't cached, defaults to None
+        """
+        with self.lock:
+            return self.entries.pop(key, default)
+
+    def set(self, key, value):
+        """Adds or replaces an entry, evicting the least recently used entry
+        when the cache is full
+
+        Args:
+            key -- Key of the entry
+            value -- Value
+        """
+        if self.size < 1:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class MemberCache(LRUCache):
+    """Least recently used cache of results built from many members, i.e.
+    the Resources of an expanded graph, every entry containing a member is
+    removed when that member changes.
+
+    >> cache = MemberCache()
+    >> cache.set("work", graph, ["work", "title", "agent"])
+    >> cache.invalidate("title")
+    >> cache.get("work") is None
+    True
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        super(MemberCache, self).__init__(size)
+        self.keys_by_member = dict()
+
+    def __forget__(self, key, entry):
+        # Caller holds the lock
+        for member in entry[1]:
+            keys = self.keys_by_member.get(member)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) < 1:
+                    self.keys_by_member.pop(member)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_member.clear()
+
+    def get(self, key, default=None):
+        entry = super(MemberCache, self).get(key)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return default
+            self.__forget__(key, entry)
+            return entry[0]
+
+    def set(self, key, value, members=[]):
+        """Adds or replaces an entry and the members it was built from
+
+        Args:
+            key -- Key of the entry
+            value -- Value
+            members -- Iterable of members i.e. Fedora URLs
+        """
+        if self.size < 1:
+            return
+        members = frozenset(members)
+        with self.lock:
+            if key in self.entries:
+                self.__forget__(key, self.entries[key])
+            self.entries[key] = (value, members)
+            self.entries.move_to_end(key)
+            for member in members:
+                self.keys_by_member.setdefault(member, set()).add(key)
+            while len(self.entries) > self.size:
+                evicted, entry = self.entries.popitem(last=False)
+                self.__forget__(evicted, entry)
+
+    def invalidate(self, member):
+        """Removes every entry built from a member
+
+        Args:
+            member -- Member that changed
+        """
+        with self.lock:
+            for key in self.keys_by_member.pop(member, set()):
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.__forget__(key, entry)
@@ -0,0 +1,307 @@
+"""Batch deduplication helpers for MARC ingests, resolving the III bib
+numbers of many MARC records already in the Elasticsearch marc index with a
+single terms query instead of one search per record, and a local index of
+normalized BIBFRAME access points.
+"""
+__author__ = "Jeremy Nelson"
+
+import re
+import sqlite3
+import threading
+import unicodedata
+
+# Bib numbers in each terms query
+DEDUP_CHUNK_SIZE = 1000
+
+REBUILD_PAGE_SIZE = 10000
+
+PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+# Authority types deduplicated by heading, with their MADS equivalents. Works,
+# Instances and other resources sharing a title stay separate entities
+AUTHORITY_TYPES = frozenset([
+    "Person",
+    "Topic",
+    "Title",
+    "v1#PersonalName",
+    "v1#Topic",
+    "v1#ComplexSubject",
+    "v1#Geographic"])
+
+CREATE_AUTHORITIES_SQL = """CREATE TABLE IF NOT EXISTS authorities (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL
+) WITHOUT ROWID"""
+
+
+def iii_bib_number(record):
+    """Function returns a MARC record's III bib number, i.e. b1234567 from
+    the 907 $a .b12345678, without the leading period and check digit
+
+    Args:
+        record -- pymarc.Record
+    Returns:
+        str -- bib number or None
+    """
+    for field in record.get_fields('907'):
+        for value in field.get_subfields('a'):
+            return value[1:-1]
+    return None
+
+
+def __first__(value):
+    if isinstance(value, list):
+        if len(value) < 1:
+            return None
+        return value[0]
+    return value
+
+
+class BibNumberMap(object):
+    """Local bib number to Fedora MARC URL map for a batch, filled from the
+    Elasticsearch marc index a chunk of bib numbers at a time. Bib numbers
+    that aren't indexed are remembered as missing so they are never
+    searched for twice.
+
+    >> bib_numbers = BibNumberMap(Elasticsearch())
+    >> bib_numbers.resolve(["b1234567", "b7654321"])
+    >> bib_numbers.get("b1234567")
+    'http://localhost:8080/rest/de/ad/...'
+    """
+
+    def __init__(self,
+                 elastic_search,
+                 index='marc',
+                 chunk_size=DEDUP_CHUNK_SIZE):
+        """Initializes the map
+
+        Args:
+            elastic_search -- Elasticsearch instance
+            index -- Elasticsearch index of MARC records, defaults to marc
+            chunk_size -- Bib numbers in each terms query
+        """
+        self.elastic_search = elastic_search
+        self.index = index
+        self.chunk_size = chunk_size
+        self.urls = dict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, bib_number):
+        with self.lock:
+            return bib_number in self.urls
+
+    def __search__(self, bib_numbers):
+        result = self.elastic_search.search(
+            index=self.index,
+            body={
+                "query": {"terms": {"rdfs:label": bib_numbers}},
+                "_source": ["rdfs:label", "owl:sameAs"],
+                "size": len(bib_numbers) * 2})
+        found = dict()
+        for hit in result.get('hits', {}).get('hits', []):
+            source = hit.get('_source', {})
+            labels = source.get('rdfs:label')
+            if not isinstance(labels, list):
+                labels = [labels,]
+            # terms matches analyzed tokens, only keep exact bib numbers
+            for label in labels:
+                if label in bib_numbers and label not in found:
+                    found[label] = __first__(source.get('owl:sameAs'))
+        return found
+
+    def add(self, bib_number, url):
+        """Adds a newly ingested MARC record's bib number and URL
+
+        Args:
+            bib_number -- III bib number
+            url -- Fedora URL of the MARC record
+        """
+        with self.lock:
+            self.urls[bib_number] = url
+
+    def get(self, bib_number):
+        """Returns the Fedora URL of an existing MARC record, searching
+        Elasticsearch only if the bib number hasn't been resolved
+
+        Args:
+            bib_number -- III bib number
+        Returns:
+            str -- Fedora URL or None
+        """
+        if bib_number is None:
+            return None
+        if bib_number not in self:
+            self.resolve([bib_number,])
+        with self.lock:
+            return self.urls.get(bib_number)
+
+    def resolve(self, bib_numbers):
+        """Resolves many bib numbers with one terms query per chunk
+
+        Args:
+            bib_numbers -- iterable of III bib numbers
+        """
+        with self.lock:
+            pending = sorted(set([number for number in bib_numbers
+                                  if number is not None and
+                                  number not in self.urls]))
+        if self.elastic_search is None:
+            return
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start:start+self.chunk_size]
+            found = self.__search__(chunk)
+            with self.lock:
+                for bib_number in chunk:
+                    self.urls.setdefault(bib_number, found.get(bib_number))
+
+
+def normalize_heading(value):
+    """Function folds case, punctuation and diacritics out of an access
+    point or label, i.e. "Crowe, Russell, 1964-" and "crowe russell 1964"
+    normalize to the same heading
+
+    Args:
+        value -- str or rdflib.Literal
+    Returns:
+        str
+    """
+    text = unicodedata.normalize('NFKD', str(value))
+    text = "".join([char for char in text if not unicodedata.combining(char)])
+    text = PUNCTUATION.sub(" ", text.casefold())
+    return " ".join(text.split())
+
+
+def local_type(type_uri):
+    """Returns the last part of a BIBFRAME or MADS type URI, i.e. Person or
+    v1#PersonalName"""
+    return str(type_uri).split("/")[-1]
+
+
+class AuthorityIndex(object):
+    """Persistent index of the Fedora URLs of BIBFRAME Person, Topic and Title
+    entities by type and normalized access point, other types are never
+    indexed or matched. The sqlite database is read into memory once,
+    misses fall back to sqlite so entities added by other processes sharing
+    the database are still found.
+
+    >> authorities = AuthorityIndex("authorities.db")
+    >> authorities.add("Person", "Crowe, Russell", "http://localhost:8080/rest/...")
+    >> authorities.get("Person", "CROWE RUSSELL")
+    'http://localhost:8080/rest/...'
+    """
+
+    def __init__(self, path=":memory:"):
+        """Initializes the index, creating the sqlite database if it doesn't
+        exist and loading every heading into memory
+
+        Args:
+            path -- File path of the sqlite database, defaults to an in
+                    memory database
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(CREATE_AUTHORITIES_SQL)
+        self.headings = dict(self.connection.execute(
+            "SELECT key, url FROM authorities"))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.headings)
+
+    def __key__(self, type_of, value):
+        if type_of not in AUTHORITY_TYPES:
+            return None
+        heading = normalize_heading(value)
+        if len(heading) < 1:
+            return None
+        return "{}\t{}".format(type_of, heading)
+
+    def add(self, type_of, value, url):
+        """Adds an entity's access point or label, an existing heading keeps
+        its first entity
+
+        Args:
+            type_of -- BIBFRAME type, i.e. Person
+            value -- Access point or label
+            url -- Fedora URL of the entity
+        """
+        self.add_many([(type_of, value, url)])
+
+    def add_many(self, rows):
+        """Adds many headings in one sqlite transaction
+
+        Args:
+            rows -- iterable of type, value and url tuples
+        """
+        keys = []
+        for type_of, value, url in rows:
+            key = self.__key__(type_of, value)
+            if key is not None:
+                keys.append((key, str(url)))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO authorities (key, url) VALUES (?, ?)",
+                keys)
+            for key, url in keys:
+                self.headings.setdefault(key, url)
+
+    def get(self, type_of, value):
+        """Returns the Fedora URL of an entity with the same type and
+        normalized heading or None
+
+        Args:
+            type_of -- BIBFRAME type, i.e. Person
+            value -- Access point or label
+        """
+        key = self.__key__(type_of, value)
+        if key is None:
+            return None
+        with self.lock:
+            url = self.headings.get(key)
+            if url is None and self.path != ":memory:":
+                row = self.connection.execute(
+                    "SELECT url FROM authorities WHERE key=?",
+                    (key,)).fetchone()
+                if row is not None:
+                    url = self.headings[key] = row[0]
+        return url
+
+    def match(self, types, values):
+        """Returns the Fedora URL of the first value matching an entity of
+        any of the types or None
+
+        Args:
+            types -- list of BIBFRAME types
+            values -- list of access points or labels, in priority order
+        """
+        for value in values:
+            for type_of in types:
+                url = self.get(type_of, value)
+                if url is not None:
+                    return url
+
+    def rebuild(self, triplestore, page_size=REBUILD_PAGE_SIZE):
+        """Adds the access points and labels of every authority entity
+        loaded in Fuseki, reading the triplestore a page at a time
+
+        Args:
+            triplestore -- repository.resources.fuseki.TripleStore
+            page_size -- Number of bindings per SPARQL query
+        Returns:
+            int -- Number of headings
+        """
+        offset = 0
+        while True:
+            bindings = triplestore.__get_access_points__(offset, page_size)
+            self.add_many([(local_type(row['type']['value']),
+                            row['value']['value'],
+                            row['subject']['value']) for row in bindings])
+            if len(bindings) < page_size:
+                break
+            offset += page_size
+        return len(self)
@@ -0,0 +1,216 @@
+"""Helper functions for retrieving Fedora Commons resources as rdflib graphs,
+requesting line-based N-Triples first and only falling back to Turtle or
+RDF/XML when a resource cannot provide it.
+"""
+__author__ = "Jeremy Nelson"
+
+import rdflib
+import requests
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+from .cache import DEFAULT_CACHE_SIZE, LRUCache
+
+NTRIPLES_MIMETYPE = "application/n-triples"
+
+# Mimetypes of RDF serializations mapped to the rdflib parser format
+RDF_FORMATS = {
+    NTRIPLES_MIMETYPE: "nt",
+    "application/n-quads": "nquads",
+    "text/turtle": "turtle",
+    "application/x-turtle": "turtle",
+    "application/rdf+xml": "xml",
+    "text/rdf+n3": "n3",
+    "application/ld+json": "json-ld"}
+
+# Mimetypes accepted when a resource can't return N-Triples, mapped to the
+# rdflib parser format
+FALLBACK_FORMATS = {
+    "text/turtle": "turtle",
+    "application/x-turtle": "turtle",
+    "application/rdf+xml": "xml",
+    "text/rdf+n3": "n3",
+    "application/ld+json": "json-ld"}
+
+FALLBACK_ACCEPT = "text/turtle, application/rdf+xml;q=0.9, text/rdf+n3;q=0.5"
+
+# Statuses of servers that refuse the N-Triples Accept header instead of
+# returning another representation
+NOT_ACCEPTABLE = (406, 415)
+
+
+class GraphSink(object):
+    """Sink for rdflib's N-Triples parser that adds each triple to a graph
+    as soon as its line is read from the response stream"""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def triple(self, subject, predicate, object_):
+        self.graph.add((subject, predicate, object_))
+
+
+def __mimetype__(result):
+    """Function returns the mimetype of a requests.Response without any
+    parameters i.e. charset
+
+    Args:
+        result -- requests.Response
+    """
+    return result.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+def pooled_session(connections=10):
+    """Function returns a requests.Session that keeps up to a number of 
+    connections per host open for reuse by concurrent threads
+
+    Args:
+        connections -- Maximum pooled connections per host, defaults to 10
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=connections,
+        pool_maxsize=connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_graph(url, graph=None, session=None):
+    """Function retrieves a Fedora Resource and parses it into a graph.
+    Fedora is first asked for application/n-triples which is parsed line
+    by line straight off the response stream, if the resource returns
+    anything else, or refuses N-Triples with a 406 or 415, a second
+    request is made for Turtle or RDF/XML.
+
+    Args:
+        url -- Fedora URL of the resource
+        graph -- rdflib.Graph to parse into, defaults to a new rdflib.Graph
+        session -- requests.Session to use for connection pooling, defaults
+                   to the requests module
+    Returns:
+        rdflib.Graph
+    Raises:
+        requests.HTTPError -- If Fedora returns an error status
+        rdflib.plugin.PluginException -- If the resource has no RDF
+                                         representation, i.e. a binary
+    """
+    return fetch_graph_if_changed(url, graph, session)[0]
+
+
+def fetch_graph_if_changed(url, graph=None, session=None, etag=None):
+    """Function retrieves a Fedora Resource like fetch_graph, if an ETag is
+    given the request is conditional and no graph is returned when the 
+    Resource hasn't changed.
+
+    Args:
+        url -- Fedora URL of the resource
+        graph -- rdflib.Graph to parse into, defaults to a new rdflib.Graph
+        session -- requests.Session to use for connection pooling, defaults
+                   to the requests module
+        etag -- ETag of the last retrieved representation, defaults to None
+    Returns:
+        tuple -- rdflib.Graph or None if not modified, ETag
+    """
+    if session is None:
+        session = requests
+    url = str(url)
+    headers = {"Accept": NTRIPLES_MIMETYPE}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    result = session.get(url, headers=headers, stream=True)
+    if result.status_code == 304:
+        result.close()
+        return None, etag
+    if graph is None:
+        graph = rdflib.Graph()
+    etag = result.headers.get("ETag")
+    try:
+        if result.status_code not in NOT_ACCEPTABLE:
+            result.raise_for_status()
+            if __mimetype__(result) == NTRIPLES_MIMETYPE:
+                result.raw.decode_content = True
+                NTriplesParser(GraphSink(graph)).parse(result.raw)
+                return graph, etag
+    finally:
+        result.close()
+    # The body is only read once its Content-Type is known to be RDF, so a
+    # binary is never downloaded
+    result = session.get(
+        url,
+        headers={"Accept": FALLBACK_ACCEPT},
+        stream=True)
+    try:
+        result.raise_for_status()
+        mimetype = __mimetype__(result)
+        if mimetype not in FALLBACK_FORMATS:
+            raise rdflib.plugin.PluginException(
+                "No RDF representation of {}, returned {}".format(
+                    url,
+                    mimetype))
+        graph.parse(
+            data=result.content,
+            format=FALLBACK_FORMATS[mimetype],
+            publicID=url)
+    finally:
+        result.close()
+    return graph, result.headers.get("ETag", etag)
+
+
+class GraphCache(object):
+    """Caches parsed Fedora graphs by URL, a cached graph is revalidated 
+    with a conditional request on its ETag so an unchanged Resource isn't
+    transferred or parsed again. Cached graphs are shared between requests
+    and must not be modified.
+
+    >> graphs = GraphCache()
+    >> etag, graph = graphs.get("http://localhost:8080/rest/...")
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, session=None, 
+                 new_graph=rdflib.Graph):
+        """Initializes the cache
+
+        Args:
+            size -- Maximum number of cached graphs
+            session -- requests.Session, defaults to a pooled session
+            new_graph -- Function returning an empty graph to parse into, 
+                         defaults to rdflib.Graph
+        """
+        self.graphs = LRUCache(size)
+        if session is None:
+            session = pooled_session()
+        self.session = session
+        self.new_graph = new_graph
+
+    def get(self, url):
+        """Returns the ETag and graph of a Fedora URL
+
+        Args:
+            url -- Fedora URL
+        Returns:
+            tuple -- ETag, rdflib.Graph
+        """
+        url = str(url)
+        cached = self.graphs.get(url)
+        if cached is None or cached[0] is None:
+            graph, etag = fetch_graph_if_changed(
+                url, 
+                self.new_graph(), 
+                self.session)
+        else:
+            graph, etag = fetch_graph_if_changed(
+                url,
+                self.new_graph(),
+                self.session,
+                cached[0])
+            if graph is None:
+                return cached
+        self.graphs.set(url, (etag, graph))
+        return etag, graph
+
+    def invalidate(self, url):
+        """Removes a Fedora URL from the cache after it changes
+
+        Args:
+            url -- Fedora URL
+        """
+        self.graphs.pop(str(url))
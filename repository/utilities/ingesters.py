@@ -10,8 +10,11 @@ import urllib.parse
 from .. import CONTEXT, INDEXING, RDF, Search, default_graph
 from ..resources import fedora
 from ..resources.fuseki import TripleStore
+from .fetch import fetch_graph
 from .namespaces import *
 
+# Seconds between keep-alive requests for an ingest's Fedora transaction
+TRANSACTION_KEEP_ALIVE = 60
 
 def valid_uri(uri):
     """function takes a rdflib.URIRef and checks if it is valid for 
@@ -79,6 +82,12 @@ class GraphIngester(object):
         self.searcher = kwargs.get('search', Search(self.config))
         self.subjects = subjects_list(self.graph, self.base_url)     
         self.dedup_predicates = []
+        self.transaction = None
+        # Resources created by the current ingest aren't in Fuseki until
+        # its transaction commits, source subject to Fedora URL
+        self.created = dict()
+        # Type, dedup predicate and value to Fedora URL
+        self.matched = dict()
 
 
         
@@ -100,18 +109,24 @@ class GraphIngester(object):
         graph_type = kwargs.get('graph_type')
         new_graph = default_graph()
         subject = kwargs.get('subject') 
+        dedup_keys = []
         for predicate, object_ in graph.predicate_objects(
                                       subject=subject):
             if self.dedup_predicates.count(predicate) > 0:
-                exists_url = self.searcher.triplestore.__match__(
+                key = (str(graph_type), str(predicate), str(object_))
+                exists_url = self.matched.get(key)
+                if exists_url is None:
+                    exists_url = self.searcher.triplestore.__match__(
                         type=graph_type, 
                         predicate=self.dedup_predicates[
                             self.dedup_predicates.index(predicate)],        
                         object=str(object_))
                 if exists_url:
-                    return exists_url, rdflib.Graph().parse(exists_url)
+                    self.created[str(subject)] = exists_url
+                    return exists_url, fetch_graph(exists_url)
+                dedup_keys.append(key)
             if type(object_) == rdflib.URIRef:
-                existing_obj_url = self.searcher.triplestore.__sameAs__(object_)
+                existing_obj_url = self.__existing_url__(object_)
                 if existing_obj_url:
                     new_graph.add((subject, 
                                    predicate, 
@@ -125,9 +140,28 @@ class GraphIngester(object):
             rdf=new_graph, 
             subject=subject, 
             doc_type=doc_type,
-            index=index
+            index=index,
+            transaction=self.transaction
         )
-        return resource_url, default_graph().parse(resource_url)
+        self.created[str(subject)] = resource_url
+        for key in dedup_keys:
+            self.matched[key] = resource_url
+        return resource_url, resource.graph
+
+    def __existing_url__(self, subject):
+        """Internal method returns the Fedora URL of a source subject, 
+        either created earlier in this ingest or found by its owl:sameAs
+        in Fuseki
+
+        Args:
+            subject -- rdflib.URIRef or string of the source subject
+        Returns:
+            string or None
+        """
+        url = self.created.get(str(subject))
+        if url is not None:
+            return url
+        return self.searcher.triplestore.__sameAs__(str(subject))
 
 
     def __clean_up__(self):
@@ -178,9 +212,20 @@ class GraphIngester(object):
 
 
     def ingest(self, quiet=True):
+        """Method ingests all of the graph's subjects in a single Fedora 
+        transaction, if any subject fails the transaction is rolled back
+        and none of the subjects are loaded.
+
+        Args:
+            quiet -- Suppress progress output, default is True
+        """
         start = datetime.datetime.utcnow()
         if not quiet:
             print("Started ingesting at {} {}".format(start, len(self.subjects)))
+        self.transaction = fedora.FedoraTransaction(self.config, self.searcher)
+        self.transaction.begin()
+        self.created, self.matched = dict(), dict()
+        errors = 0
         for i, row in enumerate(self.subjects):
             subject, graph = row[0], row[1]
             if not i%10 and i > 0 and not quiet:
@@ -189,13 +234,26 @@ class GraphIngester(object):
             if not i%25 and not quiet:
                 print(i, end="")
             try:
+                self.transaction.keep_alive(TRANSACTION_KEEP_ALIVE)
                 self.__process_subject__(row)
                 row[2] = True
             except:
+                errors += 1
                 logging.error("Error with {}, subject={}\n\t{}".format(
                     i, 
                     subject,
                     sys.exc_info()[0:2]))
+        if errors > 0:
+            logging.error("Rolling back {}, {} subjects failed".format(
+                self.transaction.url,
+                errors))
+            self.transaction.rollback()
+            self.created, self.matched = dict(), dict()
+            for row in self.subjects:
+                row[2] = False
+        else:
+            self.transaction.commit()
+        self.transaction = None
         self.__clean_up__()
         end = datetime.datetime.utcnow()
         if not i:
@@ -17,6 +17,8 @@ import urllib.request
 from catalog.helpers.bibframe import FCREPO
 from flask_fedora_commons import build_prefixes, Repository
 from elasticsearch import Elasticsearch
+from .dedup import BibNumberMap, iii_bib_number
+from .fetch import fetch_graph
 
 class RecordIngester(object):
     """Class takes a MARC21 or MARC XML file, ingests into Fedora 4 repository
@@ -26,7 +28,8 @@ class RecordIngester(object):
             self,
             record,
             elastic_search=Elasticsearch(),
-            repository=Repository()
+            repository=Repository(),
+            bib_numbers=None
             ):
         """Initializes RecordIngester class
 
@@ -35,32 +38,28 @@ class RecordIngester(object):
             elastic_search: Elasticsearch instance, defaults to localhost
             repository: Flask Fedora Commons Repository instance,
                         defaults to localhost
+            bib_numbers: BibNumberMap shared by a batch of records, see
+                         resolve_bib_numbers, defaults to a new map
         """
         self.elastic_search = elastic_search
         if not self.elastic_search.indices.exists('marc'):
             self.elastic_search.indices.create('marc')
         self.record = record
         self.repository = repository
+        if bib_numbers is None:
+            bib_numbers = BibNumberMap(self.elastic_search)
+        self.bib_numbers = bib_numbers
 
     def dedup(self, ils='III'):
         if ils.startswith('III'):
             # III MARC specific sys number
-            bib_number = self.record['907']['a'][1:-1]
+            bib_number = iii_bib_number(self.record)
         else:
             return
-        if self.elastic_search is not None:
-            existing_result = self.elastic_search.search(
-                index='marc',
-                body={
-                    "query": { "match": { "rdfs:label": bib_number}},
-                    "_source": ["rdfs:label", "owl:sameAs"]})
-            if existing_result.get('hits').get('total') > 0:
-                # Returns first id
-                first_hit = existing_result['hits']['hits'][0]
-                return first_hit['_source']['owl:sameAs']
+        return self.bib_numbers.get(bib_number)
 
     def index(self, marc_meta_url):
-        marc_graph = rdflib.Graph().parse(marc_meta_url)
+        marc_graph = fetch_graph(marc_meta_url)
         marc_uri = rdflib.URIRef(marc_meta_url)
         bib_number = str(marc_graph.value(
             subject=marc_uri,
@@ -113,8 +112,26 @@ class RecordIngester(object):
             'rdfs:label',
             bib_number)
         self.index(marc_meta_uri)
+        self.bib_numbers.add(bib_number, marc_meta_uri)
         return marc_uri
 
+def resolve_bib_numbers(records, elastic_search, ils='III'):
+    """Function resolves the bib numbers of a batch of MARC records with one
+    Elasticsearch terms query per chunk, pass the returned map to each
+    record's RecordIngester
+
+    Args:
+        records -- list of pymarc.Record
+        elastic_search -- Elasticsearch instance
+        ils -- Legacy ILS of the records, defaults to III
+    Returns:
+        BibNumberMap
+    """
+    bib_numbers = BibNumberMap(elastic_search)
+    if ils.startswith('III'):
+        bib_numbers.resolve([iii_bib_number(record) for record in records])
+    return bib_numbers
+
 def main():
     pass
 
@@ -0,0 +1,206 @@
+"""Local registry of Fedora uuids and URLs stored in sqlite, lets the REST
+API resolve a Resource's uuid to its Fedora URL, and back again, without a
+SPARQL query to Fuseki for every request. The registry also keeps the
+Elastic search index and document type of each indexed Resource so
+partial updates don't have to look the document up first.
+"""
+__author__ = "Jeremy Nelson"
+
+import sqlite3
+import threading
+
+# Bytes of the sqlite database file read through mmap
+MMAP_SIZE = 256 * 1024 * 1024
+
+REBUILD_PAGE_SIZE = 10000
+
+CREATE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS registry (
+    uuid TEXT PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+) WITHOUT ROWID"""
+
+CREATE_LOCATIONS_SQL = """CREATE TABLE IF NOT EXISTS locations (
+    uuid TEXT PRIMARY KEY,
+    es_index TEXT NOT NULL,
+    doc_type TEXT NOT NULL
+) WITHOUT ROWID"""
+
+
+class IdRegistry(object):
+    """sqlite backed uuid to Fedora URL registry, safe to share across the
+    threads of the REST API.
+
+    >> registry = IdRegistry("registry.db")
+    >> registry.add("8f4b...", "http://localhost:8080/rest/8f/4b/...")
+    >> registry.url("8f4b...")
+    'http://localhost:8080/rest/8f/4b/...'
+    """
+
+    def __init__(self, path=":memory:"):
+        """Initializes the registry, creating the sqlite database if it
+        doesn't exist
+
+        Args:
+            path -- File path of the sqlite database, defaults to an in
+                    memory database
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA mmap_size={}".format(MMAP_SIZE))
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(CREATE_TABLE_SQL)
+            self.connection.execute(CREATE_LOCATIONS_SQL)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM registry").fetchone()[0]
+
+    def __lookup__(self, sql, value):
+        with self.lock:
+            row = self.connection.execute(sql, (str(value),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def add(self, uuid, url):
+        """Adds or replaces a uuid and its Fedora URL
+
+        Args:
+            uuid -- Fedora uuid
+            url -- Fedora URL
+        """
+        self.add_many([(uuid, url)])
+
+    def add_many(self, rows):
+        """Adds or replaces many uuid and Fedora URLs in one sqlite
+        transaction
+
+        Args:
+            rows -- iterable of uuid, url tuples
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO registry (uuid, url) VALUES (?, ?)",
+                ((str(uuid), str(url)) for uuid, url in rows))
+
+    def add_locations(self, rows):
+        """Adds or replaces the Elastic search index and document type of
+        many uuids in one sqlite transaction
+
+        Args:
+            rows -- iterable of uuid, index, doc_type tuples
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO locations (uuid, es_index, doc_type) "
+                "VALUES (?, ?, ?)",
+                ((str(uuid), str(index), str(doc_type))
+                 for uuid, index, doc_type in rows))
+
+    def location(self, uuid):
+        """Returns the Elastic search index and document type of a uuid or
+        None if not registered
+
+        Args:
+            uuid -- Fedora uuid
+        Returns:
+            tuple -- index, doc_type
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT es_index, doc_type FROM locations WHERE uuid=?",
+                (str(uuid),)).fetchone()
+        if row is None:
+            return None
+        return tuple(row)
+
+    def remove(self, uuid=None, url=None):
+        """Removes a Resource from the registry by either its uuid or URL
+
+        Args:
+            uuid -- Fedora uuid, defaults to None
+            url -- Fedora URL, defaults to None
+        """
+        with self.lock, self.connection:
+            if uuid is None and url is not None:
+                row = self.connection.execute(
+                    "SELECT uuid FROM registry WHERE url=?",
+                    (str(url),)).fetchone()
+                if row is not None:
+                    uuid = row[0]
+            if uuid is not None:
+                self.connection.execute(
+                    "DELETE FROM registry WHERE uuid=?",
+                    (str(uuid),))
+                self.connection.execute(
+                    "DELETE FROM locations WHERE uuid=?",
+                    (str(uuid),))
+            if url is not None:
+                self.connection.execute(
+                    "DELETE FROM registry WHERE url=?",
+                    (str(url),))
+
+    def remove_many(self, uuids):
+        """Removes many Resources by uuid in one sqlite transaction
+
+        Args:
+            uuids -- iterable of Fedora uuids
+        """
+        uuids = [(str(uuid),) for uuid in uuids]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM registry WHERE uuid=?",
+                uuids)
+            self.connection.executemany(
+                "DELETE FROM locations WHERE uuid=?",
+                uuids)
+
+    def url(self, uuid):
+        """Returns the Fedora URL of a uuid or None if not registered
+
+        Args:
+            uuid -- Fedora uuid
+        """
+        return self.__lookup__(
+            "SELECT url FROM registry WHERE uuid=?",
+            uuid)
+
+    def uuid(self, url):
+        """Returns the uuid of a Fedora URL or None if not registered
+
+        Args:
+            url -- Fedora URL
+        """
+        return self.__lookup__(
+            "SELECT uuid FROM registry WHERE url=?",
+            url)
+
+    def rebuild(self, triplestore, page_size=REBUILD_PAGE_SIZE):
+        """Replaces the registry with every uuid and subject loaded in
+        Fuseki, reading the triplestore a page at a time, the Elastic search
+        locations are kept
+
+        Args:
+            triplestore -- repository.resources.fuseki.TripleStore
+            page_size -- Number of uuids per SPARQL query
+        Returns:
+            int -- Number of registered Resources
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM registry")
+            offset = 0
+            while True:
+                bindings = triplestore.__get_uuids__(offset, page_size)
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO registry (uuid, url) VALUES (?, ?)",
+                    ((row['uuid']['value'], row['subject']['value'])
+                     for row in bindings))
+                if len(bindings) < page_size:
+                    break
+                offset += page_size
+        return len(self)
@@ -0,0 +1,202 @@
+"""Fingerprints of MARC records for delta loads. A record's fingerprint is
+its 005 timestamp plus a hash of the normalized record, stored in a local
+sqlite database with the Fedora URLs of the BIBFRAME entities derived from
+the record, so a re-run of a full export only converts the records that are
+new or changed and replaces or deletes just their entities.
+"""
+__author__ = "Jeremy Nelson"
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+
+CREATE_FINGERPRINTS_SQL = """CREATE TABLE IF NOT EXISTS fingerprints (
+    record TEXT PRIMARY KEY,
+    stamp TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    entities TEXT NOT NULL,
+    seen REAL NOT NULL
+) WITHOUT ROWID"""
+
+NEW, CHANGED, UNCHANGED, STALE = "new", "changed", "unchanged", "stale"
+
+
+def record_key(record):
+    """Function returns the key of a record in the fingerprint store, its
+    001, or None if the record has no 001
+
+    Args:
+        record -- pymarc.Record
+    """
+    for field in record.get_fields('001'):
+        if field.data:
+            return field.data.strip()
+    return None
+
+
+def is_deleted(record):
+    """Function returns True if the record's leader marks it as deleted"""
+    return str(record.leader)[5:6] == "d"
+
+
+def record_fingerprint(record):
+    """Function returns a record's 005 timestamp and a hash of the record
+    normalized to ignore the 005, the leader's lengths and status and any
+    differences in Unicode normalization
+
+    Args:
+        record -- pymarc.Record
+    Returns:
+        tuple -- 005 timestamp, or an empty string, and hex digest
+    """
+    stamp = ""
+    digest = hashlib.sha1()
+    leader = str(record.leader)
+    digest.update(leader[6:12].encode())
+    digest.update(leader[17:].encode())
+    for field in record.get_fields():
+        if field.tag == '005':
+            stamp = (field.data or "").strip()
+            continue
+        digest.update(b"\x1e")
+        digest.update(field.tag.encode())
+        if field.is_control_field():
+            parts = [field.data or ""]
+        else:
+            parts = ["".join(field.indicators)]
+            for subfield in field.subfields:
+                parts.append(subfield.code)
+                parts.append(subfield.value.strip())
+        for part in parts:
+            digest.update(b"\x1f")
+            digest.update(unicodedata.normalize('NFC', part).encode())
+    return stamp, digest.hexdigest()
+
+
+class FingerprintStore(object):
+    """Persistent store of record fingerprints and derived entities, safe to
+    share across threads. Worker processes of a batch share the store by
+    opening the same database file.
+
+    >> store = FingerprintStore("fingerprints.db")
+    >> store.status("ocm01234567", record_fingerprint(record))
+    'changed'
+    >> store.update("ocm01234567", fingerprint, ["http://localhost:8080/rest/Work/1/..."])
+    """
+
+    def __init__(self, path=":memory:"):
+        """Initializes the store, creating the sqlite database if it doesn't
+        exist
+
+        Args:
+            path -- File path of the sqlite database, defaults to an in
+                    memory database
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(CREATE_FINGERPRINTS_SQL)
+
+    def __row__(self, key):
+        # Caller holds the lock
+        return self.connection.execute(
+            "SELECT stamp, digest, entities FROM fingerprints WHERE record=?",
+            (key,)).fetchone()
+
+    def status(self, key, fingerprint):
+        """Returns whether a record is new, changed, unchanged or stale, a
+        stale record has an older 005 than the stored fingerprint
+
+        Args:
+            key -- Record key, see record_key
+            fingerprint -- 005 timestamp and digest tuple
+        """
+        stamp, digest = fingerprint
+        with self.lock:
+            row = self.__row__(key)
+        if row is None:
+            return NEW
+        if row[1] == digest:
+            return UNCHANGED
+        if stamp and row[0] and stamp < row[0]:
+            return STALE
+        return CHANGED
+
+    def entities(self, key):
+        """Returns the Fedora URLs of the entities derived from a record
+
+        Args:
+            key -- Record key
+        Returns:
+            list
+        """
+        with self.lock:
+            row = self.__row__(key)
+        if row is None:
+            return []
+        return json.loads(row[2])
+
+    def touch(self, keys):
+        """Marks unchanged records as seen by the current load
+
+        Args:
+            keys -- iterable of record keys
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE fingerprints SET seen=? WHERE record=?",
+                [(now, key) for key in keys])
+
+    def update(self, key, fingerprint, entities):
+        """Stores a converted record's fingerprint and derived entities
+
+        Args:
+            key -- Record key
+            fingerprint -- 005 timestamp and digest tuple
+            entities -- list of Fedora URLs
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO fingerprints "
+                "(record, stamp, digest, entities, seen) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key,
+                 fingerprint[0],
+                 fingerprint[1],
+                 json.dumps([str(url) for url in entities]),
+                 time.time()))
+
+    def remove(self, key):
+        """Removes a record's fingerprint so it is converted again by the
+        next load
+
+        Args:
+            key -- Record key
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM fingerprints WHERE record=?",
+                (key,))
+
+    def missing(self, since):
+        """Returns the records not seen by a load, i.e. records dropped from
+        a full export
+
+        Args:
+            since -- Time the load started, seconds since the epoch
+        Returns:
+            list -- Record key and entity URLs tuples
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT record, entities FROM fingerprints WHERE seen<?",
+                (since,)).fetchall()
+        return [(key, json.loads(entities)) for key, entities in rows]
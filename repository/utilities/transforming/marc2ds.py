@@ -10,15 +10,20 @@
 # Licence:     MIT
 #-------------------------------------------------------------------------------
 import datetime
+import functools
 import hashlib
+import itertools
 import json
+import multiprocessing
 import pymarc
 import os
 import rdflib
+import requests
 import subprocess
 import shutil
 import socket
 import sys
+import time
 import urllib
 ##import urllib2
 import uuid
@@ -36,6 +41,21 @@ except ImportError:
 ##import flask_bibframe.models as bf_models
 
 from bson import ObjectId
+from elasticsearch import Elasticsearch
+from ..dedup import AuthorityIndex, BibNumberMap, DEDUP_CHUNK_SIZE
+from ..dedup import AUTHORITY_TYPES, iii_bib_number, local_type
+from ..fetch import fetch_graph
+from ... import Search
+from .fingerprints import FingerprintStore, STALE, UNCHANGED
+from .fingerprints import is_deleted, record_fingerprint, record_key
+from .marc_index import MarcFile, load_index, partitions
+from .marc_writer import MarcWriter
+from .marc_xml import is_marc_xml, iter_marc_xml
+from .offline import OUTPUT_SHARD_SIZE, OfflineWriter, bulk_action, nquads
+from .pipeline import BatchPipeline
+from .shards import AllocatorManager, ShardAllocator
+from .titles import TitleMatcher
+from .xquery import XQueryClient
 ##import flask_schema_org.models as schema_models
 
 BIBFRAME_NS = rdflib.Namespace('http://bibframe.org/vocab/')
@@ -181,12 +201,32 @@ def generate_record_info(content_source,
             u'recordCreationDate': datetime.datetime.utcnow().isoformat(),
             u'recordOrigin': origin_msg}
 
+def __transform_partition__(factory, marc_filepath, output_dir, start, stop,
+                            shard_size, results):
+    """Process of a partitioned transform, puts the start of its partition,
+    the number of records read and the number of errors on results"""
+    records, errors = factory().transform(
+        marc_filepath,
+        output_dir,
+        start,
+        stop,
+        shard_size)
+    results.put((start, records, errors))
+
+
 class MARC21Ingester(object):
 
     def __init__(self, **kwargs):
         self.mongo_client = kwargs.get('mongo_client', None)
-
-    def __convert_fields_add_datastore__(self, record_dict):
+        self.mongo_uri = kwargs.get('mongo_uri', None)
+        if self.mongo_client is None and self.mongo_uri is not None:
+            self.mongo_client = MongoClient(self.mongo_uri)
+        self.marc_writer = kwargs.get('marc_writer', None)
+        if self.marc_writer is None and self.mongo_client is not None:
+            # Ensures the 035 index exists before the first record
+            self.marc_writer = MarcWriter(self.mongo_client.marc.bibliographic)
+
+    def __convert_fields__(self, record_dict):
         """Internal method coverts pymarc MARC21 record to MongoDB optimized
         document for storage
 
@@ -194,11 +234,11 @@ class MARC21Ingester(object):
             record_dict (dict): Dictionary of a MARC21 record
 
         Returns:
-            str: MongoDB Identifier
+            dict: MongoDB document
         """
         new_fields = OrderedDict()
         for row in record_dict['fields']:
-            tag = row.keys()[0]
+            tag = next(iter(row))
             contents = self.__convert_subfields__(row.get(tag))
             if tag in new_fields:
                 if type(new_fields[tag]) == list:
@@ -209,7 +249,20 @@ class MARC21Ingester(object):
             else:
                 new_fields[tag] = contents
         record_dict['fields'] = new_fields
-        datastore_id = self.mongo_client.marc.bibliographic.insert(record_dict)
+        return record_dict
+
+    def __convert_fields_add_datastore__(self, record_dict):
+        """Internal method coverts pymarc MARC21 record to MongoDB optimized
+        document and buffers it for a bulk insert, call __flush_marc__ after
+        the last record
+
+        Args:
+            record_dict (dict): Dictionary of a MARC21 record
+
+        Returns:
+            str: MongoDB Identifier
+        """
+        datastore_id = self.marc_writer.add(self.__convert_fields__(record_dict))
         return str(datastore_id)
 
 
@@ -225,7 +278,7 @@ class MARC21Ingester(object):
         new_subfields = OrderedDict()
         if 'subfields' in field:
             for row in field['subfields']:
-                subfield = row.keys()[0]
+                subfield = next(iter(row))
                 value = row.get(subfield)
                 if subfield in new_subfields:
                     if type(new_subfields[subfield]) == list:
@@ -239,6 +292,11 @@ class MARC21Ingester(object):
             field['subfields'] = new_subfields
         return field
 
+    def __flush_marc__(self):
+        """Internal method inserts any buffered MARC records"""
+        if self.marc_writer is not None:
+            self.marc_writer.flush()
+
     def __get_or_add_marc__(self, record):
         """Internal method takes a MARC record and either returns an existing
         MARC Mongo ID or creates a new MARC entity in the semantic server
@@ -249,15 +307,24 @@ class MARC21Ingester(object):
         Returns:
             str: String of MARC records MongoDB ID
         """
-        for field in record.get_fields('035'):
-            if 'a' in field.subfields:
-                mongod_id = self.mongo_client.marc.bibliographic.find_one(
-                    {"fields.035.subfields.a": field['a']},
-                    {"_id"})
-                if mongod_id is not None:
-                    return str(mongod_id)
-        mongod_id = self.__convert_fields_add_datastore__(record.as_dict())
-        return mongod_id
+        return self.__get_or_add_marcs__([record,])[0]
+
+    def __get_or_add_marcs__(self, records):
+        """Internal method takes a chunk of MARC records, looks up all of
+        their 035 system numbers with one query and returns the existing or
+        new MARC Mongo ID of each record, new records are buffered for a
+        bulk insert
+
+        Args:
+            records (list): List of pymarc.Record
+
+        Returns:
+            list: String of MARC records MongoDB ID for each record
+        """
+        documents = [self.__convert_fields__(record.as_dict())
+                     for record in records]
+        return [str(mongo_id) for mongo_id in
+                self.marc_writer.get_or_add_many(documents)]
 
 class MARC21toBIBFRAMEIngester(MARC21Ingester):
     """
@@ -327,19 +394,77 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
             fedora --
             jar_location -- Complete path to Saxon jar file
             xqy_location -- Complete path to saxon.xqy from bibframe
+            shards -- ShardAllocator, defaults to one seeded from fedora
+            shard_path -- File path to persist the shard counters
+            redis -- redis.StrictRedis or URL to share the shard counters
+            authorities -- AuthorityIndex, defaults to one stored at
+                           authority_path or in memory
+            authority_path -- File path of the authority index database
+            titles -- TitleMatcher, defaults to one for the mongo_client's
+                      bibframe.Title collection
+            xquery -- XQueryClient, defaults to one for xquery_host and
+                      xquery_port
+            xquery_framed -- Use the framed protocol and pooled connections
+                             with the xquery service, defaults to False
+            fingerprints -- FingerprintStore for delta loads, defaults to
+                            one stored at fingerprint_path
+            fingerprint_path -- File path of the fingerprint database,
+                                delta loads are off if neither is set
+            config -- configparser.ConfigParser, entities deleted by a
+                      delta load are also removed from Fuseki and
+                      Elasticsearch through a Search for the config
+            search -- Search, defaults to one for the config
+            es -- Elasticsearch, defaults to one for es_hosts
+            es_hosts -- List of Elasticsearch hosts
+            mongo_client -- MongoClient, defaults to one for mongo_uri
+            mongo_uri -- MongoDB connection string
+            offline -- Transform records without calling Fedora,
+                       Elasticsearch or MongoDB, see transform
 
         """
         self.baseuri = kwargs.get('baseuri')
         self.elastic_search = kwargs.get('es', None)
+        if self.elastic_search is None and 'es_hosts' in kwargs:
+            self.elastic_search = Elasticsearch(kwargs['es_hosts'])
         self.fedora = kwargs.get('fedora')
         self.saxon_jar_location = kwargs.get('jar_location', None)
         self.saxon_xqy_location = kwargs.get('xqy_location', None)
         self.xquery_host = kwargs.get('xquery_host', 'localhost')
         self.xquery_port = kwargs.get('xquery_port', 8089)
+        self.xquery = kwargs.get('xquery', None)
+        if self.xquery is None:
+            self.xquery = XQueryClient(
+                self.xquery_host,
+                self.xquery_port,
+                framed=kwargs.get('xquery_framed', False))
+        self.bib_numbers = BibNumberMap(self.elastic_search)
+        self.authorities = kwargs.get('authorities', None)
+        if self.authorities is None:
+            self.authorities = AuthorityIndex(
+                kwargs.get('authority_path', ':memory:'))
+        self.titles = kwargs.get('titles', None)
+        self.fingerprints = kwargs.get('fingerprints', None)
+        if self.fingerprints is None and 'fingerprint_path' in kwargs:
+            self.fingerprints = FingerprintStore(kwargs['fingerprint_path'])
+        self.derived = []
+        self.reusable = {}
+        self.pending = {}
+        self.searcher = kwargs.get('search', None)
+        if self.searcher is None and kwargs.get('config') is not None:
+            self.searcher = Search(kwargs['config'])
+        self.offline = kwargs.get('offline', False)
+        self.offline_marc = []
+        self.settings = kwargs
+        self.shards = kwargs.get('shards', None)
+        self.shard_path = kwargs.get('shard_path', None)
+        self.shard_redis = kwargs.get('redis', None)
         self.graph_ids = {}
         self.filenames = []
         self.language_labels = {}
         super(MARC21toBIBFRAMEIngester, self).__init__(**kwargs)
+        if self.titles is None and self.mongo_client is not None:
+            # Ensures the Title indexes exist before the first record
+            self.titles = TitleMatcher(self.mongo_client.bibframe.Title)
 
 
     def __add_entity__(self, subject, graph, collection=None, marc_id=None):
@@ -445,71 +570,44 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
         return entity_id
 
     def __calculate_bibframe_shard__(self, bf_type, workspace=None):
-        fcrepo = rdflib.Namespace(CONTEXT.get("fcrepo"))
-        bf_uri = "/".join([
-                    self.fedora.base_url,
-                    'rest'])
-        if workspace is not None:
-            bf_uri = "/".join([bf_uri, workspace])
+        """Internal method returns the shard container for a new entity of a
+        BIBFRAME type, the shard allocator only reads Fedora the first time
+        a type is seen in a batch
 
-        bf_uri = rdflib.URIRef("/".join([bf_uri, bf_type]))
-        try:
-            bf_entities = rdflib.Graph().parse(str(bf_uri))
-        except urllib.error.HTTPError:
-            return 1
-        children = [obj for obj in bf_entities.objects(
-                    subject=bf_uri,
-                    predicate=fcrepo.hasChild)]
-        last_shard =  max([int(x.split("/")[-1]) for x in children])
-        last_shard_uri = rdflib.URIRef('/'.join([bf_uri, str(last_shard)]))
-        last_shard_graph = rdflib.Graph().parse(str(last_shard_uri))
-        shard_children = set([obj for obj in last_shard_graph.objects(
-            subject=last_shard_uri,
-            predicate=fcrepo.hasChild)])
-        if len(shard_children) < 5000:
-            return last_shard
-        else:
-            return last_shard+1
+        Args:
+            bf_type (str): BIBFRAME type i.e. Work
+            workspace (str): Fedora4 workspace, defaults to None
+
+        Returns:
+            int: Shard number
+        """
+        if self.shards is None:
+            self.shards = ShardAllocator(
+                self.fedora.base_url,
+                path=self.shard_path,
+                redis_client=self.shard_redis,
+                seed=not self.offline)
+        return self.shards.allocate(bf_type, workspace)
 
     def __decompose_bf_graph__(self, graph, workspace=None):
-        """Internal method takes a BIBFRAME RDF graph and creates Fedora objects
-        for each unique subject in the graph
+        """Internal method takes a BIBFRAME RDF graph and decomposes it into a
+        graph for each unique subject, new subjects get a Fedora URI in an
+        allocated shard of their type's container that is created when the
+        graph is PUT
 
         Args:
             graph(rdflib.Graph): BIBFRAME RDF graph
+            workspace (str): Fedora4 workspace, defaults to None
 
         Returns:
             list: List of new Fedora objects created from the graph
         """
         subject_to_fedora_uri = {}
 
-        subjects = list(set([subject for subject in graph.subjects()]))
-        # Creates Fedora URI stubs for each unique subject in the RDF graph
-        for subject in subjects:
-            type_of_object = graph.value(
-                subject=subject,
-                predicate=rdflib.RDF.type)
-            if type_of_object is not None:
-                type_of = type_of_object.split("/")[-1]
-            if type(subject) == rdflib.BNode:
-                type_of = 'Authority'
-            if type_of in MARC21toBIBFRAMEIngester.COLLECTION_CLASSES:
-                type_of = MARC21toBIBFRAMEIngester.COLLECTION_CLASSES.get(
-                    type_of)
-            fedora_uri = "/".join([
-                    self.fedora.base_url,
-                    'rest'])
-            shard = self.__calculate_bibframe_shard__(type_of, workspace)
-            if workspace is not None:
-                fedora_uri = "/".join([fedora_uri, workspace])
-            fedora_uri = self.fedora.create()
-##            fedora_uri  = "/".join(
-##                [fedora_uri,
-##                type_of,
-##                str(shard),
-##                str(ObjectId())])
-            subject_to_fedora_uri[subject] = rdflib.URIRef(fedora_uri)
-
+        # Subjects are sorted so a record's entities are derived in the same
+        # order by every load
+        subjects = sorted(set([subject for subject in graph.subjects()]),
+                          key=str)
         # Add labels to all titles
         titles = [title for title in graph.subjects(
                     predicate=rdflib.RDF.type,
@@ -524,17 +622,65 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
             graph.add((title,
                        rdflib.RDFS.label,
                        rdflib.Literal(" ".join(title_vals))))
-        # Now iterate through each subject's triples and creating a graph for
-        # adding an object to Fedora
-        bf_graphs = []
+        # Mints a Fedora URI under an allocated shard of its type's container
+        # for each unique subject that isn't an existing entity
+        existing = {}
+        # Record owned entities, shared authorities are never replaced or
+        # deleted by a delta load
+        self.derived = []
         for subject in subjects:
             if 'identifier' in str(subject):
+                # Identifiers are folded into their subject's graph
                 continue
             existing_graph = self.__dedup_bibframe__(subject, graph)
             if existing_graph:
+                existing[subject] = existing_graph
                 subject_to_fedora_uri[subject] = existing_graph
-                bf_graphs.append(
-                    rdflib.Graph().parse(str(existing_graph)))
+                continue
+            type_of = 'Resource'
+            type_of_object = graph.value(
+                subject=subject,
+                predicate=rdflib.RDF.type)
+            if type_of_object is not None:
+                type_of = type_of_object.split("/")[-1]
+            if type(subject) == rdflib.BNode:
+                type_of = 'Authority'
+            if type_of in MARC21toBIBFRAMEIngester.COLLECTION_CLASSES:
+                type_of = MARC21toBIBFRAMEIngester.COLLECTION_CLASSES.get(
+                    type_of)
+            derived = not any([
+                local_type(type_uri) in AUTHORITY_TYPES
+                for type_uri in graph.objects(subject, rdflib.RDF.type)])
+            if derived and len(self.reusable.get(type_of, [])) > 0:
+                # Replaces the entity of the same type and position derived
+                # from the record's previous version in place
+                fedora_uri = self.reusable[type_of].pop(0)
+            else:
+                fedora_uri = "/".join([
+                        self.fedora.base_url,
+                        'rest'])
+                shard = self.__calculate_bibframe_shard__(type_of, workspace)
+                if workspace is not None:
+                    fedora_uri = "/".join([fedora_uri, workspace])
+                fedora_uri  = "/".join(
+                    [fedora_uri,
+                    type_of,
+                    str(shard),
+                    str(ObjectId())])
+            subject_to_fedora_uri[subject] = rdflib.URIRef(fedora_uri)
+            if derived:
+                self.derived.append(fedora_uri)
+
+        # Now iterate through each subject's triples and creating a graph for
+        # adding an object to Fedora
+        bf_graphs = []
+        for subject in subjects:
+            if 'identifier' in str(subject):
+                continue
+            if subject in existing:
+                if not self.offline:
+                    bf_graphs.append(
+                        fetch_graph(existing[subject]))
                 continue
             new_graph = rdflib.Graph()
             new_graph.namespace_manager.bind('bf',
@@ -544,6 +690,7 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
             fedora_subject = subject_to_fedora_uri.get(subject)
             if fedora_subject is None:
                 print("Why {} {}".format(fedora_subject, subject))
+            self.__index_authorities__(subject, graph, fedora_subject)
             for predicate, obj in graph.predicate_objects(subject=subject):
                 if 'isbn' in predicate: # or 'issn' in predicate:
                     new_graph.add(
@@ -594,40 +741,195 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 
 
     def __dedup_bibframe__(self, subject, graph):
-        existing_bibframe = None
-        authorizedAccessPoints = [o for o in graph.objects(
+        """Internal method returns the Fedora URI of an existing entity of the
+        same type with a matching authorized access point, or failing that
+        label, from the local authority index
+
+        Args:
+            subject (rdflib.URIRef|rdflib.BNode): BIBFRAME subject
+            graph (rdflib.Graph): BIBFRAME graph
+
+        Returns:
+            rdflib.URIRef: Existing entity or None
+        """
+        types = [local_type(obj) for obj in graph.objects(
             subject,
-            BIBFRAME_NS.authorizedAccessPoint)]
-        if len(authorizedAccessPoints) > 0:
-            for authAccessPt in authorizedAccessPoints:
-                existing_bibframe = self.__dedup_sparql__(
-                    BIBFRAME_NS.authorizedAccessPoint,
-                    authAccessPt)
-                if existing_bibframe is not None:
-                    break
-        if not existing_bibframe:
-            value = graph.value(
-                subject=subject,
-                predicate=rdflib.RDFS.label)
-            if value:
-                existing_bibframe = self.__dedup_sparql__(
-                    rdflib.RDFS.label,
-                    value)
-        return existing_bibframe
+            rdflib.RDF.type)]
+        existing_bibframe = self.authorities.match(
+            types,
+            list(graph.objects(subject, BIBFRAME_NS.authorizedAccessPoint)) +
+            list(graph.objects(subject, rdflib.RDFS.label)))
+        if existing_bibframe is not None:
+            return rdflib.URIRef(existing_bibframe)
+
+    def __index_authorities__(self, subject, graph, fedora_subject):
+        """Internal method adds a new entity's access points and labels to
+        the local authority index
+
+        Args:
+            subject (rdflib.URIRef|rdflib.BNode): BIBFRAME subject
+            graph (rdflib.Graph): BIBFRAME graph
+            fedora_subject (rdflib.URIRef): Fedora URI of the new entity
+        """
+        headings = list(graph.objects(
+            subject,
+            BIBFRAME_NS.authorizedAccessPoint)) + list(graph.objects(
+                subject,
+                rdflib.RDFS.label))
+        self.authorities.add_many(
+            [(local_type(type_of), heading, fedora_subject)
+             for type_of in graph.objects(subject, rdflib.RDF.type)
+             for heading in headings])
 
 
     def __dedup_marc__(self, record):
-        bib_number = record['907']['a'][1:-1] # III MARC specific sys number
-        if self.elastic_search is not None:
-            existing_result = self.elastic_search.search(
-                index='marc',
-                body={
-                    "query": { "match": { "rdfs:label": bib_number}},
-                    "_source": ["rdfs:label", "owl:sameAs"]})
-            if existing_result.get('hits').get('total') > 0:
-                # Returns first id
-                first_hit = existing_result['hits']['hits'][0]
-                return first_hit['_source']['owl:sameAs']
+        """Internal method returns the Fedora URL of an existing MARC record
+        with the same III bib number, records resolved by __dedup_marcs__
+        don't search Elasticsearch again
+
+        Args:
+            record (pymarc.Record): MARC21 record
+
+        Returns:
+            str: Fedora URL of the MARC record or None
+        """
+        return self.bib_numbers.get(iii_bib_number(record))
+
+    def __dedup_marcs__(self, records):
+        """Internal method resolves the III bib numbers of a chunk of MARC
+        records with a single Elasticsearch terms query
+
+        Args:
+            records (list): List of pymarc.Record
+        """
+        self.bib_numbers.resolve(
+            [iii_bib_number(record) for record in records])
+
+    def __delta__(self, records):
+        """Internal method checks a chunk of MARC records against their
+        fingerprints from the last delta load. Unchanged and stale records
+        are marked as seen and skipped, deleted records have their derived
+        entities deleted.
+
+        Args:
+            records (list): List of pymarc.Record
+
+        Returns:
+            list: True for each record to convert
+        """
+        if self.fingerprints is None:
+            return [True for record in records]
+        output, seen = [], []
+        for record in records:
+            key = record_key(record)
+            if key is None:
+                output.append(True)
+                continue
+            if is_deleted(record):
+                self.__delete_derived__(key)
+                output.append(False)
+                continue
+            status = self.fingerprints.status(key, record_fingerprint(record))
+            output.append(status not in (UNCHANGED, STALE))
+            # Records in the export are never pruned, even if they fail
+            seen.append(key)
+        self.fingerprints.touch(seen)
+        return output
+
+    def __reuse_derived__(self, record):
+        """Internal method makes the entities derived from a record's
+        previous version reusable by the record's next decomposition, by
+        type in the order they were derived
+
+        Args:
+            record (pymarc.Record): MARC21 record
+        """
+        self.reusable = {}
+        key = record_key(record)
+        if self.fingerprints is None or key is None:
+            return
+        for url in self.fingerprints.entities(key):
+            # Entity URLs end with type, shard and id
+            self.reusable.setdefault(url.split("/")[-3], []).append(url)
+
+    def __stage_derived__(self, record):
+        """Internal method keeps the fingerprint and derived entities of a
+        converted record, and the entities of its previous version that
+        weren't derived again, until its graphs are written
+
+        Args:
+            record (pymarc.Record): MARC21 record
+        """
+        self.reusable = {}
+        key = record_key(record)
+        if self.fingerprints is None or key is None:
+            return
+        self.pending[key] = (
+            key,
+            record_fingerprint(record),
+            list(self.derived),
+            [url for url in self.fingerprints.entities(key)
+             if url not in self.derived])
+
+    def __pop_pending__(self, record):
+        """Internal method returns and forgets the staged replacement of a
+        converted record, see __replace_derived__
+
+        Args:
+            record (pymarc.Record): MARC21 record
+
+        Returns:
+            tuple: Record key, fingerprint, derived and stale entities or
+                   None
+        """
+        return self.pending.pop(record_key(record), None)
+
+    def __replace_derived__(self, pending):
+        """Internal method stores the fingerprint and derived entities of a
+        record once its graphs are written to Fedora, then deletes the
+        entities derived from the record's previous version that weren't
+        derived again. A record whose graphs fail to write keeps its old
+        fingerprint, so the next delta load converts it again.
+
+        Args:
+            pending (tuple): Staged replacement from __pop_pending__
+        """
+        if pending is None:
+            return
+        key, fingerprint, derived, stale = pending
+        self.fingerprints.update(key, fingerprint, derived)
+        self.__delete_bibframe__(stale)
+
+    def __delete_derived__(self, key):
+        """Internal method deletes every entity derived from a record and
+        the record's fingerprint
+
+        Args:
+            key (str): Record key, the record's 001
+        """
+        self.__delete_bibframe__(self.fingerprints.entities(key))
+        self.fingerprints.remove(key)
+
+    def __delete_bibframe__(self, bf_urls):
+        """Internal method deletes BIBFRAME entities from Fedora, entities
+        that are already gone are ignored, then with a Search removes them
+        and every Resource they contained from Fuseki and Elasticsearch
+
+        Args:
+            bf_urls (list): Fedora URLs of the entities
+        """
+        if len(bf_urls) < 1:
+            return
+        for bf_url in bf_urls:
+            bf_request = urllib.request.Request(bf_url, method='DELETE')
+            try:
+                urllib.request.urlopen(bf_request)
+            except urllib.error.HTTPError as error:
+                if error.code not in (404, 410):
+                    print("Could not delete {}".format(bf_url))
+                    raise ValueError("HttpError")
+        if self.searcher is not None:
+            self.searcher.__delete_subtree__(bf_urls)
 
 
 
@@ -778,9 +1080,19 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
     def __process_bibframe__(self, graph):
         # This should work because each graph only has one subject
         bf_url = str(next(graph.subjects()))
+        self.__put_bibframe__(bf_url, graph.serialize(format='turtle'))
+
+    def __put_bibframe__(self, bf_url, turtle):
+        """Internal method replaces a Fedora object with a decomposed BIBFRAME
+        graph serialized as Turtle
+
+        Args:
+            bf_url (str): Fedora URL of the graph's subject
+            turtle (bytes): Graph serialized as Turtle
+        """
         bf_request = urllib.request.Request(
             bf_url,
-            data=graph.serialize(format='turtle'),
+            data=turtle,
             method='PUT')
         bf_request.add_header('Accept', 'text/turtle')
         bf_request.add_header('Content-Type', 'text/turtle')
@@ -791,18 +1103,16 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
             raise ValueError("HttpError")
 
 
-    def __index_into_es__(self, graph_url):
-        """Method indexes the graph as serialized JSON into an Elastic Search
-        instance.
+    def __index_body__(self, graph):
+        """Internal method returns the Elasticsearch document type and body
+        of a decomposed BIBFRAME graph
 
         Args:
-            graph_url (str): URL of graph's subject, used ad ID for Elastic
-                             search id
             graph (rdflib.Graph): Decomposed BIBFRAME graph
+
+        Returns:
+            tuple: Document type and dict of the graph as JSON-LD
         """
-        if self.elastic_search is None:
-            return
-        graph = rdflib.Graph().parse(graph_url)
         subject = next(graph.subjects())
         object_types = graph.objects(
                 subject=subject,
@@ -823,6 +1133,21 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
             graph_json = graph_json[0]
         if '@context' in graph_json:
             graph_json.pop('@context')
+        return type_of, graph_json
+
+    def __index_into_es__(self, graph_url):
+        """Method indexes the graph as serialized JSON into an Elastic Search
+        instance.
+
+        Args:
+            graph_url (str): URL of graph's subject, used ad ID for Elastic
+                             search id
+            graph (rdflib.Graph): Decomposed BIBFRAME graph
+        """
+        if self.elastic_search is None:
+            return
+        graph = fetch_graph(graph_url)
+        type_of, graph_json = self.__index_body__(graph)
         try:
 ##            print("Trying to index with type_of={}".format(type_of))
             result = self.elastic_search.index(
@@ -846,6 +1171,8 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
         except UnicodeEncodeError:
             record.force_utf8 = True
             marc21 = record.as_marc()
+        if self.offline:
+            return self.__mint_marc__(record, marc21)
         marc_request = urllib.request.Request(
             '/'.join([self.fedora.base_url, 'rest']),
             data=marc21,
@@ -853,10 +1180,11 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
         marc_result = urllib.request.urlopen(marc_request)
         marc_content_uri = marc_result.read().decode()
         marc_uri = marc_content_uri.replace('/fcr:content', '')
-        bib_number = record['907']['a'][1:-1]
+        bib_number = iii_bib_number(record)
         self.fedora.insert(marc_uri, 'rdfs:label', bib_number)
+        self.bib_numbers.add(bib_number, marc_uri)
         if self.elastic_search is not None:
-            marc_graph = rdflib.Graph().parse(marc_uri)
+            marc_graph = fetch_graph(marc_uri)
             marc_body = {
                 "owl:sameAs": marc_uri,
                 "rdfs:label": bib_number,
@@ -876,6 +1204,37 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 
         return marc_uri
 
+    def __mint_marc__(self, record, marc21):
+        """Internal method mints the Fedora URL of a new MARC record in an
+        offline transform and keeps the record and its index document for
+        the transform's output
+
+        Args:
+            record (pymarc.Record): MARC21 record
+            marc21 (bytes): Record as MARC21
+
+        Returns:
+            str: Fedora URL of the MARC record
+        """
+        marc_uri = "/".join([
+            self.fedora.base_url,
+            'rest',
+            'MARC',
+            str(self.__calculate_bibframe_shard__('MARC')),
+            str(ObjectId())])
+        bib_number = iii_bib_number(record)
+        self.bib_numbers.add(bib_number, marc_uri)
+        marc_graph = rdflib.Graph()
+        marc_graph.add((rdflib.URIRef(marc_uri),
+                        rdflib.RDFS.label,
+                        rdflib.Literal(bib_number)))
+        self.offline_marc.append((
+            marc_uri,
+            marc21,
+            marc_graph,
+            {"owl:sameAs": marc_uri, "rdfs:label": bib_number}))
+        return marc_uri
+
     def __process_title__(self, title, graph):
         """Internal method takes title subject and a BIBFRAME graph and either
         returns an existing title or adds the title to the Semantic Server
@@ -909,40 +1268,22 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
                     title,
                     'http://bibframe.org/vocab/label')
 
-        # First try authorized Access Point
-        title_result = self.mongo_client.bibframe.Title.find_one(
-            {"authorizedAccessPoint": auth_access_pt},
-            {"_id":1})
-        # Second try titleValue and subtitle
-        if title_result is None:
-            title_result = self.mongo_client.bibframe.Title.find_one(
-                {"$and": [{"titleValue": title_value},
-                          {"subtitle": sub_title}]
-                },
-                { "_id": 1})
-        # Third try label
-        if title_result is None:
-            title_result = self.mongo_client.bibframe.Title.find_one(
-                {"label": label},
-                {"_id":1})
-        # Forth try title id
-        if title_result is None:
-            title_result = self.mongo_client.bibframe.Title.find_one(
-                {"@id": str(title)},
-                {"_id":1})
-        # Fifth tries just titleValue
-        if title_result is None:
-            title_result = self.mongo_client.bibframe.Title.find_one(
-                {"titleValue": title_value},
-                {"_id":1})
+        title_values = {
+            "authorizedAccessPoint": auth_access_pt,
+            "titleValue": title_value,
+            "subtitle": sub_title,
+            "label": label,
+            "id": str(title)}
+        # Tries authorized Access Point, titleValue and subtitle, label,
+        # title id and then just titleValue in a single query
+        title_id = self.titles.match(**title_values)
         # Finally add Title if no matches
-        if title_result is None:
+        if title_id is None:
             title_id = self.__add_entity__(
                 title,
                 graph,
                 self.mongo_client.bibframe.Title)
-        else:
-            title_id = title_result.get('_id')
+            self.titles.add(title_id, **title_values)
         return title_id
 
 
@@ -979,33 +1320,98 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 
 
     def __xquery_chain__(self, marc_xml):
-        xquery_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        xquery_server.connect((self.xquery_host, self.xquery_port))
-        xquery_server.sendall(marc_xml + b"\n")
-        rdf_xml = b''
-        while 1:
-            data = xquery_server.recv(1024)
-            if not data:
-                break
-            rdf_xml += data
-        xquery_server.close()
-        bf_graph = Graph()
-        bf_graph.parse(data=rdf_xml, format='xml')
-        return bf_graph
-
-    def batch(self, marc_filepath):
-        marc_reader = pymarc.MARCReader(open(marc_filepath, 'rb'))
+        return self.xquery.convert(marc_xml)
+
+    def batch(self,
+              marc_filepath,
+              workers=0,
+              start=0,
+              stop=None,
+              prune=False,
+              **kwargs):
+        """Method ingests every record in a MARC21 file, either serially or,
+        when workers is more than 0, through a pipeline of a reader process,
+        conversion worker processes and writer threads. A start and stop
+        ingest a range of records through the file's offset index, to
+        resume a batch or split a file across nodes. MARC-XML collections
+        are streamed one record at a time. With a fingerprint store the
+        batch is a delta load that only converts new and changed records.
+
+        Args:
+            marc_filepath (str): File path of the MARC21 or MARC-XML file
+            workers (int): Number of conversion processes, defaults to 0
+                           for a serial batch
+            start (int): Position of the first record, defaults to 0
+            stop (int): Position after the last record, defaults to the end
+            prune (bool): Delta load of a full export, deletes the entities
+                          of records missing from the file
+            kwargs: writers, chunk_size, queue_size, error_path, workspace
+                    and factory for the pipeline's BatchPipeline
+        """
+        if prune and (self.fingerprints is None or start > 0 or
+                      stop is not None):
+            raise ValueError(
+                "Pruning needs a fingerprint store and the whole file")
+        load_time = time.time()
         start_time = datetime.datetime.utcnow()
         print("Started MARC21 batch at {}".format(start_time.isoformat()))
-        for i,record in enumerate(marc_reader):
-            if not i%10:
-                sys.stderr.write(".")
-            if not i%100:
-                sys.stderr.write(" {} ".format(i))
-            if not i%1000:
-                sys.stderr.write(" {} seconds".format(
-                    (datetime.datetime.utcnow()-start_time).seconds))
-            self.ingest(record)
+        if workers > 0:
+            manager = None
+            settings = self.__worker_settings__()
+            if self.shard_redis is None and 'shards' not in settings:
+                # Workers share one allocator and counters file
+                manager = AllocatorManager()
+                manager.start()
+                settings['shards'] = manager.ShardAllocator(
+                    self.fedora.base_url,
+                    path=self.shard_path)
+            factory = kwargs.pop(
+                'factory',
+                functools.partial(type(self), **settings))
+            try:
+                # Fingerprints are stored and stale entities deleted only
+                # after a record's graphs are written
+                progress = BatchPipeline(
+                    factory,
+                    self.__put_bibframe__,
+                    workers=workers,
+                    commit=self.__replace_derived__,
+                    **kwargs).run(marc_filepath, start, stop)
+            finally:
+                if manager is not None:
+                    settings['shards'].save()
+                    manager.shutdown()
+            print("\n{} records, {} errors".format(
+                progress.completed,
+                progress.errors))
+        else:
+            marc_reader = self.__read_marc__(marc_filepath, start, stop)
+            i = start
+            while True:
+                # Resolves a chunk's bib numbers before ingesting its records
+                chunk = list(itertools.islice(marc_reader, DEDUP_CHUNK_SIZE))
+                if len(chunk) < 1:
+                    break
+                self.__dedup_marcs__([record for record, marc_xml in chunk])
+                for record, marc_xml in chunk:
+                    if not i%10:
+                        sys.stderr.write(".")
+                    if not i%100:
+                        sys.stderr.write(" {} ".format(i))
+                    if not i%1000:
+                        sys.stderr.write(" {} seconds".format(
+                            (datetime.datetime.utcnow()-start_time).seconds))
+                    self.ingest(record, marc_xml=marc_xml)
+                    i += 1
+        if prune:
+            missing = self.fingerprints.missing(load_time)
+            for key, entities in missing:
+                self.__delete_derived__(key)
+            print("Deleted entities of {} missing records".format(
+                len(missing)))
+        if self.shards is not None:
+            self.shards.save()
+        self.__flush_marc__()
         end_time = datetime.datetime.utcnow()
         print("Finished MARC21 batch at {}, total time={} minutes".format(
             end_time.isoformat(),
@@ -1014,27 +1420,268 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 
 
 
-    def ingest(self, record, workspace=None):
-        """Method runs entire tool-chain to ingest a single MARC record into
-        Datastore.
+    def __worker_settings__(self):
+        """Internal method returns the settings for the ingesters of a
+        batch's worker processes. Clients and database connections don't
+        survive the fork, so they are replaced by the paths, hosts and
+        connection strings each worker opens its own from.
+
+        Returns:
+            dict: Keyword arguments for MARC21toBIBFRAMEIngester
+        """
+        settings = dict(self.settings)
+        if self.fingerprints is not None:
+            if self.fingerprints.path == ":memory:":
+                raise ValueError(
+                    "Delta loads with workers need a fingerprint_path")
+            # Workers open the same database
+            settings.pop('fingerprints', None)
+            settings['fingerprint_path'] = self.fingerprints.path
+        if self.authorities.path == ":memory:":
+            raise ValueError(
+                "Batches with workers need an authority_path")
+        # Workers share headings through the same database
+        settings.pop('authorities', None)
+        settings['authority_path'] = self.authorities.path
+        for key in ['mongo_client', 'marc_writer', 'titles']:
+            settings.pop(key, None)
+        if self.mongo_client is not None:
+            if self.mongo_uri is None:
+                raise ValueError(
+                    "Batches with workers need a mongo_uri")
+            settings['mongo_uri'] = self.mongo_uri
+        if settings.pop('es', None) is not None:
+            settings['es_hosts'] = self.elastic_search.transport.hosts
+        if settings.pop('search', None) is not None and \
+           settings.get('config') is None:
+            raise ValueError(
+                "Batches with workers need a config to search")
+        if isinstance(settings.get('xquery'), XQueryClient):
+            settings.pop('xquery')
+            settings['xquery_host'] = self.xquery.host
+            settings['xquery_port'] = self.xquery.port
+            settings['xquery_framed'] = self.xquery.framed
+        return settings
+
+    def __read_marc__(self, marc_filepath, start=0, stop=None):
+        """Internal method returns a generator of the records in a MARC21 or
+        MARC-XML file
+
+        Args:
+            marc_filepath (str): File path of the MARC21 or MARC-XML file
+            start (int): Position of the first record, defaults to 0
+            stop (int): Position after the last record, defaults to the end
+
+        Returns:
+            generator: pymarc.Record and raw MARC-XML, or None, tuples
+        """
+        if is_marc_xml(marc_filepath):
+            return iter_marc_xml(marc_filepath, start, stop)
+        return self.__iter_marc21__(marc_filepath, start, stop)
+
+    def __iter_marc21__(self, marc_filepath, start=0, stop=None):
+        """Internal generator yields the records of a MARC21 file, a range
+        is read through the file's offset index. The file is closed once
+        the generator is exhausted or closed.
+
+        Args:
+            marc_filepath (str): File path of the MARC21 file
+            start (int): Position of the first record, defaults to 0
+            stop (int): Position after the last record, defaults to the end
+        """
+        if start > 0 or stop is not None:
+            with MarcFile(marc_filepath) as marc_file:
+                for record in marc_file.records(start, stop):
+                    yield record, None
+        else:
+            with open(marc_filepath, 'rb') as marc_file:
+                for record in pymarc.MARCReader(marc_file):
+                    yield record, None
+
+    def transform(self,
+                  marc_filepath,
+                  output_dir,
+                  start=0,
+                  stop=None,
+                  shard_size=OUTPUT_SHARD_SIZE,
+                  parts=1):
+        """Method runs an offline transform of a MARC21 or MARC-XML file,
+        converting, decomposing and generating the index documents of every
+        record without calling Fedora, Elasticsearch or MongoDB. Graphs are
+        written as N-Quads and index documents as Elasticsearch bulk NDJSON
+        into sharded output directories for offline.load_fuseki and
+        offline.load_elasticsearch. Partitions of a file can be transformed
+        by separate processes into the same output directory, with parts
+        the transform runs each partition in its own process and the
+        processes share one shard allocator and the authority_path. MARC
+        records are only deduplicated within a partition and the shard
+        counters start from 0 unless a shard_path is given.
+
+        Args:
+            marc_filepath (str): File path of the MARC21 or MARC-XML file
+            output_dir (str): Root output directory
+            start (int): Position of the first record, defaults to 0
+            stop (int): Position after the last record, defaults to the end
+            shard_size (int): Records per output directory
+            parts (int): Number of partitions transformed in parallel,
+                         defaults to 1
+
+        Returns:
+            tuple: Number of records read and number of errors
+        """
+        if self.fingerprints is not None:
+            raise ValueError("Delta loads need Fedora, not an offline transform")
+        if parts > 1:
+            return self.__transform_parts__(
+                marc_filepath,
+                output_dir,
+                start,
+                stop,
+                shard_size,
+                parts)
+        self.offline = True
+        self.bib_numbers = BibNumberMap(None)
+        start_time = datetime.datetime.utcnow()
+        print("Started MARC21 transform at {}".format(start_time.isoformat()))
+        writer = OfflineWriter(output_dir, shard_size, part=start)
+        marc_reader = self.__read_marc__(marc_filepath, start, stop)
+        i, errors = start, 0
+        try:
+            while True:
+                chunk = list(itertools.islice(marc_reader, DEDUP_CHUNK_SIZE))
+                if len(chunk) < 1:
+                    break
+                self.__dedup_marcs__([record for record, marc_xml in chunk])
+                for record, marc_xml in chunk:
+                    try:
+                        writer.write(i, *self.__transform__(record, marc_xml))
+                    except Exception as error:
+                        print("Error with record {} {}".format(i, error))
+                        errors += 1
+                    i += 1
+        finally:
+            writer.close()
+            if self.shards is not None:
+                self.shards.save()
+        end_time = datetime.datetime.utcnow()
+        print("Finished MARC21 transform at {}, total time={} minutes".format(
+            end_time.isoformat(),
+            (end_time-start_time).seconds / 60.0))
+        return i - start, errors
+
+    def __transform_parts__(self,
+                            marc_filepath,
+                            output_dir,
+                            start,
+                            stop,
+                            shard_size,
+                            parts):
+        """Internal method transforms the partitions of a MARC21 file's
+        range of records in parallel processes, see transform
+
+        Returns:
+            tuple: Number of records read and number of errors
+        """
+        if is_marc_xml(marc_filepath):
+            raise ValueError("Partitioned transforms need a MARC21 file")
+        total = len(load_index(marc_filepath)) - 1
+        if stop is not None:
+            total = min(stop, total)
+        settings = self.__worker_settings__()
+        manager = None
+        if self.shard_redis is None and 'shards' not in settings:
+            # Partitions share one allocator and counters file
+            manager = AllocatorManager()
+            manager.start()
+            settings['shards'] = manager.ShardAllocator(
+                self.fedora.base_url,
+                path=self.shard_path,
+                seed=False)
+        context = multiprocessing.get_context()
+        results = context.Queue()
+        processes = [context.Process(
+                         target=__transform_partition__,
+                         args=(functools.partial(type(self), **settings),
+                               marc_filepath,
+                               output_dir,
+                               part_start,
+                               part_stop,
+                               shard_size,
+                               results))
+                     for part_start, part_stop in partitions(
+                         total, parts, start)]
+        try:
+            for process in processes:
+                process.start()
+            counts = [results.get() for process in processes]
+            for process in processes:
+                process.join()
+        finally:
+            if manager is not None:
+                settings['shards'].save()
+                manager.shutdown()
+        return (sum([records for part, records, errors in counts]),
+                sum([errors for part, records, errors in counts]))
+
+    def __transform__(self, record, marc_xml=None):
+        """Internal method converts a MARC record offline and returns the
+        output of the record for an OfflineWriter
 
         Args:
             record (pymarc.Record): MARC21 record
-            workspace (str): Fedora4 workspace to ingest records into
+            marc_xml (bytes): Raw MARC-XML of the record, defaults to
+                              serializing the record
 
         Returns:
-            list: MongoID
+            tuple: N-Quads, Elasticsearch bulk NDJSON and MARC21 bytes
         """
-        self.graph_ids = {}
+        self.offline_marc = []
+        all_graphs = self.__convert__(record, None, marc_xml)
+        quads, actions, marc21 = [], [], []
+        for marc_uri, raw, marc_graph, body in self.offline_marc:
+            quads.append(nquads(marc_graph, marc_uri))
+            actions.append(bulk_action('marc', 'marc21', marc_uri, body))
+            marc21.append(raw)
+        for graph in all_graphs:
+            bf_url = str(next(graph.subjects()))
+            type_of, body = self.__index_body__(graph)
+            quads.append(nquads(graph, bf_url))
+            actions.append(bulk_action('bibframe', type_of, bf_url, body))
+        return b"".join(quads), b"".join(actions), b"".join(marc21)
+
+    def __add_control_number__(self, record):
         # MARC record must have a 001 for BIBFRAME xquery to function properly
-        if not record['001']:
+        if len(record.get_fields('001')) < 1:
             unique_id = uuid.uuid1()
             field001 = pymarc.Field('001')
             field001.data = str(unique_id).split("-")[0]
             record.add_field(field001)
-        marc_xml = pymarc.record_to_xml(record, namespace=True)
+
+    def __convert__(self, record, workspace=None, marc_xml=None):
+        """Internal method stores a MARC record, converts it to BIBFRAME with
+        the xquery service and decomposes the BIBFRAME graph, without
+        writing the decomposed graphs to Fedora.
+
+        Args:
+            record (pymarc.Record): MARC21 record
+            workspace (str): Fedora4 workspace to ingest records into
+            marc_xml (bytes): Raw MARC-XML of the record sent to the xquery
+                              service, defaults to serializing the record
+
+        Returns:
+            list: List of decomposed BIBFRAME rdflib.Graph, empty if a
+                  delta load skips the record
+        """
+        self.graph_ids = {}
+        if not self.__delta__([record])[0]:
+            return []
+        if len(record.get_fields('001')) < 1:
+            # The new 001 is only in the pymarc.Record
+            marc_xml = None
+        self.__add_control_number__(record)
+        if marc_xml is None:
+            marc_xml = pymarc.record_to_xml(record, namespace=True)
         marc_uri = rdflib.URIRef(self.__process_marc__(record))
-        derived_from = rdflib.URIRef('http://bibframe.org/vocab/derivedFrom')
 ##        try:
 ##            bibframe_graph = self.__xquery_chain__(marc_xml)
 ##            for subject, obj in bibframe_graph.subject_objects(
@@ -1062,6 +1709,90 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 ##        except:
 ##            print("Error with record {}".format(sys.exc_info()[0]))
         bibframe_graph = self.__xquery_chain__(marc_xml)
+        self.__reuse_derived__(record)
+        all_graphs = self.__decompose_derived__(
+            bibframe_graph,
+            marc_uri,
+            workspace)
+        self.__stage_derived__(record)
+        return all_graphs
+
+    def __convert_many__(self, records, workspace=None, marc_xml=None):
+        """Internal method converts a chunk of MARC records with a single
+        request to the xquery service, then stores and decomposes each
+        record like __convert__
+
+        Args:
+            records (list): List of pymarc.Record
+            workspace (str): Fedora4 workspace to ingest records into
+            marc_xml (list): Raw MARC-XML of each record, defaults to
+                             serializing the records
+
+        Returns:
+            list: List of decomposed graphs, or the Exception raised, for
+                  each record
+        """
+        output = []
+        if marc_xml is None:
+            marc_xml = [None for record in records]
+        if not self.xquery.framed:
+            self.__dedup_marcs__(records)
+            # Collections need the framed xquery service
+            for record, record_xml in zip(records, marc_xml):
+                try:
+                    output.append(
+                        self.__convert__(record, workspace, record_xml))
+                except Exception as error:
+                    output.append(error)
+            return output
+        # Delta loads only send new and changed records to the service
+        changed = [position for position, convert in enumerate(
+                       self.__delta__(records)) if convert]
+        for position in changed:
+            record = records[position]
+            if len(record.get_fields('001')) < 1:
+                marc_xml[position] = None
+            self.__add_control_number__(record)
+            if marc_xml[position] is None:
+                marc_xml[position] = pymarc.record_to_xml(
+                    record,
+                    namespace=True)
+        bibframe_graphs = dict()
+        if len(changed) > 0:
+            self.__dedup_marcs__([records[position] for position in changed])
+            bibframe_graphs = dict(zip(changed, self.xquery.convert_many(
+                [records[position] for position in changed],
+                [marc_xml[position] for position in changed])))
+        for position, record in enumerate(records):
+            if position not in bibframe_graphs:
+                output.append([])
+                continue
+            self.graph_ids = {}
+            try:
+                marc_uri = rdflib.URIRef(self.__process_marc__(record))
+                self.__reuse_derived__(record)
+                output.append(self.__decompose_derived__(
+                    bibframe_graphs[position],
+                    marc_uri,
+                    workspace))
+                self.__stage_derived__(record)
+            except Exception as error:
+                output.append(error)
+        return output
+
+    def __decompose_derived__(self, bibframe_graph, marc_uri, workspace=None):
+        """Internal method points the graph's bf:derivedFrom at the MARC
+        record stored in Fedora and decomposes the graph
+
+        Args:
+            bibframe_graph (rdflib.Graph): BIBFRAME graph of a record
+            marc_uri (rdflib.URIRef): Fedora URI of the MARC record
+            workspace (str): Fedora4 workspace to ingest records into
+
+        Returns:
+            list: List of decomposed BIBFRAME rdflib.Graph
+        """
+        derived_from = rdflib.URIRef('http://bibframe.org/vocab/derivedFrom')
         for subject, obj in bibframe_graph.subject_objects(
             predicate=derived_from):
             bibframe_graph.set(
@@ -1069,6 +1800,27 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
                 derived_from,
                 marc_uri))
         all_graphs = self.__decompose_bf_graph__(bibframe_graph, workspace)
+        bibframe_graph.close()
+        return all_graphs
+
+    def ingest(self, record, workspace=None, marc_xml=None):
+        """Method runs entire tool-chain to ingest a single MARC record into
+        Datastore.
+
+        Args:
+            record (pymarc.Record): MARC21 record
+            workspace (str): Fedora4 workspace to ingest records into
+            marc_xml (bytes): Raw MARC-XML of the record, defaults to
+                              serializing the record
+
+        Returns:
+            list: MongoID
+        """
+        all_graphs = self.__convert__(record, workspace, marc_xml)
+        pending = self.__pop_pending__(record)
+        for graph in all_graphs:
+            self.__process_bibframe__(graph)
+        self.__replace_derived__(pending)
 ##        for graph in all_graphs:
 ##            graph_url = str(next(graph.subjects()))
 ##            add_stub_request = urllib.request.Request(
@@ -1078,11 +1830,8 @@ class MARC21toBIBFRAMEIngester(MARC21Ingester):
 ##                urllib.request.urlopen(add_stub_request)
 ##            except:
 ##                print("Tried to add stub for {}".format(graph_url))
-        for graph in all_graphs:
-            self.__process_bibframe__(graph)
 ##            index_result = self.__index_into_es__(
 ##                str(next(graph.subjects())))
-        bibframe_graph.close()
 
 class MARC21toSchemaOrgIngester(MARC21Ingester):
     """
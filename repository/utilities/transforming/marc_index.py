@@ -0,0 +1,260 @@
+"""Offset index and memory-mapped random access for MARC21 files. A file is
+scanned once using the record length in each leader and the start offset of
+every record is written to a compact array-backed index, a MarcFile then
+fetches any record or range of records through mmap without reading the
+records before it, so batches can resume or be partitioned across processes
+and nodes.
+"""
+__author__ = "Jeremy Nelson"
+
+import argparse
+import array
+import mmap
+import os
+import pymarc
+import struct
+import sys
+
+INDEX_MAGIC = b"MARCIDX2"
+
+# Magic, size and modification time in nanoseconds of the MARC21 file and
+# number of records, the offsets that follow are also in network order
+INDEX_HEADER = struct.Struct("!8sQQQ")
+
+
+def index_path(marc_filepath):
+    """Returns the default offset index path of a MARC21 file"""
+    return "{}.idx".format(marc_filepath)
+
+
+def __network_order__(offsets):
+    """Returns the offsets in network byte order, or back in native order
+    when read from an index"""
+    if sys.byteorder == 'little':
+        offsets = array.array('Q', offsets)
+        offsets.byteswap()
+    return offsets
+
+
+def scan_offsets(marc_filepath):
+    """Function scans a MARC21 file once, jumping from leader to leader by
+    each record's length
+
+    Args:
+        marc_filepath -- File path of the MARC21 file
+    Returns:
+        array.array -- Start offset of every record followed by the end of
+                       the last record
+    """
+    offsets = array.array('Q')
+    size = os.path.getsize(marc_filepath)
+    with open(marc_filepath, 'rb') as marc_file:
+        position = 0
+        while position + 5 <= size:
+            marc_file.seek(position)
+            record_length = marc_file.read(5)
+            if not record_length.isdigit() or int(record_length) < 24:
+                raise ValueError("Invalid MARC21 record length {} at {}".format(
+                    record_length,
+                    position))
+            offsets.append(position)
+            position += int(record_length)
+    offsets.append(min(position, size))
+    return offsets
+
+
+def build_index(marc_filepath, path=None):
+    """Function scans a MARC21 file and writes its offset index
+
+    Args:
+        marc_filepath -- File path of the MARC21 file
+        path -- File path of the index, defaults to the MARC21 file's path
+                with .idx appended
+    Returns:
+        array.array -- Offsets
+    """
+    if path is None:
+        path = index_path(marc_filepath)
+    # Stat before the scan so a file changed during it is scanned again
+    stat = os.stat(marc_filepath)
+    offsets = scan_offsets(marc_filepath)
+    temp_path = "{}.tmp".format(path)
+    with open(temp_path, 'wb') as index_file:
+        index_file.write(INDEX_HEADER.pack(
+            INDEX_MAGIC,
+            stat.st_size,
+            stat.st_mtime_ns,
+            len(offsets) - 1))
+        __network_order__(offsets).tofile(index_file)
+    os.replace(temp_path, path)
+    return offsets
+
+
+def load_index(marc_filepath, path=None):
+    """Function loads a MARC21 file's offset index, building the index if it
+    is missing or the file's size or modification time has changed
+
+    Args:
+        marc_filepath -- File path of the MARC21 file
+        path -- File path of the index, defaults to the MARC21 file's path
+                with .idx appended
+    Returns:
+        array.array -- Offsets
+    """
+    if path is None:
+        path = index_path(marc_filepath)
+    if os.path.exists(path):
+        stat = os.stat(marc_filepath)
+        with open(path, 'rb') as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+            if len(header) == INDEX_HEADER.size:
+                magic, size, mtime_ns, count = INDEX_HEADER.unpack(header)
+                if magic == INDEX_MAGIC and size == stat.st_size and \
+                   mtime_ns == stat.st_mtime_ns:
+                    offsets = array.array('Q')
+                    offsets.fromfile(index_file, count + 1)
+                    return __network_order__(offsets)
+    return build_index(marc_filepath, path)
+
+
+def partitions(total, parts, start=0):
+    """Function splits a range of records into contiguous partitions
+
+    Args:
+        total -- Number of records
+        parts -- Number of partitions
+        start -- First record, defaults to 0
+    Returns:
+        list -- start, stop tuples
+    """
+    parts = max(1, min(parts, total - start))
+    size, extra = divmod(total - start, parts)
+    output = []
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        output.append((start, stop))
+        start = stop
+    return output
+
+
+class MarcFile(object):
+    """Random access to the records of a MARC21 file through its offset
+    index and mmap.
+
+    >> marc_file = MarcFile("bibs.mrc")
+    >> len(marc_file)
+    1000000
+    >> record = marc_file[600000]
+    >> for record in marc_file.records(600000): ...
+    """
+
+    def __init__(self, marc_filepath, path=None):
+        """Opens a MARC21 file, loading or building its offset index
+
+        Args:
+            marc_filepath -- File path of the MARC21 file
+            path -- File path of the index, defaults to the MARC21 file's
+                    path with .idx appended
+        """
+        self.marc_filepath = marc_filepath
+        self.offsets = load_index(marc_filepath, path)
+        self.marc_file = open(marc_filepath, 'rb')
+        self.mmap = None
+        if len(self) > 0:
+            self.mmap = mmap.mmap(
+                self.marc_file.fileno(),
+                0,
+                access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return pymarc.Record(data=bytes(self.raw(i)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __bounds__(self, start, stop):
+        if stop is None or stop > len(self):
+            stop = len(self)
+        return max(start, 0), stop
+
+    def raw(self, i):
+        """Returns a zero-copy view of a raw MARC21 record
+
+        Args:
+            i -- Position of the record
+        Returns:
+            memoryview
+        """
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("MARC21 record {} out of range".format(i))
+        return memoryview(self.mmap)[self.offsets[i]:self.offsets[i+1]]
+
+    def raw_range(self, start=0, stop=None):
+        """Returns a zero-copy view of a contiguous range of raw records
+
+        Args:
+            start -- First record, defaults to 0
+            stop -- Record after the last, defaults to the end of the file
+        Returns:
+            memoryview
+        """
+        start, stop = self.__bounds__(start, stop)
+        if start >= stop:
+            return memoryview(b"")
+        return memoryview(self.mmap)[self.offsets[start]:self.offsets[stop]]
+
+    def iter_raw(self, start=0, stop=None):
+        """Generator yields the position and raw bytes of each record in a
+        range
+
+        Args:
+            start -- First record, defaults to 0
+            stop -- Record after the last, defaults to the end of the file
+        """
+        start, stop = self.__bounds__(start, stop)
+        for i in range(start, stop):
+            yield i, self.mmap[self.offsets[i]:self.offsets[i+1]]
+
+    def records(self, start=0, stop=None):
+        """Generator yields the pymarc.Record of each record in a range
+
+        Args:
+            start -- First record, defaults to 0
+            stop -- Record after the last, defaults to the end of the file
+        """
+        for i, raw in self.iter_raw(start, stop):
+            yield pymarc.Record(data=raw)
+
+    def close(self):
+        """Closes the memory map and file"""
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.marc_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds the offset index of a MARC21 file")
+    parser.add_argument('marc_filepath')
+    parser.add_argument('--partitions', type=int, default=1,
+                        help="Prints start and stop of each partition")
+    args = parser.parse_args()
+    offsets = build_index(args.marc_filepath)
+    print("{} records indexed in {}".format(
+        len(offsets) - 1,
+        index_path(args.marc_filepath)))
+    if args.partitions > 1:
+        for start, stop in partitions(len(offsets) - 1, args.partitions):
+            print("{} {}".format(start, stop))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Buffered writer for MARC records stored in MongoDB's marc.bibliographic
+collection, looking up the 035 system numbers of a chunk of records with one
+$in query and inserting new records with unordered bulk writes.
+"""
+__author__ = "Jeremy Nelson"
+
+import threading
+from bson import ObjectId
+from pymongo import ASCENDING
+
+SYSTEM_NUMBER_FIELD = "fields.035.subfields.a"
+
+# Records buffered before an insert_many and system numbers per $in query
+WRITE_CHUNK_SIZE = 1000
+
+
+def system_numbers(document):
+    """Function returns the 035 $a values of a MARC document converted by
+    MARC21Ingester, where repeated fields and subfields are lists
+
+    Args:
+        document -- dict of a converted MARC record
+    Returns:
+        list
+    """
+    def as_list(value):
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return value
+        return [value,]
+    numbers = []
+    for field in as_list(document.get('fields', {}).get('035')):
+        if isinstance(field, dict):
+            numbers.extend(as_list(field.get('subfields', {}).get('a')))
+    return numbers
+
+
+class MarcWriter(object):
+    """Buffers new MARC documents for the marc.bibliographic collection,
+    giving each an ObjectId up front so callers get its id before the
+    document is written. Buffered documents are found by their system
+    numbers until they are flushed.
+
+    >> writer = MarcWriter(MongoClient().marc.bibliographic)
+    >> writer.get_or_add_many(documents)
+    [ObjectId('...'), ...]
+    >> writer.flush()
+    """
+
+    def __init__(self, collection, chunk_size=WRITE_CHUNK_SIZE):
+        """Initializes the writer and ensures the 035 index exists
+
+        Args:
+            collection -- pymongo.Collection of MARC records
+            chunk_size -- Documents buffered before an insert_many
+        """
+        self.collection = collection
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.pending_numbers = dict()
+        self.lock = threading.Lock()
+        self.ensure_index()
+
+    def ensure_index(self):
+        """Creates the 035 $a index if missing"""
+        self.collection.create_index([(SYSTEM_NUMBER_FIELD, ASCENDING)])
+
+    def __find__(self, numbers):
+        found = dict()
+        numbers = list(numbers)
+        for start in range(0, len(numbers), self.chunk_size):
+            chunk = numbers[start:start+self.chunk_size]
+            for document in self.collection.find(
+                    {SYSTEM_NUMBER_FIELD: {"$in": chunk}},
+                    {SYSTEM_NUMBER_FIELD: 1}):
+                for number in system_numbers(document):
+                    found.setdefault(number, document['_id'])
+        return found
+
+    def __flush__(self):
+        # Caller holds the lock
+        if len(self.pending) > 0:
+            self.collection.insert_many(self.pending, ordered=False)
+        self.pending = []
+        self.pending_numbers.clear()
+
+    def add(self, document):
+        """Buffers a new document, flushing when the buffer is full
+
+        Args:
+            document -- dict of a converted MARC record
+        Returns:
+            ObjectId
+        """
+        with self.lock:
+            return self.__append__(document)
+
+    def __append__(self, document):
+        # Caller holds the lock
+        document.setdefault('_id', ObjectId())
+        self.pending.append(document)
+        for number in system_numbers(document):
+            self.pending_numbers.setdefault(number, document['_id'])
+        if len(self.pending) >= self.chunk_size:
+            self.__flush__()
+        return document['_id']
+
+    def get_or_add_many(self, documents):
+        """Returns the id of an existing record sharing a 035 system number
+        with each document, or buffers the document as a new record
+
+        Args:
+            documents -- list of dicts of converted MARC records
+        Returns:
+            list -- ObjectId for each document
+        """
+        with self.lock:
+            numbers = set()
+            for document in documents:
+                numbers.update(system_numbers(document))
+            known = dict(self.pending_numbers)
+            known.update(self.__find__(
+                [number for number in numbers if number not in known]))
+            ids = []
+            for document in documents:
+                existing = None
+                for number in system_numbers(document):
+                    existing = known.get(number)
+                    if existing is not None:
+                        break
+                if existing is None:
+                    existing = self.__append__(document)
+                    for number in system_numbers(document):
+                        known.setdefault(number, existing)
+                ids.append(existing)
+            return ids
+
+    def flush(self):
+        """Inserts every buffered document"""
+        with self.lock:
+            self.__flush__()
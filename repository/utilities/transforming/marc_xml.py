@@ -0,0 +1,138 @@
+"""Streaming reader for MARC-XML collections. Records are parsed one at a time
+with iterparse and cleared from the tree as soon as they are read, so memory
+stays flat for collections of any size. Each record is returned both as a
+pymarc.Record, built directly from its element for storage and
+deduplication, and as its raw MARC-XML for the xquery service.
+"""
+__author__ = "Jeremy Nelson"
+
+import pymarc
+import xml.etree.ElementTree as etree
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+
+RECORD_TAGS = ("{{{}}}record".format(MARC_NS), "record")
+
+etree.register_namespace("marc", MARC_NS)
+
+# Bytes read to detect the format of a MARC file
+SNIFF_SIZE = 512
+
+
+def is_marc_xml(marc_filepath):
+    """Function returns True if a file is MARC-XML instead of MARC21
+
+    Args:
+        marc_filepath -- File path of the MARC file
+    """
+    with open(marc_filepath, 'rb') as marc_file:
+        head = marc_file.read(SNIFF_SIZE)
+    return head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<")
+
+
+def __local__(tag):
+    return tag.split("}")[-1]
+
+
+def __qualify__(element):
+    # Tags of records without a namespace are moved into the MARC-XML
+    # namespace expected by the xquery service, attributes stay unqualified
+    for child in element.iter():
+        if not child.tag.startswith("{"):
+            child.tag = "{{{}}}{}".format(MARC_NS, child.tag)
+
+
+def element_to_record(element):
+    """Function builds a pymarc.Record from a MARC-XML record element
+
+    Args:
+        element -- xml.etree.ElementTree.Element of a record
+    Returns:
+        pymarc.Record
+    """
+    record = pymarc.Record()
+    for child in element:
+        name = __local__(child.tag)
+        if name == "leader":
+            record.leader = pymarc.Leader(child.text or "")
+        elif name == "controlfield":
+            record.add_field(pymarc.Field(
+                tag=child.get("tag"),
+                data=child.text or ""))
+        elif name == "datafield":
+            record.add_field(pymarc.Field(
+                tag=child.get("tag"),
+                indicators=[child.get("ind1", " "), child.get("ind2", " ")],
+                subfields=[pymarc.Subfield(subfield.get("code"),
+                                           subfield.text or "")
+                           for subfield in child
+                           if __local__(subfield.tag) == "subfield"]))
+    return record
+
+
+def element_to_xml(element):
+    """Function serializes a MARC-XML record element with the marc prefix
+    for the MARC-XML namespace
+
+    Args:
+        element -- xml.etree.ElementTree.Element of a record
+    Returns:
+        bytes
+    """
+    __qualify__(element)
+    return etree.tostring(element, encoding='utf-8')
+
+
+def from_xml(marc_xml):
+    """Function parses the raw MARC-XML of a single record
+
+    Args:
+        marc_xml -- MARC-XML record bytes
+    Returns:
+        pymarc.Record
+    """
+    return element_to_record(etree.fromstring(marc_xml))
+
+
+def iter_elements(source, start=0, stop=None):
+    """Generator parses a MARC-XML collection one record element at a time,
+    clearing each element after it is yielded
+
+    Args:
+        source -- File path or binary file object of the collection
+        start -- Position of the first record, defaults to 0
+        stop -- Position after the last record, defaults to the end
+    Yields:
+        xml.etree.ElementTree.Element -- Record element
+    """
+    root, position = None, 0
+    for event, element in etree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+        if element.tag not in RECORD_TAGS:
+            continue
+        if stop is not None and position >= stop:
+            break
+        if position >= start:
+            yield element
+        position += 1
+        element.clear()
+        if element is not root:
+            # Drops the cleared records from the collection element
+            root.clear()
+
+
+def iter_marc_xml(source, start=0, stop=None):
+    """Generator parses a MARC-XML collection one record at a time
+
+    Args:
+        source -- File path or binary file object of the collection
+        start -- Position of the first record, defaults to 0
+        stop -- Position after the last record, defaults to the end
+    Yields:
+        tuple -- pymarc.Record and MARC-XML bytes of each record
+    """
+    for element in iter_elements(source, start, stop):
+        yield element_to_record(element), element_to_xml(element)
@@ -0,0 +1,269 @@
+"""Output and bulk loading for offline MARC to BIBFRAME transforms. An offline
+transform writes every decomposed BIBFRAME graph as N-Quads, named by the
+graph's subject, its Elasticsearch document as bulk NDJSON and the raw MARC21
+record into sharded output directories, without calling Fedora,
+Elasticsearch or MongoDB. The loader later pushes the files into Fuseki and
+Elasticsearch in bulk.
+
+output/
+    00000000/
+        0.nq        N-Quads of the records' graphs
+        0.ndjson    Elasticsearch bulk actions and documents
+        0.mrc       MARC21 records
+    00000001/
+        ...
+"""
+__author__ = "Jeremy Nelson"
+
+import argparse
+import configparser
+import json
+import os
+from elasticsearch import Elasticsearch
+from ...resources.fuseki import TripleStore
+
+# Records written to each output directory
+OUTPUT_SHARD_SIZE = 10000
+
+# Documents in each Elasticsearch bulk request
+BULK_SIZE = 1000
+
+SUFFIXES = (".nq", ".ndjson", ".mrc")
+
+
+def shard_directory(output_dir, position, shard_size=OUTPUT_SHARD_SIZE):
+    """Function returns the output directory of a record
+
+    Args:
+        output_dir -- Root output directory
+        position -- Position of the record in the MARC file
+        shard_size -- Records per output directory
+    Returns:
+        str
+    """
+    return os.path.join(
+        output_dir,
+        "{:08d}".format(position // shard_size))
+
+
+def nquads(graph, name):
+    """Function serializes a graph as N-Quads in a named graph
+
+    Args:
+        graph -- rdflib.Graph
+        name -- Named graph URL
+    Returns:
+        bytes
+    """
+    context = " <{}> .\n".format(name).encode()
+    output = []
+    for line in graph.serialize(format='nt').splitlines():
+        line = line.strip()
+        if len(line) < 1:
+            continue
+        output.append(line[:-1].rstrip() + context)
+    return b"".join(output)
+
+
+def bulk_action(index, doc_type, doc_id, body):
+    """Function returns an Elasticsearch bulk index action and document as
+    NDJSON
+
+    Args:
+        index -- Elasticsearch index
+        doc_type -- Document type
+        doc_id -- Document id
+        body -- dict of the document
+    Returns:
+        bytes
+    """
+    return "{}\n{}\n".format(
+        json.dumps({"index": {"_index": index,
+                              "_type": doc_type,
+                              "_id": doc_id}}),
+        json.dumps(body)).encode()
+
+
+class OfflineWriter(object):
+    """Writes transformed records into sharded output directories. Each
+    writer names its files by its part, i.e. the first record of a
+    partition, so processes transforming different partitions of a file
+    never write to the same file. A part's files are truncated the first
+    time they are opened, so transforming a partition again replaces its
+    output instead of duplicating it.
+
+    >> writer = OfflineWriter("output", part=0)
+    >> writer.write(0, nquads, ndjson, marc21)
+    >> writer.close()
+    """
+
+    def __init__(self, output_dir, shard_size=OUTPUT_SHARD_SIZE, part=0):
+        """Initializes the writer
+
+        Args:
+            output_dir -- Root output directory
+            shard_size -- Records per output directory
+            part -- Part in the file names, defaults to 0
+        """
+        self.output_dir = output_dir
+        self.shard_size = int(shard_size)
+        self.part = part
+        self.directory = None
+        self.files = []
+        self.opened = set()
+
+    def __open__(self, position):
+        directory = shard_directory(
+            self.output_dir,
+            position,
+            self.shard_size)
+        if directory == self.directory:
+            return
+        self.close()
+        os.makedirs(directory, exist_ok=True)
+        mode = 'ab' if directory in self.opened else 'wb'
+        self.opened.add(directory)
+        self.directory = directory
+        self.files = [open(os.path.join(
+                          directory,
+                          "{}{}".format(self.part, suffix)), mode)
+                      for suffix in SUFFIXES]
+
+    def write(self, position, quads, actions, marc21=None):
+        """Writes a transformed record
+
+        Args:
+            position -- Position of the record in the MARC file
+            quads -- N-Quads bytes of the record's graphs
+            actions -- Elasticsearch bulk NDJSON bytes
+            marc21 -- MARC21 record bytes, defaults to None
+        """
+        self.__open__(position)
+        for output, data in zip(self.files, [quads, actions, marc21]):
+            if data:
+                output.write(data)
+
+    def close(self):
+        """Closes the current directory's files"""
+        for output in self.files:
+            output.close()
+        self.files = []
+        self.directory = None
+
+
+def output_files(output_dir, suffix):
+    """Function returns every output file with a suffix in shard order
+
+    Args:
+        output_dir -- Root output directory
+        suffix -- File suffix, i.e. .nq
+    Returns:
+        list
+    """
+    paths = []
+    for directory in sorted(os.listdir(output_dir)):
+        shard_path = os.path.join(output_dir, directory)
+        if not os.path.isdir(shard_path):
+            continue
+        for name in sorted(os.listdir(shard_path)):
+            if name.endswith(suffix):
+                paths.append(os.path.join(shard_path, name))
+    return paths
+
+
+def load_fuseki(output_dir, triplestore):
+    """Function streams every N-Quads file of an offline transform into
+    Fuseki, one request per file. The triplestore's named_graphs must match
+    the FUSEKI section of the server's config, otherwise every graph is
+    loaded into the default graph, or into named graphs the server never
+    replaces.
+
+    Args:
+        output_dir -- Root output directory
+        triplestore -- repository.resources.fuseki.TripleStore
+    Returns:
+        int -- Number of files loaded
+    """
+    paths = output_files(output_dir, ".nq")
+    for path in paths:
+        with open(path, 'rb') as nquads_file:
+            triplestore.__load_nquads__(nquads_file)
+    return len(paths)
+
+
+def load_elasticsearch(output_dir, elastic_search, bulk_size=BULK_SIZE):
+    """Function sends every NDJSON file of an offline transform to
+    Elasticsearch in bulk requests of bulk_size documents
+
+    Args:
+        output_dir -- Root output directory
+        elastic_search -- elasticsearch.Elasticsearch
+        bulk_size -- Documents per bulk request
+    Returns:
+        tuple -- Number of documents indexed and number of errors
+    """
+    indexed, errors = 0, 0
+    def send(lines):
+        result = elastic_search.bulk(body=b"".join(lines))
+        failed = len([item for item in result.get('items', [])
+                      if 'error' in next(iter(item.values()))])
+        return len(lines) // 2 - failed, failed
+    for path in output_files(output_dir, ".ndjson"):
+        lines = []
+        with open(path, 'rb') as ndjson_file:
+            for line in ndjson_file:
+                lines.append(line)
+                if len(lines) >= bulk_size * 2:
+                    sent, failed = send(lines)
+                    indexed, errors = indexed + sent, errors + failed
+                    lines = []
+        if len(lines) > 0:
+            sent, failed = send(lines)
+            indexed, errors = indexed + sent, errors + failed
+    return indexed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk loads an offline MARC to BIBFRAME transform")
+    parser.add_argument('output_dir')
+    parser.add_argument('--config',
+                        help="Server config file, its FUSEKI and "
+                             "ELASTICSEARCH sections replace the options "
+                             "below")
+    parser.add_argument('--fuseki-host', default='localhost')
+    parser.add_argument('--fuseki-port', default=3030)
+    parser.add_argument('--datastore', default='ds')
+    parser.add_argument('--named-graphs', action='store_true',
+                        help="Load each graph into a named graph, must "
+                             "match named_graphs in the server's FUSEKI "
+                             "config")
+    parser.add_argument('--elasticsearch', default='localhost:9200')
+    parser.add_argument('--bulk-size', type=int, default=BULK_SIZE)
+    args = parser.parse_args()
+    config = {"FUSEKI": {
+        "host": args.fuseki_host,
+        "port": args.fuseki_port,
+        "datastore": args.datastore,
+        "named_graphs": args.named_graphs}}
+    elasticsearch = [args.elasticsearch]
+    if args.config is not None:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        if 'ELASTICSEARCH' in config:
+            options = {"host": config["ELASTICSEARCH"]["host"],
+                       "port": config["ELASTICSEARCH"]["port"]}
+            if 'url_prefix' in config["ELASTICSEARCH"]:
+                options['url_prefix'] = config["ELASTICSEARCH"]['url_prefix']
+            elasticsearch = [options]
+    triplestore = TripleStore(config)
+    print("Loaded {} N-Quads files into Fuseki".format(
+        load_fuseki(args.output_dir, triplestore)))
+    indexed, errors = load_elasticsearch(
+        args.output_dir,
+        Elasticsearch(elasticsearch),
+        args.bulk_size)
+    print("Indexed {} documents, {} errors".format(indexed, errors))
+
+if __name__ == '__main__':
+    main()
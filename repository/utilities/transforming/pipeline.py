@@ -0,0 +1,384 @@
+"""Multiprocess pipeline for batch ingests of MARC21 or MARC-XML files. A
+reader process splits the file into chunks of raw records, a pool of worker
+processes converts each record to BIBFRAME graphs and a bounded queue feeds
+the converted graphs to writer threads that PUT them into Fedora.
+"""
+__author__ = "Jeremy Nelson"
+
+import datetime
+import json
+import multiprocessing
+import os
+import pymarc
+import queue
+import sys
+import threading
+from .marc_index import MarcFile
+from .marc_xml import element_to_xml, from_xml, is_marc_xml, iter_elements
+
+# Records in each chunk sent to a conversion worker
+CHUNK_SIZE = 25
+
+# Chunks waiting in each of the pipeline's queues
+QUEUE_SIZE = 16
+
+# Threads writing converted graphs to Fedora
+WRITERS = 4
+
+# Seconds to wait on the results queue before checking the workers are alive
+POLL_TIMEOUT = 1.0
+
+
+def iter_marc21(marc_file):
+    """Generator yields each raw MARC21 record of a file, using the record
+    length in the first five bytes of the leader instead of parsing the
+    record
+
+    Args:
+        marc_file -- file object opened in binary mode
+    Yields:
+        bytes -- MARC21 record
+    """
+    while True:
+        record_length = marc_file.read(5)
+        if len(record_length) < 5:
+            break
+        if not record_length.isdigit():
+            raise ValueError(
+                "Invalid MARC21 record length {}".format(record_length))
+        yield record_length + marc_file.read(int(record_length) - 5)
+
+
+def control_number(record):
+    """Returns a record's 001 or None"""
+    for field001 in record.get_fields('001'):
+        return field001.data
+    return None
+
+
+def __read__(marc_filepath, tasks, workers, chunk_size, start=0, stop=None):
+    """Reader process puts chunks of index and raw record tuples on the tasks
+    queue, followed by a stop for each worker. A range of records is read
+    through the file's offset index, MARC-XML collections are streamed as
+    the raw XML of each record. The workers are always stopped, even when
+    the file can't be read to the end."""
+    chunk = []
+    try:
+        if is_marc_xml(marc_filepath):
+            marc_file = open(marc_filepath, 'rb')
+            raw_records = enumerate(
+                (element_to_xml(element)
+                 for element in iter_elements(marc_file, start, stop)),
+                start)
+        elif start > 0 or stop is not None:
+            marc_file = MarcFile(marc_filepath)
+            raw_records = marc_file.iter_raw(start, stop)
+        else:
+            marc_file = open(marc_filepath, 'rb')
+            raw_records = enumerate(iter_marc21(marc_file))
+        with marc_file:
+            for i, raw in raw_records:
+                chunk.append((i, raw))
+                if len(chunk) >= chunk_size:
+                    tasks.put(chunk)
+                    chunk = []
+    finally:
+        if len(chunk) > 0:
+            tasks.put(chunk)
+        for i in range(workers):
+            tasks.put(None)
+
+
+def __serialize__(graphs):
+    return [(str(next(graph.subjects())), graph.serialize(format='turtle'))
+            for graph in graphs]
+
+
+def __convert__(factory, workspace, tasks, results):
+    """Worker process builds its own ingester and converts every record of
+    each chunk to a list of subject URL and Turtle tuples. Ingesters with a
+    __convert_many__ method convert the whole chunk at once, falling back to
+    one record at a time if the chunk fails. Raw MARC-XML records are passed
+    to the ingester as marc_xml so they reach the xquery service as is.
+    Ingesters with a __pop_pending__ method return what the pipeline's
+    commit needs once the record's graphs are written."""
+    ingester = factory()
+    while True:
+        chunk = tasks.get()
+        if chunk is None:
+            break
+        records = []
+        converted = []
+        for i, raw in chunk:
+            try:
+                if raw.startswith(b"<"):
+                    record, marc_xml = from_xml(raw), raw
+                else:
+                    record, marc_xml = pymarc.Record(data=raw), None
+                records.append((i, control_number(record), record, marc_xml))
+            except Exception as error:
+                converted.append((i, None, None, repr(error), None))
+        all_graphs = None
+        if hasattr(ingester, '__convert_many__') and len(records) > 1:
+            kwargs = dict()
+            if records[0][3] is not None:
+                kwargs['marc_xml'] = [row[3] for row in records]
+            try:
+                all_graphs = ingester.__convert_many__(
+                    [row[2] for row in records],
+                    workspace,
+                    **kwargs)
+            except Exception:
+                all_graphs = None
+        for position, row in enumerate(records):
+            i, record_id, record, marc_xml = row
+            pending = None
+            try:
+                if all_graphs is None:
+                    if marc_xml is None:
+                        graphs = ingester.__convert__(record, workspace)
+                    else:
+                        graphs = ingester.__convert__(
+                            record,
+                            workspace,
+                            marc_xml=marc_xml)
+                else:
+                    graphs = all_graphs[position]
+                    if isinstance(graphs, Exception):
+                        raise graphs
+                graphs, message = __serialize__(graphs), None
+            except Exception as error:
+                graphs, message = None, repr(error)
+            if hasattr(ingester, '__pop_pending__'):
+                pending = ingester.__pop_pending__(record)
+            converted.append((i, record_id, graphs, message, pending))
+        results.put(converted)
+    if hasattr(ingester, '__flush_marc__'):
+        ingester.__flush_marc__()
+    results.put(None)
+
+
+class ProgressReport(object):
+    """Reports a batch's progress in record order, even though records are
+    finished out of order by the pipeline, and writes every failed record
+    to an error file as a line of JSON"""
+
+    def __init__(self, error_path=None, output=sys.stderr, start=0):
+        """Initializes the report
+
+        Args:
+            error_path -- File path of the error file, defaults to None
+            output -- File object for the progress, defaults to stderr
+            start -- Position of the first record, defaults to 0
+        """
+        self.output = output
+        self.lock = threading.Lock()
+        self.finished = set()
+        self.start = start
+        self.position = start
+        self.completed = 0
+        self.errors = 0
+        self.write_failures = []
+        self.start_time = datetime.datetime.utcnow()
+        self.error_file = None
+        if error_path is not None:
+            self.error_file = open(error_path, 'a')
+
+    def __report__(self, i):
+        # Caller holds the lock, same format as the serial batch
+        if not i%10:
+            self.output.write(".")
+        if not i%100:
+            self.output.write(" {} ".format(i))
+        if not i%1000:
+            self.output.write(" {} seconds".format(
+                (datetime.datetime.utcnow()-self.start_time).seconds))
+
+    def done(self, i, record_id=None, stage=None, error=None):
+        """Marks a record as finished
+
+        Args:
+            i -- Position of the record in the MARC21 file
+            record_id -- Record's 001, defaults to None
+            stage -- Pipeline stage that failed, defaults to None
+            error -- Error message if the record failed, defaults to None
+        """
+        with self.lock:
+            if error is not None:
+                self.errors += 1
+                if stage == 'write' and record_id is not None:
+                    self.write_failures.append(record_id)
+                if self.error_file is not None:
+                    self.error_file.write(json.dumps({
+                        "record": i,
+                        "001": record_id,
+                        "stage": stage,
+                        "error": error}) + "\n")
+                    self.error_file.flush()
+            self.finished.add(i)
+            while self.position in self.finished:
+                self.finished.remove(self.position)
+                self.__report__(self.position)
+                self.position += 1
+            self.completed = self.position - self.start
+
+    def close(self):
+        """Closes the error file"""
+        if self.error_file is not None:
+            self.error_file.close()
+
+
+class BatchPipeline(object):
+    """Runs a MARC21 file through the reader, conversion and writer stages.
+    Every worker process builds its own ingester with the factory so that
+    MongoDB and Elasticsearch clients are never shared across processes,
+    pass a Redis backed ShardAllocator to the workers' ingesters so their
+    shard counters are shared.
+
+    >> pipeline = BatchPipeline(
+           functools.partial(MARC21toBIBFRAMEIngester, fedora=fedora),
+           ingester.__put_bibframe__,
+           workers=8,
+           commit=ingester.__replace_derived__)
+    >> pipeline.run("bibs.mrc")
+    """
+
+    def __init__(self,
+                 factory,
+                 write,
+                 workers=None,
+                 writers=WRITERS,
+                 chunk_size=CHUNK_SIZE,
+                 queue_size=QUEUE_SIZE,
+                 error_path=None,
+                 workspace=None,
+                 commit=None):
+        """Initializes the pipeline
+
+        Args:
+            factory -- Callable returning a new ingester in each worker
+            write -- Callable taking a subject URL and Turtle
+            workers -- Number of conversion processes, defaults to the
+                       number of CPUs
+            writers -- Number of writer threads
+            chunk_size -- Records in each chunk
+            queue_size -- Maximum chunks waiting in each queue
+            error_path -- File path of the per-record error file
+            workspace -- Fedora4 workspace to ingest records into
+            commit -- Callable taking what a worker's ingester returned
+                      from __pop_pending__, called after every graph of
+                      the record is written, defaults to None
+        """
+        self.factory = factory
+        self.write = write
+        self.workers = workers or os.cpu_count() or 1
+        self.writers = writers
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.error_path = error_path
+        self.workspace = workspace
+        self.commit = commit
+
+    def __write__(self, converted, progress):
+        while True:
+            chunk = converted.get()
+            if chunk is None:
+                break
+            for i, record_id, graphs, error, pending in chunk:
+                if error is not None:
+                    progress.done(i, record_id, 'convert', error)
+                    continue
+                try:
+                    for url, turtle in graphs:
+                        self.write(url, turtle)
+                except Exception as error:
+                    progress.done(i, record_id, 'write', repr(error))
+                    continue
+                if pending is not None and self.commit is not None:
+                    try:
+                        self.commit(pending)
+                    except Exception as error:
+                        progress.done(i, record_id, 'commit', repr(error))
+                        continue
+                progress.done(i, record_id)
+
+    def run(self, marc_filepath, start=0, stop=None):
+        """Ingests every record of a MARC21 file, or a range of its records
+        to resume a batch or ingest one partition of the file
+
+        Args:
+            marc_filepath -- File path of the MARC21 file
+            start -- Position of the first record, defaults to 0
+            stop -- Position after the last record, defaults to the end
+        Returns:
+            ProgressReport
+        Raises:
+            RuntimeError -- If the reader fails before the end of the file,
+                            after the records it read are finished
+        """
+        context = multiprocessing.get_context()
+        tasks = context.Queue(self.queue_size)
+        results = context.Queue(self.queue_size)
+        converted = queue.Queue(self.queue_size)
+        progress = ProgressReport(self.error_path, start=start)
+        reader = context.Process(
+            target=__read__,
+            args=(marc_filepath,
+                  tasks,
+                  self.workers,
+                  self.chunk_size,
+                  start,
+                  stop))
+        workers = [context.Process(
+                       target=__convert__,
+                       args=(self.factory, self.workspace, tasks, results))
+                   for i in range(self.workers)]
+        writers = [threading.Thread(
+                       target=self.__write__,
+                       args=(converted, progress))
+                   for i in range(self.writers)]
+        for process in [reader,] + workers:
+            process.daemon = True
+            process.start()
+        for thread in writers:
+            thread.start()
+        running = len(workers)
+        try:
+            while running > 0:
+                try:
+                    chunk = results.get(timeout=POLL_TIMEOUT)
+                except queue.Empty:
+                    if not any([worker.is_alive() for worker in workers]):
+                        break
+                    if reader.exitcode is not None and reader.exitcode < 0:
+                        # Reader was killed before stopping the workers
+                        self.__stop__(tasks, len(workers))
+                    continue
+                if chunk is None:
+                    running -= 1
+                    continue
+                converted.put(chunk)
+        finally:
+            for thread in writers:
+                converted.put(None)
+            for thread in writers:
+                thread.join()
+            for process in [reader,] + workers:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            progress.close()
+        if reader.exitcode != 0:
+            raise RuntimeError(
+                "Reading {} failed with exit code {} after {} records".format(
+                    marc_filepath,
+                    reader.exitcode,
+                    progress.completed))
+        return progress
+
+    def __stop__(self, tasks, workers):
+        for i in range(workers):
+            try:
+                tasks.put_nowait(None)
+            except queue.Full:
+                break
@@ -0,0 +1,221 @@
+"""Allocates the Fedora shard containers of new BIBFRAME entities from
+per-type counters kept in memory. Each counter is seeded once from Fedora and
+then persisted to a local JSON file or to Redis, so an ingest hands out slots
+without fetching the type and shard containers for every subject. Without
+Redis, the worker processes of a batch share one allocator served by an
+AllocatorManager.
+"""
+__author__ = "Jeremy Nelson"
+
+import json
+import os
+import rdflib
+import requests
+import threading
+from multiprocessing.managers import BaseManager
+from ..fetch import fetch_graph
+try:
+    import redis
+except ImportError:
+    redis = None
+
+FCREPO = rdflib.Namespace("http://fedora.info/definitions/v4/repository#")
+
+# Maximum number of children in a BIBFRAME type's shard container
+SHARD_SIZE = 5000
+
+# Allocations between writes of the local counters file
+FLUSH_EVERY = 100
+
+REDIS_PREFIX = "bibframe:shards"
+
+
+def count_allocated(type_url, shard_size=SHARD_SIZE, session=None):
+    """Function counts the slots already used in a BIBFRAME type's shard
+    containers, i.e. http://localhost:8080/rest/Work, by reading the type
+    container and only its last shard from Fedora.
+
+    Args:
+        type_url -- Fedora URL of the type container
+        shard_size -- Maximum number of children in a shard
+        session -- requests.Session, defaults to the requests module
+    Returns:
+        int -- Number of used slots, 0 if the type container doesn't exist
+    """
+    type_uri = rdflib.URIRef(type_url)
+    try:
+        type_graph = fetch_graph(type_uri, session=session)
+    except requests.HTTPError:
+        return 0
+    shards = [int(str(child).split("/")[-1]) for child in type_graph.objects(
+                  subject=type_uri,
+                  predicate=FCREPO.hasChild)
+              if str(child).split("/")[-1].isdigit()]
+    if len(shards) < 1:
+        return 0
+    last_shard = max(shards)
+    last_shard_uri = rdflib.URIRef("/".join([str(type_url), str(last_shard)]))
+    last_shard_graph = fetch_graph(last_shard_uri, session=session)
+    children = set(last_shard_graph.objects(
+        subject=last_shard_uri,
+        predicate=FCREPO.hasChild))
+    return (last_shard - 1) * shard_size + len(children)
+
+
+class ShardAllocator(object):
+    """Hands out the shard number of every new BIBFRAME entity from in memory
+    counters, safe to share across threads. With a Redis client the counters
+    are incremented atomically in Redis and can be shared by every process
+    of a batch.
+
+    >> allocator = ShardAllocator("http://localhost:8080", path="shards.json")
+    >> allocator.allocate("Work")
+    3
+    >> allocator.save()
+    """
+
+    def __init__(self,
+                 base_url,
+                 path=None,
+                 redis_client=None,
+                 shard_size=SHARD_SIZE,
+                 flush_every=FLUSH_EVERY,
+                 session=None,
+                 seed=True):
+        """Initializes the allocator, loading any counters saved in the local
+        file
+
+        Args:
+            base_url -- Fedora base URL, i.e. http://localhost:8080
+            path -- File path of the JSON counters, defaults to None
+            redis_client -- redis.StrictRedis or a redis:// URL, defaults
+                            to None
+            shard_size -- Maximum number of children in a shard
+            flush_every -- Allocations between writes of the counters file
+            session -- requests.Session used when seeding from Fedora
+            seed -- Seed new counters from Fedora, if False new counters
+                    start at 0 for offline transforms
+        """
+        self.base_url = base_url
+        self.path = path
+        if isinstance(redis_client, str):
+            if redis is None:
+                raise ValueError(
+                    "redis package is required for {}".format(redis_client))
+            redis_client = redis.StrictRedis.from_url(redis_client)
+        self.redis = redis_client
+        self.shard_size = int(shard_size)
+        self.flush_every = int(flush_every)
+        self.session = session
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.seeded = set()
+        self.pending = 0
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path) as counters_file:
+                self.counters.update(json.load(counters_file))
+
+    def __key__(self, bf_type, workspace=None):
+        if workspace is None:
+            return bf_type
+        return "/".join([workspace, bf_type])
+
+    def __seed__(self, key):
+        if not self.seed:
+            return 0
+        return count_allocated(
+            "/".join([self.base_url, "rest", key]),
+            self.shard_size,
+            self.session)
+
+    def __shard__(self, total):
+        return (total - 1) // self.shard_size + 1
+
+    def __redis_allocate__(self, key):
+        redis_key = ":".join([REDIS_PREFIX, key])
+        if key not in self.seeded:
+            if not self.redis.exists(redis_key):
+                self.redis.setnx(redis_key, self.__seed__(key))
+            self.seeded.add(key)
+        return self.__shard__(int(self.redis.incr(redis_key)))
+
+    def allocate(self, bf_type, workspace=None):
+        """Allocates a slot for a new entity and returns its shard, Fedora is
+        only read the first time a type is seen
+
+        Args:
+            bf_type -- BIBFRAME type, i.e. Work
+            workspace -- Fedora workspace, defaults to None
+        Returns:
+            int -- Shard number
+        """
+        key = self.__key__(bf_type, workspace)
+        if self.redis is not None:
+            return self.__redis_allocate__(key)
+        with self.lock:
+            if key not in self.counters:
+                self.counters[key] = self.__seed__(key)
+            self.counters[key] += 1
+            total = self.counters[key]
+            self.pending += 1
+            if self.path is not None and self.pending >= self.flush_every:
+                self.__save__()
+        return self.__shard__(total)
+
+    def reset(self, bf_type=None, workspace=None):
+        """Drops a type's counter, or every counter, so it is seeded from
+        Fedora again on the next allocation
+
+        Args:
+            bf_type -- BIBFRAME type, defaults to None for every type
+            workspace -- Fedora workspace, defaults to None
+        """
+        with self.lock:
+            if bf_type is None:
+                keys = set(self.counters).union(self.seeded)
+            else:
+                keys = set([self.__key__(bf_type, workspace)])
+            for key in keys:
+                self.counters.pop(key, None)
+                self.seeded.discard(key)
+                if self.redis is not None:
+                    self.redis.delete(":".join([REDIS_PREFIX, key]))
+            if self.path is not None:
+                self.__save__()
+
+    def __save__(self):
+        # Caller holds the lock
+        temp_path = "{}.tmp".format(self.path)
+        with open(temp_path, "w") as counters_file:
+            json.dump(self.counters, counters_file)
+        os.replace(temp_path, self.path)
+        self.pending = 0
+
+    def save(self):
+        """Writes the counters to the local file"""
+        if self.path is None:
+            return
+        with self.lock:
+            self.__save__()
+
+
+class AllocatorManager(BaseManager):
+    """Serves a single ShardAllocator to every worker process of a batch, so
+    workers without Redis neither hand out the same slots nor write the
+    counters file at the same time.
+
+    >> manager = AllocatorManager()
+    >> manager.start()
+    >> allocator = manager.ShardAllocator("http://localhost:8080",
+                                          path="shards.json")
+    >> allocator.allocate("Work")
+    3
+    >> manager.shutdown()
+    """
+    pass
+
+AllocatorManager.register(
+    'ShardAllocator',
+    ShardAllocator,
+    exposed=('allocate', 'reset', 'save'))
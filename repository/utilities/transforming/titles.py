@@ -0,0 +1,143 @@
+"""Matches BIBFRAME Titles against the MongoDB bibframe.Title collection with
+a single $or query on indexed fields, ranking the candidates client-side in
+the same priority as the original sequence of find_one queries. The title
+value alone matches too many Titles to rank, so it is queried only after
+the other strategies miss.
+"""
+__author__ = "Jeremy Nelson"
+
+from pymongo import ASCENDING
+from ..cache import LRUCache
+
+# Recent title matches kept for a batch
+TITLE_CACHE_SIZE = 10000
+
+# Indexes backing every matching strategy
+TITLE_INDEXES = [
+    [("authorizedAccessPoint", ASCENDING)],
+    [("titleValue", ASCENDING), ("subtitle", ASCENDING)],
+    [("label", ASCENDING)],
+    [("@id", ASCENDING)]]
+
+MATCH_FIELDS = ["authorizedAccessPoint", "titleValue", "subtitle", "label", "@id"]
+
+# Maximum candidates ranked for a Title, i.e. common labels like Poems
+MATCH_LIMIT = 1000
+
+
+class TitleMatcher(object):
+    """Finds the MongoDB id of an existing Title by, in priority order, its
+    authorized access point, title value and subtitle, label, @id and
+    finally title value alone.
+
+    >> matcher = TitleMatcher(MongoClient().bibframe.Title)
+    >> matcher.match(authorizedAccessPoint="Russell Crowe :",
+                     titleValue="Russell Crowe",
+                     subtitle="",
+                     label="Russell Crowe",
+                     id="http://catalog/1234title5")
+    ObjectId('...')
+    """
+
+    def __init__(self, collection, cache_size=TITLE_CACHE_SIZE):
+        """Initializes the matcher and ensures the collection's indexes
+        exist
+
+        Args:
+            collection -- pymongo.Collection of Titles
+            cache_size -- Number of recent matches cached
+        """
+        self.collection = collection
+        self.cache = LRUCache(cache_size)
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Creates any missing index used by the $or query"""
+        for keys in TITLE_INDEXES:
+            self.collection.create_index(keys)
+
+    def __strategies__(self, values):
+        strategies = []
+        if values['authorizedAccessPoint']:
+            strategies.append(
+                {"authorizedAccessPoint": values['authorizedAccessPoint']})
+        if values['titleValue'] and values['subtitle']:
+            strategies.append({"titleValue": values['titleValue'],
+                               "subtitle": values['subtitle']})
+        if values['label']:
+            strategies.append({"label": values['label']})
+        if values['@id']:
+            strategies.append({"@id": values['@id']})
+        return strategies
+
+    def __rank__(self, document, strategies):
+        for i, strategy in enumerate(strategies):
+            if all([document.get(field) == value
+                    for field, value in strategy.items()]):
+                return i
+        return len(strategies)
+
+    def __key__(self, values):
+        return tuple([values[field] for field in MATCH_FIELDS])
+
+    def __values__(self, kwargs):
+        values = dict([(field, kwargs.get(field) or "")
+                       for field in MATCH_FIELDS])
+        values['@id'] = str(kwargs.get('id') or kwargs.get('@id') or "")
+        return values
+
+    def add(self, title_id, **kwargs):
+        """Caches a newly added Title so later records in the batch match it
+
+        Args:
+            title_id -- MongoDB id of the Title
+            kwargs -- Title values, see match
+        """
+        self.cache.set(self.__key__(self.__values__(kwargs)), title_id)
+
+    def match(self, **kwargs):
+        """Returns the MongoDB id of the best matching Title or None
+
+        Args:
+            authorizedAccessPoint -- Title's authorized access point
+            titleValue -- Title's value
+            subtitle -- Title's subtitle
+            label -- Title's label
+            id -- Title's subject
+        """
+        values = self.__values__(kwargs)
+        key = self.__key__(values)
+        title_id = self.cache.get(key)
+        if title_id is not None:
+            return title_id
+        strategies = self.__strategies__(values)
+        projection = dict([(field, 1) for field in MATCH_FIELDS])
+        best, best_rank, seen = None, len(strategies), 0
+        if len(strategies) > 0:
+            for document in self.collection.find(
+                    {"$or": strategies},
+                    projection).limit(MATCH_LIMIT):
+                seen += 1
+                rank = self.__rank__(document, strategies)
+                if rank < best_rank:
+                    best, best_rank = document, rank
+                    if rank == 0:
+                        break
+        if seen >= MATCH_LIMIT and best_rank > 0:
+            # Candidates were cut off, a stronger match may not have been
+            # seen so the stronger strategies are tried one at a time
+            for strategy in strategies[:best_rank]:
+                document = self.collection.find_one(strategy, projection)
+                if document is not None:
+                    best = document
+                    break
+        if best is None and values['titleValue']:
+            # Title value alone is the weakest match and is only tried when
+            # every other strategy misses
+            best = self.collection.find_one(
+                {"titleValue": values['titleValue']},
+                projection)
+        if best is None:
+            return None
+        self.cache.set(key, best['_id'])
+        return best['_id']
@@ -0,0 +1,366 @@
+"""Client and server for the MARC2BIBFRAME xquery service. Framed
+connections stay open between requests: every request and response is
+prefixed with its length so a pooled socket can carry many MARC-XML records,
+or collections of records, and the RDF/XML returned for a collection is split
+back into a graph per record.
+
+Request frame:  4 byte big-endian payload length, MARC-XML payload
+Response frame: 1 byte status (0 ok, 1 error), 4 byte big-endian payload
+                length, RDF/XML or error message payload
+"""
+__author__ = "Jeremy Nelson"
+
+import argparse
+import os
+import queue
+import rdflib
+import socket
+import socketserver
+import struct
+import subprocess
+import tempfile
+
+BIBFRAME_NS = rdflib.Namespace('http://bibframe.org/vocab/')
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+
+REQUEST_HEADER = struct.Struct("!I")
+RESPONSE_HEADER = struct.Struct("!BI")
+
+STATUS_OK, STATUS_ERROR = 0, 1
+
+# Bytes read from a socket at a time
+BUFFER_SIZE = 256 * 1024
+
+# Open connections kept by a client for reuse
+POOL_SIZE = 4
+
+
+class XQueryError(Exception):
+    """Raised when the xquery service fails to convert MARC-XML"""
+    pass
+
+
+def marc_collection(records):
+    """Function wraps many MARC records in a MARC-XML collection
+
+    Args:
+        records -- iterable of pymarc.Record or MARC-XML record bytes
+    Returns:
+        bytes -- MARC-XML collection
+    """
+    # Deferred so the server can run without pymarc
+    import pymarc
+    output = ['<collection xmlns="{}">'.format(MARC_NS).encode()]
+    for record in records:
+        if isinstance(record, bytes):
+            output.append(record)
+        else:
+            output.append(pymarc.record_to_xml(record, namespace=True))
+    output.append(b"</collection>")
+    return b"".join(output)
+
+
+def split_by_record(graph, control_numbers):
+    """Function splits a BIBFRAME graph converted from a collection into a
+    graph for each record. A record's resources are the subjects derived
+    from the record, i.e. bf:derivedFrom <http://catalog/123.marcxml.xml>,
+    and every subject reachable from them. Records are told apart by their
+    001, so the control numbers must be unique.
+
+    Args:
+        graph -- rdflib.Graph of the collection
+        control_numbers -- list of each record's 001
+    Returns:
+        list -- rdflib.Graph for each record, in the same order
+    """
+    positions = dict((str(number), i) for i, number in enumerate(
+        control_numbers))
+    graphs = [rdflib.Graph() for number in control_numbers]
+    for prefix, namespace in graph.namespaces():
+        for record_graph in graphs:
+            record_graph.bind(prefix, namespace)
+    assigned = dict()
+    for subject, marc in graph.subject_objects(
+            predicate=BIBFRAME_NS.derivedFrom):
+        number = str(marc).split("/")[-1].split(".")[0]
+        if number in positions:
+            assigned[subject] = positions[number]
+    pending = list(assigned.items())
+    while len(pending) > 0:
+        subject, position = pending.pop()
+        for obj in graph.objects(subject=subject):
+            if isinstance(obj, rdflib.Literal) or obj in assigned:
+                continue
+            if (obj, None, None) in graph:
+                assigned[obj] = position
+                pending.append((obj, position))
+    for subject, predicate, obj in graph:
+        position = assigned.get(subject)
+        if position is not None:
+            graphs[position].add((subject, predicate, obj))
+    return graphs
+
+
+def read_exactly(connection, size, buffer_size=BUFFER_SIZE):
+    """Function reads an exact number of bytes from a socket into a single
+    preallocated buffer
+
+    Args:
+        connection -- socket.socket
+        size -- Number of bytes
+        buffer_size -- Maximum bytes per recv
+    Returns:
+        bytes
+    Raises:
+        ConnectionError -- If the socket closes early
+    """
+    payload = bytearray(size)
+    view = memoryview(payload)
+    received = 0
+    while received < size:
+        count = connection.recv_into(
+            view[received:],
+            min(size - received, buffer_size))
+        if count == 0:
+            raise ConnectionError("xquery connection closed")
+        received += count
+    return bytes(payload)
+
+
+class XQueryClient(object):
+    """Pool of connections to the MARC2BIBFRAME xquery service, safe to share
+    across threads.
+
+    >> client = XQueryClient("localhost", 8089, framed=True)
+    >> graph = client.convert(pymarc.record_to_xml(record, namespace=True))
+    >> graphs = client.convert_many(records)
+    """
+
+    def __init__(self,
+                 host='localhost',
+                 port=8089,
+                 framed=True,
+                 pool_size=POOL_SIZE,
+                 buffer_size=BUFFER_SIZE,
+                 timeout=None):
+        """Initializes the client
+
+        Args:
+            host -- xquery service host, defaults to localhost
+            port -- xquery service port, defaults to 8089
+            framed -- Use the framed protocol on pooled connections, if False
+                      sends a newline terminated record and reads until the
+                      service closes the connection
+            pool_size -- Maximum idle connections kept open
+            buffer_size -- Maximum bytes per recv
+            timeout -- Socket timeout in seconds, defaults to None
+        """
+        self.host = host
+        self.port = int(port)
+        self.framed = framed
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(pool_size)
+
+    def __connect__(self):
+        connection = socket.create_connection(
+            (self.host, self.port),
+            self.timeout)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection
+
+    def __acquire__(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return self.__connect__()
+
+    def __release__(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def __request__(self, connection, marc_xml):
+        connection.sendall(REQUEST_HEADER.pack(len(marc_xml)) + marc_xml)
+        status, size = RESPONSE_HEADER.unpack(read_exactly(
+            connection,
+            RESPONSE_HEADER.size))
+        return status, read_exactly(connection, size, self.buffer_size)
+
+    def __framed__(self, marc_xml):
+        connection = self.__acquire__()
+        try:
+            status, payload = self.__request__(connection, marc_xml)
+        except (ConnectionError, struct.error):
+            # Pooled connection may have been closed by the service
+            connection.close()
+            connection = self.__connect__()
+            try:
+                status, payload = self.__request__(connection, marc_xml)
+            except:
+                connection.close()
+                raise
+        except:
+            connection.close()
+            raise
+        self.__release__(connection)
+        if status != STATUS_OK:
+            raise XQueryError(payload.decode(errors='replace'))
+        return payload
+
+    def __unframed__(self, marc_xml):
+        connection = self.__connect__()
+        try:
+            connection.sendall(marc_xml + b"\n")
+            chunks = []
+            while True:
+                data = connection.recv(self.buffer_size)
+                if not data:
+                    break
+                chunks.append(data)
+        finally:
+            connection.close()
+        return b"".join(chunks)
+
+    def close(self):
+        """Closes every pooled connection"""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def rdf_xml(self, marc_xml):
+        """Sends MARC-XML to the service and returns the RDF/XML
+
+        Args:
+            marc_xml -- MARC-XML record or collection bytes
+        Returns:
+            bytes
+        """
+        if self.framed:
+            return self.__framed__(marc_xml)
+        return self.__unframed__(marc_xml)
+
+    def convert(self, marc_xml):
+        """Converts a MARC-XML record to a BIBFRAME graph
+
+        Args:
+            marc_xml -- MARC-XML record bytes
+        Returns:
+            rdflib.Graph
+        """
+        bf_graph = rdflib.Graph()
+        bf_graph.parse(data=self.rdf_xml(marc_xml), format='xml')
+        return bf_graph
+
+    def convert_many(self, records, marc_xml=None):
+        """Converts many MARC records with a single request, returning a
+        BIBFRAME graph for each record. Records sharing a 001 with another
+        record of the chunk can't be split out of a collection's graph, so
+        each of them is converted with its own request.
+
+        Args:
+            records -- list of pymarc.Record, each with a 001
+            marc_xml -- list of the records' raw MARC-XML bytes, defaults
+                        to serializing the records
+        Returns:
+            list -- rdflib.Graph for each record
+        """
+        items = marc_xml or records
+        numbers = [record['001'].data for record in records]
+        unique = [position for position, number in enumerate(numbers)
+                  if numbers.count(number) < 2]
+        graphs = [None for record in records]
+        if len(unique) > 0:
+            bf_graph = self.convert(marc_collection(
+                [items[position] for position in unique]))
+            for position, graph in zip(unique, split_by_record(
+                    bf_graph,
+                    [numbers[position] for position in unique])):
+                graphs[position] = graph
+        for position, graph in enumerate(graphs):
+            if graph is None:
+                graphs[position] = self.convert(
+                    marc_collection([items[position]]))
+        return graphs
+
+
+class XQueryHandler(socketserver.BaseRequestHandler):
+    """Answers framed requests on a connection until the client closes it"""
+
+    def handle(self):
+        while True:
+            try:
+                header = read_exactly(self.request, REQUEST_HEADER.size)
+            except ConnectionError:
+                break
+            size, = REQUEST_HEADER.unpack(header)
+            marc_xml = read_exactly(self.request, size)
+            try:
+                status, payload = STATUS_OK, self.server.convert(marc_xml)
+            except Exception as error:
+                status, payload = STATUS_ERROR, str(error).encode()
+            self.request.sendall(
+                RESPONSE_HEADER.pack(status, len(payload)) + payload)
+
+
+class XQueryServer(socketserver.ThreadingTCPServer):
+    """Framed xquery service, each connection is handled by a thread calling
+    convert with the MARC-XML of a request and returning RDF/XML.
+
+    >> server = XQueryServer(("localhost", 8089), saxon_convert(jar, xqy))
+    >> server.serve_forever()
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, convert):
+        self.convert = convert
+        socketserver.ThreadingTCPServer.__init__(self, address, XQueryHandler)
+
+
+def saxon_convert(jar_location, xqy_location, baseuri='http://catalog/'):
+    """Function returns a convert callable that runs Library of Congress's
+    MARC2BIBFRAME saxon.xqy with Saxon on MARC-XML
+
+    Args:
+        jar_location -- Complete path to Saxon jar file
+        xqy_location -- Complete path to saxon.xqy from bibframe
+        baseuri -- Base URI, defaults to http://catalog/
+    """
+    def convert(marc_xml):
+        with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as marc:
+            marc.write(marc_xml)
+        try:
+            return subprocess.check_output([
+                'java',
+                '-cp', jar_location,
+                'net.sf.saxon.Query',
+                xqy_location,
+                'marcxmluri={}'.format(marc.name),
+                'baseuri={}'.format(baseuri),
+                'serialization=rdfxml'])
+        finally:
+            os.remove(marc.name)
+    return convert
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Framed MARC2BIBFRAME xquery service")
+    parser.add_argument('jar_location')
+    parser.add_argument('xqy_location')
+    parser.add_argument('--baseuri', default='http://catalog/')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+    server = XQueryServer(
+        (args.host, args.port),
+        saxon_convert(args.jar_location, args.xqy_location, args.baseuri))
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmarks parsing the Library of Congress sample BIBFRAME graphs used in
+tests/bibframe.py as N-Triples with the streaming line parser used by
+fetch_graph, against rdflib's Turtle and RDF/XML parsers.
+
+    python tests/benchmark_fetch.py [repetitions]
+"""
+__author__ = "Jeremy Nelson"
+
+import ast
+import io
+import os
+import rdflib
+import sys
+import timeit
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(TEST_DIR))
+from repository.utilities.fetch import GraphSink
+
+
+def loc_sample_graphs():
+    """Function returns the LOC sample graphs, the Turtle constants are read
+    from tests/bibframe.py without importing that module's test
+    dependencies"""
+    graphs = {}
+    with open(os.path.join(TEST_DIR, 'bibframe.py')) as bibframe_tests:
+        module = ast.parse(bibframe_tests.read())
+    for node in module.body:
+        if isinstance(node, ast.Assign) and \
+           isinstance(node.value, ast.Constant) and \
+           isinstance(node.value.value, str):
+            name = node.targets[0].id
+            graphs[name] = rdflib.Graph().parse(
+                data=node.value.value,
+                format='turtle')
+    graphs['africa-in-the-world.rdf'] = rdflib.Graph().parse(
+        os.path.join(TEST_DIR, 'africa-in-the-world.rdf'),
+        format='xml')
+    return graphs
+
+
+def stream_ntriples(raw):
+    graph = rdflib.Graph()
+    NTriplesParser(GraphSink(graph)).parse(io.BytesIO(raw))
+    return graph
+
+
+def main(repetitions=200):
+    for name, graph in sorted(loc_sample_graphs().items()):
+        print("{} ({} triples)".format(name, len(graph)))
+        serializations = [
+            ("n-triples (streaming)", graph.serialize(format='nt'),
+             stream_ntriples),
+            ("turtle", graph.serialize(format='turtle'),
+             lambda raw: rdflib.Graph().parse(data=raw, format='turtle')),
+            ("rdf/xml", graph.serialize(format='xml'),
+             lambda raw: rdflib.Graph().parse(data=raw, format='xml'))]
+        for label, raw, parser in serializations:
+            seconds = timeit.timeit(
+                lambda: parser(raw),
+                number=repetitions)
+            print("\t{:<22} {:>8.3f} ms per parse".format(
+                label,
+                seconds / repetitions * 1000.0))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
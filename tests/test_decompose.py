@@ -0,0 +1,93 @@
+#-------------------------------------------------------------------------------
+# Name:         test_decompose
+# Purpose:      Unit tests for decomposing BIBFRAME graphs into Fedora graphs
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import rdflib
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.dedup import AuthorityIndex
+from repository.utilities.transforming.marc2ds import MARC21toBIBFRAMEIngester
+
+BF = rdflib.Namespace("http://bibframe.org/vocab/")
+CATALOG = rdflib.Namespace("http://catalog/")
+FEDORA_BASE = "http://localhost:8080"
+
+
+class FakeFedora(object):
+    """Fails on any call, URIs are minted without Fedora"""
+
+    base_url = FEDORA_BASE
+
+    def create(self, *args):
+        raise AssertionError("Fedora create called")
+
+
+class FakeShards(object):
+
+    def __init__(self):
+        self.allocated = []
+
+    def allocate(self, bf_type, workspace=None):
+        self.allocated.append(bf_type)
+        return 7
+
+    def save(self):
+        pass
+
+
+def bibframe_graph(title="Hamlet"):
+    graph = rdflib.Graph()
+    graph.add((CATALOG.work1, rdflib.RDF.type, BF.Work))
+    graph.add((CATALOG.work1, BF.title, CATALOG.title1))
+    graph.add((CATALOG.title1, rdflib.RDF.type, BF.Title))
+    graph.add((CATALOG.title1, BF.titleValue, rdflib.Literal(title)))
+    graph.add((CATALOG.instance1, rdflib.RDF.type, BF.Instance))
+    graph.add((CATALOG.instance1, BF.instanceOf, CATALOG.work1))
+    graph.add((CATALOG.instance1, rdflib.RDFS.label, rdflib.Literal("Hamlet")))
+    return graph
+
+
+class TestDecompose(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = FakeShards()
+        self.ingester = MARC21toBIBFRAMEIngester(
+            fedora=FakeFedora(),
+            shards=self.shards,
+            authorities=AuthorityIndex())
+
+    def test_sharded_uris(self):
+        graphs = self.ingester.__decompose_bf_graph__(bibframe_graph())
+        self.assertEqual(len(graphs), 3)
+        self.assertEqual(sorted(self.shards.allocated),
+                         ["Instance", "Title", "Work"])
+        for graph in graphs:
+            subject = str(next(graph.subjects()))
+            type_of = str(next(graph.objects(predicate=rdflib.RDF.type)))
+            self.assertTrue(subject.startswith("{}/rest/{}/7/".format(
+                FEDORA_BASE,
+                type_of.split("/")[-1])))
+        work = [graph for graph in graphs
+                if (None, rdflib.RDF.type, BF.Work) in graph][0]
+        title_uri = next(work.objects(predicate=BF.title))
+        self.assertTrue(str(title_uri).startswith(
+            "{}/rest/Title/7/".format(FEDORA_BASE)))
+
+    def test_instances_not_merged(self):
+        first = self.ingester.__decompose_bf_graph__(bibframe_graph())
+        second = self.ingester.__decompose_bf_graph__(
+            bibframe_graph("Hamlet, Prince of Denmark"))
+        def instance(graphs):
+            return [next(graph.subjects()) for graph in graphs
+                    if (None, rdflib.RDF.type, BF.Instance) in graph][0]
+        self.assertNotEqual(instance(first), instance(second))
+        self.assertEqual(self.shards.allocated.count("Instance"), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#-------------------------------------------------------------------------------
+# Name:         test_dedup
+# Purpose:      Unit tests for bib number and authority deduplication
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import pymarc
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.dedup import AuthorityIndex, BibNumberMap
+from repository.utilities.dedup import iii_bib_number, normalize_heading
+
+FEDORA_URL = "http://localhost:8080/rest/{}"
+
+
+class FakeElasticsearch(object):
+    """Answers terms queries on rdfs:label from a list of marc documents"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.searches = []
+
+    def search(self, index, body):
+        self.searches.append(body)
+        labels = body["query"]["terms"]["rdfs:label"]
+        hits = [{"_source": document} for document in self.documents
+                if document["rdfs:label"][0].startswith(tuple(labels))]
+        return {"hits": {"total": len(hits), "hits": hits}}
+
+
+class TestBibNumberMap(unittest.TestCase):
+
+    def setUp(self):
+        self.elastic_search = FakeElasticsearch([
+            {"rdfs:label": ["b1000001"],
+             "owl:sameAs": [FEDORA_URL.format(1)]},
+            {"rdfs:label": ["b10000021"],
+             "owl:sameAs": [FEDORA_URL.format(21)]},
+            {"rdfs:label": ["b1000002"],
+             "owl:sameAs": FEDORA_URL.format(2)}])
+        self.bib_numbers = BibNumberMap(self.elastic_search, chunk_size=2)
+
+    def test_iii_bib_number(self):
+        record = pymarc.Record()
+        self.assertIsNone(iii_bib_number(record))
+        record.add_field(pymarc.Field(
+            tag='907',
+            indicators=[' ', ' '],
+            subfields=[pymarc.Subfield('a', '.b10000019')]))
+        self.assertEqual(iii_bib_number(record), 'b1000001')
+
+    def test_resolve(self):
+        self.bib_numbers.resolve(["b1000001", "b1000002", "b1000003", None])
+        self.assertEqual(len(self.elastic_search.searches), 2)
+        self.assertEqual(self.bib_numbers.get("b1000001"), FEDORA_URL.format(1))
+        self.assertEqual(self.bib_numbers.get("b1000002"), FEDORA_URL.format(2))
+        self.assertIsNone(self.bib_numbers.get("b1000003"))
+        # Resolved bib numbers, found or not, are never searched again
+        self.assertEqual(len(self.elastic_search.searches), 2)
+
+    def test_add(self):
+        self.bib_numbers.add("b1000004", FEDORA_URL.format(4))
+        self.assertEqual(self.bib_numbers.get("b1000004"), FEDORA_URL.format(4))
+        self.assertEqual(len(self.elastic_search.searches), 0)
+
+
+class AccessPointTripleStore(object):
+    """Returns bindings like TripleStore.__get_access_points__"""
+
+    def __init__(self):
+        self.bindings = [
+            {"subject": {"value": FEDORA_URL.format(1)},
+             "type": {"value": "http://bibframe.org/vocab/Person"},
+             "value": {"value": "Crowe, Russell, 1964-"}},
+            {"subject": {"value": FEDORA_URL.format(2)},
+             "type": {"value": "http://www.loc.gov/mads/rdf/v1#Topic"},
+             "value": {"value": "Actors"}}]
+
+    def __get_access_points__(self, offset=0, limit=10000):
+        return self.bindings[offset:offset+limit]
+
+
+class TestAuthorityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "authorities.db")
+        self.authorities = AuthorityIndex(self.path)
+
+    def test_normalize_heading(self):
+        self.assertEqual(
+            normalize_heading("Brontë, Charlotte,  1816-1855."),
+            "bronte charlotte 1816 1855")
+
+    def test_match(self):
+        self.authorities.add("Person", "Crowe, Russell", FEDORA_URL.format(1))
+        self.assertEqual(
+            self.authorities.match(["Person"], ["CROWE RUSSELL"]),
+            FEDORA_URL.format(1))
+        # Headings are scoped by type
+        self.assertIsNone(self.authorities.match(["Work"], ["Crowe, Russell"]))
+        self.assertIsNone(self.authorities.get("Person", "..."))
+
+    def test_not_authority(self):
+        self.authorities.add("Instance", "Hamlet", FEDORA_URL.format(3))
+        self.assertIsNone(self.authorities.match(["Instance"], ["Hamlet"]))
+        self.assertEqual(len(self.authorities), 0)
+
+    def test_shared(self):
+        other = AuthorityIndex(self.path)
+        self.authorities.add("Topic", "Actors", FEDORA_URL.format(2))
+        self.assertEqual(other.get("Topic", "actors"), FEDORA_URL.format(2))
+        other.connection.close()
+
+    def test_rebuild(self):
+        self.assertEqual(
+            self.authorities.rebuild(AccessPointTripleStore(), page_size=1),
+            2)
+        self.assertEqual(
+            AuthorityIndex(self.path).get("v1#Topic", "actors"),
+            FEDORA_URL.format(2))
+
+    def tearDown(self):
+        self.authorities.connection.close()
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#-------------------------------------------------------------------------------
+# Name:         test_expansion
+# Purpose:      Unit tests for expanding a Resource's graph and caching the
+#               expansion
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import configparser
+import falcon
+import falcon.testing
+import os
+import rdflib
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.resources.fedora import ResourceExpansion
+from repository.utilities.cache import MemberCache
+from repository.utilities.namespaces import BF
+from tests.test_offline import JSON_LD
+
+NEIGHBOURHOOD_TURTLE = """@prefix bf: <http://bibframe.org/vocab/> .
+@prefix fedora: <http://fedora.info/definitions/v4/repository#> .
+
+<http://localhost:8080/rest/work> a bf:Work ;
+    fedora:hasParent <http://localhost:8080/rest> ;
+    bf:workTitle <http://localhost:8080/rest/title> ;
+    bf:creator <http://localhost:8080/rest/person> .
+
+<http://localhost:8080/rest/title> a bf:Title ;
+    bf:titleValue "Russell Crowe" .
+
+<http://localhost:8080/rest/person> a bf:Person ;
+    bf:label "Clarkson, Wensley" ;
+    bf:hasAuthority <http://localhost:8080/rest/authority> .
+
+<http://localhost:8080/rest/authority> bf:label "Clarkson, Wensley" ."""
+
+
+class NeighbourhoodTripleStore(object):
+    """Answers TripleStore.__neighbourhood__ from a local graph"""
+
+    def __init__(self):
+        self.graph = rdflib.Graph().parse(
+            data=NEIGHBOURHOOD_TURTLE,
+            format='turtle')
+        self.queries = []
+
+    def __neighbourhood__(self, subjects):
+        self.queries.append(subjects)
+        graph = rdflib.Graph()
+        for subject in subjects:
+            for triple in self.graph.triples((subject, None, None)):
+                graph.add(triple)
+        return graph
+
+
+class TestResourceExpansion(unittest.TestCase):
+
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "FEDORA": {"host": "localhost", "port": "8080"},
+            "ELASTICSEARCH": {"host": "localhost", "port": "9200"}})
+        self.expansion = ResourceExpansion(config)
+        self.triplestore = NeighbourhoodTripleStore()
+        self.expansion.searcher.triplestore = self.triplestore
+
+    def test_depth(self):
+        graph, members = self.expansion.__expand__(
+            "http://localhost:8080/rest/work", 
+            1)
+        self.assertEqual(members, set([
+            "http://localhost:8080/rest/work",
+            "http://localhost:8080/rest/title",
+            "http://localhost:8080/rest/person"]))
+        # One query per hop and Fedora's hasParent isn't followed
+        self.assertEqual(len(self.triplestore.queries), 2)
+        self.assertEqual(len(graph), 9)
+
+    def test_depth_zero(self):
+        self.expansion.searcher.registry.add(
+            "work", 
+            "http://localhost:8080/rest/work")
+        api = falcon.API()
+        api.add_route("/Resource/{id}/expand", self.expansion)
+        client = falcon.testing.TestClient(api)
+        result = client.simulate_get(
+            "/Resource/work/expand",
+            params={"depth": "0"},
+            headers={"Accept": "application/n-quads"})
+        self.assertEqual(result.status_code, 200)
+        # Only the root Resource is expanded
+        self.assertEqual(len(self.triplestore.queries), 1)
+        result = client.simulate_get(
+            "/Resource/work/expand",
+            params={"depth": "-1"},
+            headers={"Accept": "application/n-quads"})
+        self.assertEqual(result.status_code, 400)
+
+    def test_negotiation(self):
+        self.expansion.searcher.registry.add(
+            "work", 
+            "http://localhost:8080/rest/work")
+        api = falcon.API()
+        api.add_route("/Resource/{id}/expand", self.expansion)
+        client = falcon.testing.TestClient(api)
+        for headers, mimetype in [({"Accept": "*/*"}, "application/ld+json"),
+                                  (None, "application/ld+json"),
+                                  ({"Accept": "application/n-quads"},
+                                   "application/n-quads")]:
+            if not JSON_LD and mimetype == "application/ld+json":
+                continue
+            result = client.simulate_get(
+                "/Resource/work/expand",
+                headers=headers)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(result.headers['content-type'], mimetype)
+        result = client.simulate_get(
+            "/Resource/work/expand",
+            headers={"Accept": "text/html"})
+        self.assertEqual(result.status_code, 406)
+
+    def test_predicates(self):
+        graph, members = self.expansion.__expand__(
+            "http://localhost:8080/rest/work", 
+            2,
+            frozenset([BF.creator, BF.hasAuthority]))
+        self.assertEqual(members, set([
+            "http://localhost:8080/rest/work",
+            "http://localhost:8080/rest/person",
+            "http://localhost:8080/rest/authority"]))
+
+
+class TestMemberCache(unittest.TestCase):
+
+    def test_invalidate(self):
+        cache = MemberCache()
+        cache.set("work", "expanded work", ["work", "title", "person"])
+        cache.set("person", "expanded person", ["person"])
+        cache.set("title", "expanded title", ["title"])
+        cache.invalidate("person")
+        self.assertIsNone(cache.get("work"))
+        self.assertIsNone(cache.get("person"))
+        self.assertEqual(cache.get("title"), "expanded title")
+        self.assertEqual(cache.keys_by_member, {"title": set(["title"])})
+
+    def test_evict(self):
+        cache = MemberCache(1)
+        cache.set("work", "expanded work", ["work", "title"])
+        cache.set("title", "expanded title", ["title"])
+        self.assertIsNone(cache.get("work"))
+        self.assertEqual(cache.keys_by_member, {"title": set(["title"])})
+
+if __name__ == '__main__':
+    unittest.main()
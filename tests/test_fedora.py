@@ -0,0 +1,138 @@
+#-------------------------------------------------------------------------------
+# Name:         test_fedora
+# Purpose:      Unit tests for the Fedora Resource helper functions
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import configparser
+import falcon
+import falcon.testing
+import json
+import os
+import rdflib
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.resources.fedora import Container, LRUCache
+from repository.resources.fedora import etag_matches, preferred_mimetype
+from repository.resources.fedora import representation_etag, serialize
+from tests.test_offline import JSON_LD
+
+CHILD_URL = "http://localhost:8080/rest/works/{:03d}"
+
+
+class ChildrenTripleStore(object):
+    """Answers TripleStore.__get_children__ for a container of 25 children"""
+
+    def __init__(self):
+        self.children = [CHILD_URL.format(i) for i in range(25)]
+        self.pages = 0
+
+    def __get_children__(self, container_url, after="", limit=100):
+        self.pages += 1
+        return [{"child": {"value": child}, "uuid": {"value": child[-3:]}}
+                for child in self.children if child > after][:limit]
+
+
+class TestConditionalGet(unittest.TestCase):
+
+    def test_representation_etag(self):
+        self.assertEqual(
+            representation_etag('W/"0fe1"', 'turtle'),
+            'W/"0fe1-turtle"')
+        self.assertEqual(
+            representation_etag('"0fe1"', 'nt'),
+            '"0fe1-nt"')
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('W/"0fe1-nt"', '"0fe1-nt"'))
+        self.assertTrue(etag_matches('"a", W/"0fe1-nt"', 'W/"0fe1-nt"'))
+        self.assertTrue(etag_matches('*', 'W/"0fe1-nt"'))
+        self.assertFalse(etag_matches('W/"0fe1-turtle"', 'W/"0fe1-nt"'))
+        self.assertFalse(etag_matches(None, 'W/"0fe1-nt"'))
+
+
+class SerializedResource(object):
+
+    serializations = LRUCache(10)
+
+
+class TestNegotiation(unittest.TestCase):
+
+    MIMETYPES = ['application/ld+json', 'text/turtle', 'application/rdf+xml']
+
+    def __prefers__(self, accept=None):
+        headers = {}
+        if accept is not None:
+            headers["Accept"] = accept
+        return preferred_mimetype(
+            falcon.Request(falcon.testing.create_environ(headers=headers)),
+            self.MIMETYPES)
+
+    def test_default(self):
+        # falcon prefers the last of equally acceptable mimetypes
+        self.assertEqual(self.__prefers__(), 'application/ld+json')
+        self.assertEqual(self.__prefers__('*/*'), 'application/ld+json')
+        self.assertEqual(self.__prefers__('text/*'), 'text/turtle')
+
+    def test_preferred(self):
+        self.assertEqual(
+            self.__prefers__('application/rdf+xml, text/turtle;q=0.5'),
+            'application/rdf+xml')
+        self.assertIsNone(self.__prefers__('image/png'))
+
+    def test_serialize(self):
+        graph = rdflib.Graph()
+        graph.add((rdflib.URIRef("http://localhost:8080/rest/work"),
+                   rdflib.RDFS.label,
+                   rdflib.Literal("Hamlet")))
+        for accept, mimetype in [("text/turtle", "text/turtle"),
+                                 ("*/*", "application/ld+json")]:
+            if not JSON_LD and mimetype == "application/ld+json":
+                continue
+            req = falcon.Request(falcon.testing.create_environ(
+                headers={"Accept": accept}))
+            req.context['rdf'] = graph
+            resp = falcon.Response()
+            serialize(req, resp, SerializedResource())
+            self.assertEqual(resp.content_type, mimetype)
+
+
+class TestContainer(unittest.TestCase):
+
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "FEDORA": {"host": "localhost", "port": "8080"},
+            "ELASTICSEARCH": {"host": "localhost", "port": "9200"}})
+        container = Container(config)
+        self.triplestore = ChildrenTripleStore()
+        container.searcher.triplestore = self.triplestore
+        api = falcon.API()
+        api.add_route("/Container", container)
+        self.client = falcon.testing.TestClient(api)
+
+    def test_page(self):
+        result = self.client.simulate_get(
+            "/Container",
+            params={"limit": "10", "after": CHILD_URL.format(9)})
+        page = json.loads(result.text)
+        self.assertEqual(len(page["ldp:contains"]), 10)
+        self.assertEqual(page["ldp:contains"][0]["fedora:uuid"], "010")
+        self.assertEqual(page["next"], CHILD_URL.format(19))
+        self.assertIn('rel=next', result.headers["link"])
+
+    def test_ndjson_all(self):
+        result = self.client.simulate_get(
+            "/Container",
+            params={"limit": "10", "all": "true"},
+            headers={"Accept": "application/x-ndjson"})
+        lines = result.text.splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[-1])["@id"], CHILD_URL.format(24))
+        self.assertEqual(self.triplestore.pages, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#-------------------------------------------------------------------------------
+# Name:         test_fetch
+# Purpose:      Unit tests for the fetch module
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import rdflib
+import requests
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.fetch import FALLBACK_ACCEPT, GraphCache
+from repository.utilities.fetch import fetch_graph
+
+WORK_TURTLE = """@prefix bf: <http://bibframe.org/vocab/> .
+
+<http://localhost/rest/work> a bf:Work ;
+    bf:label "Russell Crowe : the biography" ."""
+
+WORK_NTRIPLES = rdflib.Graph().parse(
+    data=WORK_TURTLE,
+    format='turtle').serialize(format='nt')
+
+WORK_ETAG = '"work-1"'
+
+
+class FakeFedoraHandler(BaseHTTPRequestHandler):
+    """Returns N-Triples only for /work, Turtle for /turtle, a binary
+    for /binary and a 406 for N-Triples from /strict"""
+
+    def do_GET(self):
+        accept = self.headers.get('Accept', '')
+        if self.path == '/work' and \
+           self.headers.get('If-None-Match') == WORK_ETAG:
+            self.requests.append((self.path, 'If-None-Match'))
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path == '/work' and 'application/n-triples' in accept:
+            body, mimetype = WORK_NTRIPLES, 'application/n-triples'
+        elif self.path == '/strict' and 'application/n-triples' in accept:
+            self.requests.append((self.path, accept))
+            self.send_error(406)
+            return
+        elif self.path in ['/work', '/turtle', '/strict']:
+            body, mimetype = WORK_TURTLE.encode(), 'text/turtle'
+        elif self.path == '/binary':
+            body, mimetype = b'\x89PNG', 'image/png'
+        else:
+            self.send_error(404)
+            return
+        self.requests.append((self.path, accept))
+        self.send_response(200)
+        self.send_header('Content-Type', mimetype)
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/work':
+            self.send_header('ETag', WORK_ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RecordingSession(requests.Session):
+    """Keeps every response so tests can check what was read"""
+
+    def __init__(self):
+        super(RecordingSession, self).__init__()
+        self.responses = []
+
+    def get(self, url, **kwargs):
+        response = super(RecordingSession, self).get(url, **kwargs)
+        self.responses.append(response)
+        return response
+
+
+class TestFetchGraph(unittest.TestCase):
+
+    def setUp(self):
+        FakeFedoraHandler.requests = []
+        self.server = HTTPServer(('localhost', 0), FakeFedoraHandler)
+        self.base_url = "http://localhost:{}".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def test_ntriples(self):
+        graph = fetch_graph(self.base_url + '/work')
+        self.assertEqual(len(graph), 2)
+        self.assertEqual(len(FakeFedoraHandler.requests), 1)
+        self.assertEqual(
+            str(graph.value(
+                subject=rdflib.URIRef('http://localhost/rest/work'),
+                predicate=rdflib.URIRef('http://bibframe.org/vocab/label'))),
+            "Russell Crowe : the biography")
+
+    def test_turtle_fallback(self):
+        graph = fetch_graph(self.base_url + '/turtle')
+        self.assertEqual(len(graph), 2)
+        self.assertEqual(len(FakeFedoraHandler.requests), 2)
+
+    def test_not_acceptable_fallback(self):
+        graph = fetch_graph(self.base_url + '/strict')
+        self.assertEqual(len(graph), 2)
+        self.assertEqual(
+            [accept for path, accept in FakeFedoraHandler.requests],
+            ['application/n-triples', FALLBACK_ACCEPT])
+
+    def test_missing(self):
+        self.assertRaises(
+            requests.HTTPError,
+            fetch_graph,
+            self.base_url + '/missing')
+
+    def test_existing_graph(self):
+        graph = rdflib.Graph()
+        self.assertIs(fetch_graph(self.base_url + '/work', graph), graph)
+        self.assertEqual(len(graph), 2)
+
+    def test_binary(self):
+        self.assertRaises(
+            rdflib.plugin.PluginException,
+            fetch_graph,
+            self.base_url + '/binary')
+
+    def test_binary_not_read(self):
+        session = RecordingSession()
+        self.assertRaises(
+            rdflib.plugin.PluginException,
+            fetch_graph,
+            self.base_url + '/binary',
+            session=session)
+        self.assertEqual(len(session.responses), 2)
+        for response in session.responses:
+            self.assertFalse(response._content_consumed)
+            self.assertTrue(response.raw.closed)
+
+    def test_graph_cache(self):
+        graphs = GraphCache()
+        etag, graph = graphs.get(self.base_url + '/work')
+        self.assertEqual(etag, WORK_ETAG)
+        self.assertEqual(len(graph), 2)
+        self.assertIs(graphs.get(self.base_url + '/work')[1], graph)
+        self.assertEqual(
+            FakeFedoraHandler.requests[-1], 
+            ('/work', 'If-None-Match'))
+        graphs.invalidate(self.base_url + '/work')
+        self.assertIsNot(graphs.get(self.base_url + '/work')[1], graph)
+        self.assertEqual(len(FakeFedoraHandler.requests), 3)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+if __name__ == '__main__':
+    unittest.main()
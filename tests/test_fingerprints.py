@@ -0,0 +1,219 @@
+#-------------------------------------------------------------------------------
+# Name:         test_fingerprints
+# Purpose:      Unit tests for delta loads of MARC records
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import pymarc
+import rdflib
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from elasticsearch import Elasticsearch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.dedup import AuthorityIndex
+from repository.utilities.transforming.fingerprints import FingerprintStore
+from repository.utilities.transforming.fingerprints import record_fingerprint
+from repository.utilities.transforming.marc2ds import MARC21toBIBFRAMEIngester
+from repository.utilities.transforming.xquery import XQueryClient
+from tests.test_decompose import BF, CATALOG, FakeFedora, FakeShards
+from tests.test_decompose import bibframe_graph
+
+
+def marc_record(title, stamp="20160101120000.0"):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data='ocm0001'))
+    record.add_field(pymarc.Field(tag='005', data=stamp))
+    record.add_field(pymarc.Field(
+        tag='245',
+        indicators=['0', '0'],
+        subfields=[pymarc.Subfield('a', title)]))
+    return record
+
+
+class FakeXQuery(object):
+
+    framed = False
+
+    def __init__(self):
+        self.requests = 0
+        self.annotation = False
+
+    def convert(self, marc_xml):
+        self.requests += 1
+        graph = bibframe_graph()
+        if self.annotation:
+            graph.add((CATALOG.annotation1, rdflib.RDF.type, BF.Summary))
+            graph.add((CATALOG.annotation1, BF.annotates, CATALOG.work1))
+        return graph
+
+
+class DeltaIngester(MARC21toBIBFRAMEIngester):
+    """Stores MARC records, writes graphs and deletes entities without 
+    Fedora"""
+
+    def __process_marc__(self, record):
+        return "http://localhost:8080/rest/marc/1"
+
+    def __put_bibframe__(self, bf_url, turtle):
+        if self.fail:
+            raise ValueError("HttpError")
+        self.written.append(bf_url)
+
+    def __delete_bibframe__(self, bf_urls):
+        self.deleted.extend(bf_urls)
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_normalized(self):
+        stamp, digest = record_fingerprint(marc_record("Brontë"))
+        self.assertEqual(stamp, "20160101120000.0")
+        # A new 005 or another Unicode normalization isn't a change
+        self.assertEqual(
+            record_fingerprint(marc_record("Brontë", "20170101"))[1],
+            digest)
+        self.assertNotEqual(record_fingerprint(marc_record("Bronte"))[1],
+                            digest)
+
+    def test_store(self):
+        store = FingerprintStore()
+        fingerprint = ("20160101", "abc")
+        self.assertEqual(store.status("1", fingerprint), "new")
+        store.update("1", fingerprint, ["http://localhost/1"])
+        self.assertEqual(store.status("1", ("20170101", "abc")), "unchanged")
+        self.assertEqual(store.status("1", ("20170101", "def")), "changed")
+        self.assertEqual(store.status("1", ("20150101", "def")), "stale")
+        self.assertEqual(store.entities("1"), ["http://localhost/1"])
+        since = time.time() + 1
+        self.assertEqual(store.missing(since), [("1", ["http://localhost/1"])])
+        store.remove("1")
+        self.assertEqual(store.missing(since), [])
+
+
+class TestDeltaLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.xquery = FakeXQuery()
+        self.ingester = DeltaIngester(
+            fedora=FakeFedora(),
+            shards=FakeShards(),
+            authorities=AuthorityIndex(),
+            xquery=self.xquery,
+            fingerprints=FingerprintStore())
+        self.ingester.deleted = []
+        self.ingester.written = []
+        self.ingester.fail = False
+
+    def test_unchanged(self):
+        self.assertEqual(
+            len(self.ingester.__convert__(marc_record("Hamlet"))), 3)
+        # The fingerprint waits until the graphs are written
+        self.assertEqual(self.ingester.fingerprints.entities("ocm0001"), [])
+        self.ingester.__replace_derived__(
+            self.ingester.__pop_pending__(marc_record("Hamlet")))
+        # Work and Instance belong to the record, the Title is an authority
+        self.assertEqual(len(self.ingester.fingerprints.entities("ocm0001")), 2)
+        self.assertEqual(
+            self.ingester.__convert__(marc_record("Hamlet", "20170101")),
+            [])
+        self.assertEqual(self.xquery.requests, 1)
+
+    def test_changed(self):
+        self.xquery.annotation = True
+        self.ingester.ingest(marc_record("Hamlet"))
+        old = self.ingester.fingerprints.entities("ocm0001")
+        self.assertEqual(len(old), 3)
+        # Forgets the Title so it isn't fetched from Fedora as an existing
+        # entity
+        self.ingester.authorities = AuthorityIndex()
+        self.xquery.annotation = False
+        self.ingester.written = []
+        self.ingester.ingest(marc_record("Hamlet, Prince of Denmark"))
+        self.assertEqual(self.xquery.requests, 2)
+        # The Work and Instance are replaced in place, the Annotation that
+        # wasn't derived again is deleted
+        new = self.ingester.fingerprints.entities("ocm0001")
+        self.assertEqual(len(new), 2)
+        for url in new:
+            self.assertIn(url, old)
+            self.assertIn(url, self.ingester.written)
+        self.assertEqual(self.ingester.deleted,
+                         [url for url in old if url not in new])
+        self.assertIn("/Annotation/", self.ingester.deleted[0])
+
+    def test_write_failure(self):
+        self.ingester.ingest(marc_record("Hamlet"))
+        old = self.ingester.fingerprints.entities("ocm0001")
+        self.ingester.authorities = AuthorityIndex()
+        self.ingester.fail = True
+        with self.assertRaises(ValueError):
+            self.ingester.ingest(marc_record("Hamlet, Prince of Denmark"))
+        # Nothing is deleted and the old fingerprint is kept, so the next
+        # delta load converts the record again
+        self.assertEqual(self.ingester.deleted, [])
+        self.assertEqual(self.ingester.fingerprints.entities("ocm0001"), old)
+        self.assertEqual(
+            self.ingester.fingerprints.status(
+                "ocm0001",
+                record_fingerprint(marc_record("Hamlet, Prince of Denmark"))),
+            "changed")
+
+    def test_deleted(self):
+        self.ingester.ingest(marc_record("Hamlet"))
+        old = self.ingester.fingerprints.entities("ocm0001")
+        record = marc_record("Hamlet")
+        record.leader = pymarc.Leader("00000dam a2200000 a 4500")
+        self.assertEqual(self.ingester.__convert__(record), [])
+        self.assertEqual(sorted(self.ingester.deleted), sorted(old))
+        self.assertEqual(self.ingester.fingerprints.entities("ocm0001"), [])
+
+
+class TestWorkerSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = dict(
+            fedora=FakeFedora(),
+            shards=FakeShards(),
+            es=Elasticsearch([{"host": "localhost", "port": 9200}]),
+            authorities=AuthorityIndex(
+                os.path.join(self.directory, "authorities.db")),
+            fingerprints=FingerprintStore(
+                os.path.join(self.directory, "fingerprints.db")),
+            xquery=XQueryClient("xquery", 8090))
+
+    def test_settings(self):
+        ingester = MARC21toBIBFRAMEIngester(**self.settings)
+        settings = ingester.__worker_settings__()
+        for key in ['es', 'authorities', 'fingerprints', 'xquery']:
+            self.assertNotIn(key, settings)
+        self.assertEqual(settings['es_hosts'][0]['host'], "localhost")
+        self.assertEqual(
+            settings['authority_path'],
+            ingester.authorities.path)
+        self.assertEqual(settings['xquery_host'], "xquery")
+        self.assertEqual(settings['xquery_port'], 8090)
+        # A worker opens its own clients and the shared databases
+        worker = MARC21toBIBFRAMEIngester(**settings)
+        self.assertIsNot(worker.elastic_search, ingester.elastic_search)
+        ingester.authorities.add("Person", "Crowe, Russell", CATALOG.crowe)
+        self.assertEqual(
+            worker.authorities.get("Person", "Crowe, Russell"),
+            str(CATALOG.crowe))
+
+    def test_memory_authorities(self):
+        self.settings['authorities'] = AuthorityIndex()
+        ingester = MARC21toBIBFRAMEIngester(**self.settings)
+        self.assertRaises(ValueError, ingester.__worker_settings__)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
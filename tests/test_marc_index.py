@@ -0,0 +1,106 @@
+#-------------------------------------------------------------------------------
+# Name:         test_marc_index
+# Purpose:      Unit tests for the MARC21 offset index and MarcFile
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import pymarc
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.marc_index import INDEX_HEADER
+from repository.utilities.transforming.marc_index import MarcFile
+from repository.utilities.transforming.marc_index import build_index
+from repository.utilities.transforming.marc_index import index_path
+from repository.utilities.transforming.marc_index import load_index
+from repository.utilities.transforming.marc_index import partitions
+
+
+def marc_record(control_number):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data=control_number))
+    record.add_field(pymarc.Field(
+        tag='245',
+        indicators=['0', '0'],
+        subfields=[pymarc.Subfield('a', 'Title {}'.format(control_number))]))
+    return record
+
+
+class TestMarcIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.marc_path = os.path.join(self.directory, "bibs.mrc")
+        self.raw_records = [marc_record(str(i)).as_marc() for i in range(25)]
+        with open(self.marc_path, 'wb') as marc_file:
+            for raw in self.raw_records:
+                marc_file.write(raw)
+
+    def test_build_index(self):
+        offsets = build_index(self.marc_path)
+        self.assertEqual(len(offsets), 26)
+        self.assertEqual(offsets[1], len(self.raw_records[0]))
+        self.assertEqual(offsets[-1], os.path.getsize(self.marc_path))
+        self.assertTrue(os.path.exists(index_path(self.marc_path)))
+        self.assertEqual(list(load_index(self.marc_path)), list(offsets))
+
+    def test_rebuild(self):
+        build_index(self.marc_path)
+        with open(self.marc_path, 'ab') as marc_file:
+            marc_file.write(marc_record("25").as_marc())
+        self.assertEqual(len(load_index(self.marc_path)), 27)
+
+    def test_rebuild_same_size(self):
+        build_index(self.marc_path)
+        # Same size, different records
+        with open(self.marc_path, 'wb') as marc_file:
+            for raw in reversed(self.raw_records):
+                marc_file.write(raw)
+        stat = os.stat(self.marc_path)
+        os.utime(self.marc_path,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        offsets = load_index(self.marc_path)
+        self.assertEqual(offsets[1], len(self.raw_records[-1]))
+
+    def test_network_order(self):
+        offsets = build_index(self.marc_path)
+        with open(index_path(self.marc_path), 'rb') as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+            self.assertEqual(INDEX_HEADER.unpack(header)[-1], 25)
+            self.assertEqual(
+                struct.unpack("!Q", index_file.read(8))[0],
+                offsets[0])
+            self.assertEqual(
+                struct.unpack("!Q", index_file.read(8))[0],
+                offsets[1])
+        self.assertEqual(list(load_index(self.marc_path)), list(offsets))
+
+    def test_random_access(self):
+        with MarcFile(self.marc_path) as marc_file:
+            self.assertEqual(len(marc_file), 25)
+            self.assertEqual(marc_file[17]['001'].data, "17")
+            self.assertEqual(marc_file[-1]['001'].data, "24")
+            self.assertEqual(bytes(marc_file.raw(3)), self.raw_records[3])
+            self.assertEqual(len(marc_file.raw_range(5, 8)),
+                             sum([len(raw) for raw in self.raw_records[5:8]]))
+            self.assertEqual(
+                [record['001'].data for record in marc_file.records(22)],
+                ["22", "23", "24"])
+            self.assertRaises(IndexError, marc_file.raw, 25)
+
+    def test_partitions(self):
+        self.assertEqual(partitions(10, 3), [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(partitions(10, 2, start=6), [(6, 8), (8, 10)])
+        self.assertEqual(partitions(2, 5), [(0, 1), (1, 2)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
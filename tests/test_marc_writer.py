@@ -0,0 +1,89 @@
+#-------------------------------------------------------------------------------
+# Name:         test_marc_writer
+# Purpose:      Unit tests for the buffered MongoDB MARC writer
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import pymarc
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.marc2ds import MARC21Ingester
+from repository.utilities.transforming.marc_writer import MarcWriter
+from repository.utilities.transforming.marc_writer import system_numbers
+
+
+def marc_record(*numbers):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data='1'))
+    for number in numbers:
+        record.add_field(pymarc.Field(
+            tag='035',
+            indicators=[' ', ' '],
+            subfields=[pymarc.Subfield('a', number)]))
+    return record
+
+
+class FakeCollection(object):
+    """Evaluates $in queries on 035 $a like pymongo.Collection"""
+
+    def __init__(self):
+        self.documents = []
+        self.indexes = []
+        self.finds = 0
+        self.inserts = 0
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        numbers = query["fields.035.subfields.a"]["$in"]
+        return [document for document in self.documents
+                if set(system_numbers(document)).intersection(numbers)]
+
+    def insert_many(self, documents, ordered=True):
+        self.inserts += 1
+        self.documents.extend(documents)
+
+
+class TestMarcWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.ingester = MARC21Ingester(
+            marc_writer=MarcWriter(self.collection, chunk_size=3))
+
+    def test_index(self):
+        self.assertEqual(
+            self.collection.indexes,
+            [[("fields.035.subfields.a", 1)]])
+
+    def test_get_or_add_marcs(self):
+        ids = self.ingester.__get_or_add_marcs__([
+            marc_record("(OCoLC)1"),
+            marc_record("(OCoLC)2", "(OCoLC)3"),
+            marc_record("(OCoLC)3")])
+        self.assertEqual(len(set(ids)), 2)
+        self.assertEqual(ids[1], ids[2])
+        self.assertEqual(self.collection.finds, 1)
+        self.assertEqual(self.collection.inserts, 0)
+        self.ingester.__flush_marc__()
+        self.assertEqual(self.collection.inserts, 1)
+        self.assertEqual(
+            self.ingester.__get_or_add_marc__(marc_record("(OCoLC)1")),
+            ids[0])
+
+    def test_flush_when_full(self):
+        for i in range(4):
+            self.ingester.__get_or_add_marc__(marc_record(str(i)))
+        self.assertEqual(len(self.collection.documents), 3)
+        self.assertEqual(
+            self.collection.documents[0]['fields']['035']['subfields']['a'],
+            '0')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#-------------------------------------------------------------------------------
+# Name:         test_marc_xml
+# Purpose:      Unit tests for streaming MARC-XML collections
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import io
+import os
+import pymarc
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.marc_xml import MARC_NS
+from repository.utilities.transforming.marc_xml import from_xml
+from repository.utilities.transforming.marc_xml import is_marc_xml
+from repository.utilities.transforming.marc_xml import iter_marc_xml
+
+
+def marc_record(control_number):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data=control_number))
+    record.add_field(pymarc.Field(
+        tag='245',
+        indicators=['0', '0'],
+        subfields=[pymarc.Subfield('a', 'Title {}'.format(control_number)),
+                   pymarc.Subfield('c', 'Brontë')]))
+    return record
+
+
+class TestMarcXml(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.xml_path = os.path.join(self.directory, "bibs.xml")
+        with open(self.xml_path, 'wb') as xml_file:
+            writer = pymarc.XMLWriter(xml_file)
+            for i in range(30):
+                writer.write(marc_record(str(i)))
+            writer.close(close_fh=False)
+
+    def test_is_marc_xml(self):
+        self.assertTrue(is_marc_xml(self.xml_path))
+        marc_path = os.path.join(self.directory, "bibs.mrc")
+        with open(marc_path, 'wb') as marc_file:
+            marc_file.write(marc_record("1").as_marc())
+        self.assertFalse(is_marc_xml(marc_path))
+
+    def test_iter_marc_xml(self):
+        records = list(iter_marc_xml(self.xml_path))
+        self.assertEqual(len(records), 30)
+        record, marc_xml = records[29]
+        self.assertEqual(record['001'].data, "29")
+        self.assertEqual(record['245']['c'], "Brontë")
+        self.assertEqual(list(record['245'].indicators), ['0', '0'])
+        self.assertTrue(marc_xml.startswith(
+            '<marc:record xmlns:marc="{}">'.format(MARC_NS).encode()))
+        self.assertEqual(from_xml(marc_xml)['245']['a'], "Title 29")
+
+    def test_range(self):
+        self.assertEqual(
+            [record['001'].data
+             for record, marc_xml in iter_marc_xml(self.xml_path, 27)],
+            ["27", "28", "29"])
+        self.assertEqual(
+            [record['001'].data
+             for record, marc_xml in iter_marc_xml(self.xml_path, 3, 5)],
+            ["3", "4"])
+
+    def test_without_namespace(self):
+        source = io.BytesIO(
+            b"<collection><record><leader>00000nam a2200000 a 4500</leader>"
+            b"<controlfield tag='001'>42</controlfield></record></collection>")
+        record, marc_xml = next(iter_marc_xml(source))
+        self.assertEqual(record['001'].data, "42")
+        self.assertEqual(str(record.leader), "00000nam a2200000 a 4500")
+        self.assertIn(MARC_NS.encode(), marc_xml)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+#-------------------------------------------------------------------------------
+# Name:         test_offline
+# Purpose:      Unit tests for offline MARC to BIBFRAME transforms and the
+#               bulk loader
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import json
+import os
+import pymarc
+import rdflib
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.resources.fuseki import TripleStore
+from repository.utilities.dedup import AuthorityIndex
+from repository.utilities.transforming.marc2ds import MARC21toBIBFRAMEIngester
+from repository.utilities.transforming.offline import OfflineWriter
+from repository.utilities.transforming.offline import load_elasticsearch
+from repository.utilities.transforming.offline import load_fuseki, nquads
+from tests.test_decompose import FakeFedora, FakeShards
+from tests.test_fingerprints import FakeXQuery, marc_record
+
+WORK_URL = "http://localhost:8080/rest/Work/7/1"
+
+try:
+    rdflib.plugin.get('json-ld', rdflib.serializer.Serializer)
+    JSON_LD = True
+except rdflib.plugin.PluginException:
+    JSON_LD = False
+
+
+class FakeElasticsearch(object):
+    """Records bulk requests, failing any document with an id of bad"""
+
+    def __init__(self):
+        self.bodies = []
+
+    def bulk(self, body):
+        self.bodies.append(body)
+        items = []
+        for line in body.splitlines()[::2]:
+            action = json.loads(line.decode())
+            result = {"_id": action["index"]["_id"]}
+            if action["index"]["_id"] == "bad":
+                result["error"] = "mapper_parsing_exception"
+            items.append({"index": result})
+        return {"items": items}
+
+
+class FakeFusekiHandler(BaseHTTPRequestHandler):
+    """Records each chunked POST to the data endpoint"""
+
+    def do_POST(self):
+        if 'Content-Length' in self.headers:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+        else:
+            body = self.__read_chunked__()
+        self.posts.append((self.path, self.headers['Content-Type'], body))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def __read_chunked__(self):
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                break
+            body += self.rfile.read(size)
+            self.rfile.readline()
+        return body
+
+    def log_message(self, format, *args):
+        pass
+
+
+def work_graph():
+    graph = rdflib.Graph()
+    graph.add((rdflib.URIRef(WORK_URL),
+               rdflib.RDFS.label,
+               rdflib.Literal("Hamlet <1603>")))
+    return graph
+
+
+class TestOfflineWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def test_nquads(self):
+        self.assertEqual(
+            nquads(work_graph(), WORK_URL),
+            '<{0}> <http://www.w3.org/2000/01/rdf-schema#label> '
+            '"Hamlet <1603>" <{0}> .\n'.format(WORK_URL).encode())
+
+    def test_shards(self):
+        writer = OfflineWriter(self.output_dir, shard_size=2, part=3)
+        for position in range(3, 8):
+            writer.write(position, b"q\n", b"a\nd\n")
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ["00000001", "00000002", "00000003"])
+        with open(os.path.join(self.output_dir, "00000002", "3.nq"),
+                  'rb') as quads:
+            self.assertEqual(quads.read(), b"q\nq\n")
+        # Records without MARC21 leave the .mrc file empty
+        self.assertEqual(os.path.getsize(
+            os.path.join(self.output_dir, "00000002", "3.mrc")), 0)
+
+    def test_rerun(self):
+        for run in range(2):
+            writer = OfflineWriter(self.output_dir, shard_size=2)
+            for position in [0, 1, 0]:
+                writer.write(position, b"q\n", None)
+            writer.close()
+        # A second run replaces the part's files
+        with open(os.path.join(self.output_dir, "00000000", "0.nq"),
+                  'rb') as quads:
+            self.assertEqual(quads.read(), b"q\nq\nq\n")
+
+    def test_load_elasticsearch(self):
+        writer = OfflineWriter(self.output_dir)
+        for doc_id in ["1", "bad", "3"]:
+            writer.write(0, None, '{{"index": {{"_id": "{}"}}}}\n{{}}\n'.format(
+                doc_id).encode())
+        writer.close()
+        elastic_search = FakeElasticsearch()
+        self.assertEqual(
+            load_elasticsearch(self.output_dir, elastic_search, bulk_size=2),
+            (2, 1))
+        self.assertEqual(len(elastic_search.bodies), 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+
+class TestLoadFuseki(unittest.TestCase):
+
+    def setUp(self):
+        FakeFusekiHandler.posts = []
+        self.server = HTTPServer(('localhost', 0), FakeFusekiHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.output_dir = tempfile.mkdtemp()
+        writer = OfflineWriter(self.output_dir)
+        writer.write(0, nquads(work_graph(), WORK_URL), None)
+        writer.close()
+
+    def triplestore(self, named_graphs):
+        return TripleStore({"FUSEKI": {
+            "host": "localhost",
+            "port": self.server.server_port,
+            "datastore": "ds",
+            "named_graphs": named_graphs}})
+
+    def test_default_graph(self):
+        self.assertEqual(load_fuseki(self.output_dir, self.triplestore(False)), 1)
+        path, mimetype, body = FakeFusekiHandler.posts[0]
+        self.assertEqual(path, "/ds/data?default=")
+        self.assertEqual(mimetype, "application/n-triples")
+        self.assertEqual(len(rdflib.Graph().parse(data=body, format='nt')), 1)
+        self.assertTrue(body.endswith(b'"Hamlet <1603>" .\n'))
+
+    def test_default_graph_triples(self):
+        instance = '<{}> <http://bibframe.org/vocab/instanceOf> <{}> .\n'.format(
+            WORK_URL.replace("Work", "Instance"),
+            WORK_URL).encode()
+        triples = nquads(work_graph(), WORK_URL) + instance
+        self.triplestore(False).__load_nquads__(triples.splitlines())
+        path, mimetype, body = FakeFusekiHandler.posts[0]
+        graph = rdflib.Graph().parse(data=body, format='nt')
+        # Lines without a graph name keep their object
+        self.assertEqual(len(graph), 2)
+        self.assertIn(rdflib.URIRef(WORK_URL), set(graph.objects()))
+
+    def test_named_graphs(self):
+        load_fuseki(self.output_dir, self.triplestore(True))
+        path, mimetype, body = FakeFusekiHandler.posts[0]
+        self.assertEqual(path, "/ds/data")
+        self.assertEqual(mimetype, "application/n-quads")
+        self.assertTrue(body.endswith('<{}> .\n'.format(WORK_URL).encode()))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.output_dir)
+
+
+class PartIngester(MARC21toBIBFRAMEIngester):
+    """Allocates a Work shard for each record instead of converting it"""
+
+    def __transform__(self, record, marc_xml=None):
+        self.__calculate_bibframe_shard__("Work")
+        return b"", b"", record.as_marc()
+
+
+class TestTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.marc_path = os.path.join(self.output_dir, "records.mrc")
+        with open(self.marc_path, 'wb') as marc_file:
+            for title in ["Hamlet", "Macbeth"]:
+                record = marc_record(title)
+                record.add_field(pymarc.Field(
+                    tag='907',
+                    indicators=[' ', ' '],
+                    subfields=[pymarc.Subfield('a', '.b1234567x')]))
+                marc_file.write(record.as_marc())
+        self.xquery = FakeXQuery()
+        self.ingester = MARC21toBIBFRAMEIngester(
+            fedora=FakeFedora(),
+            shards=FakeShards(),
+            authorities=AuthorityIndex(),
+            xquery=self.xquery)
+
+    @unittest.skipUnless(JSON_LD, "rdflib-jsonld isn't installed")
+    def test_transform(self):
+        self.assertEqual(
+            self.ingester.transform(self.marc_path,
+                                    os.path.join(self.output_dir, "output")),
+            (2, 0))
+        self.assertEqual(self.xquery.requests, 2)
+        shard = os.path.join(self.output_dir, "output", "00000000")
+        with open(os.path.join(shard, "0.ndjson"), 'rb') as ndjson:
+            actions = [json.loads(line.decode())
+                       for line in ndjson.readlines()[::2]]
+        # Both records share a bib number and the second's Title is an
+        # existing authority, so only its Work and Instance are new
+        self.assertEqual(
+            sorted([action["index"]["_index"] for action in actions]),
+            ["bibframe"] * 5 + ["marc"])
+        with open(os.path.join(shard, "0.nq"), 'rb') as quads:
+            graphs = set([line.split(b" ")[-2] for line in quads])
+        self.assertEqual(len(graphs), 6)
+        self.assertEqual(len(list(pymarc.MARCReader(
+            open(os.path.join(shard, "0.mrc"), 'rb')))), 1)
+
+    def test_parts(self):
+        with open(self.marc_path, 'ab') as marc_file:
+            for title in ["Othello", "King Lear"]:
+                marc_file.write(marc_record(title).as_marc())
+        shard_path = os.path.join(self.output_dir, "shards.json")
+        ingester = PartIngester(
+            fedora=FakeFedora(),
+            authority_path=os.path.join(self.output_dir, "authorities.db"),
+            shard_path=shard_path,
+            xquery=self.xquery)
+        output_dir = os.path.join(self.output_dir, "output")
+        self.assertEqual(
+            ingester.transform(self.marc_path, output_dir, parts=2),
+            (4, 0))
+        shard = os.path.join(output_dir, "00000000")
+        for part in ["0", "2"]:
+            with open(os.path.join(shard, part + ".mrc"), 'rb') as marc21:
+                self.assertEqual(len(list(pymarc.MARCReader(marc21))), 2)
+        # Both partitions allocated from the same counters
+        with open(shard_path) as counters_file:
+            self.assertEqual(json.load(counters_file), {"Work": 4})
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+if __name__ == '__main__':
+    unittest.main()
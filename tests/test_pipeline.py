@@ -0,0 +1,181 @@
+#-------------------------------------------------------------------------------
+# Name:         test_pipeline
+# Purpose:      Unit tests for the multiprocess MARC21 batch pipeline
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import io
+import json
+import os
+import pymarc
+import rdflib
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.pipeline import BatchPipeline
+from repository.utilities.transforming.pipeline import ProgressReport
+from repository.utilities.transforming.pipeline import iter_marc21
+
+FEDORA_URL = "http://localhost:8080/rest/{}"
+
+
+def marc_record(control_number):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data=control_number))
+    record.add_field(pymarc.Field(
+        tag='245',
+        indicators=['0', '0'],
+        subfields=[pymarc.Subfield('a', 'Title {}'.format(control_number))]))
+    return record
+
+
+class FakeIngester(object):
+    """Converts a record to a single graph, failing on 001 bad"""
+
+    def __convert__(self, record, workspace=None, marc_xml=None):
+        if record['001'].data == 'bad':
+            raise ValueError("xquery failed")
+        if marc_xml is not None and not marc_xml.startswith(b"<marc:record"):
+            raise ValueError("Expected raw MARC-XML")
+        graph = rdflib.Graph()
+        graph.add((rdflib.URIRef(FEDORA_URL.format(record['001'].data)),
+                   rdflib.RDFS.label,
+                   rdflib.Literal(record.title)))
+        return [graph,]
+
+    def __pop_pending__(self, record):
+        return record['001'].data
+
+
+class TestBatchPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.marc_path = os.path.join(self.directory, "bibs.mrc")
+        self.error_path = os.path.join(self.directory, "errors.json")
+        self.control_numbers = [str(i) for i in range(47)]
+        self.control_numbers[13] = 'bad'
+        with open(self.marc_path, 'wb') as marc_file:
+            for control_number in self.control_numbers:
+                marc_file.write(marc_record(control_number).as_marc())
+        self.written = dict()
+        self.lock = threading.Lock()
+
+    def write(self, url, turtle):
+        with self.lock:
+            self.written[url] = turtle
+
+    def test_iter_marc21(self):
+        with open(self.marc_path, 'rb') as marc_file:
+            raw_records = list(iter_marc21(marc_file))
+        self.assertEqual(len(raw_records), 47)
+        self.assertEqual(pymarc.Record(data=raw_records[46])['001'].data, '46')
+
+    def test_run(self):
+        pipeline = BatchPipeline(
+            FakeIngester,
+            self.write,
+            workers=3,
+            writers=2,
+            chunk_size=4,
+            queue_size=2,
+            error_path=self.error_path)
+        progress = pipeline.run(self.marc_path)
+        self.assertEqual(progress.completed, 47)
+        self.assertEqual(progress.errors, 1)
+        self.assertEqual(len(self.written), 46)
+        self.assertIn(b"Title 46", self.written[FEDORA_URL.format(46)])
+        with open(self.error_path) as error_file:
+            errors = [json.loads(line) for line in error_file]
+        self.assertEqual(errors[0]["record"], 13)
+        self.assertEqual(errors[0]["001"], "bad")
+        self.assertEqual(errors[0]["stage"], "convert")
+
+    def test_run_range(self):
+        pipeline = BatchPipeline(
+            FakeIngester,
+            self.write,
+            workers=2,
+            chunk_size=4,
+            error_path=self.error_path)
+        progress = pipeline.run(self.marc_path, start=20, stop=30)
+        self.assertEqual(progress.completed, 10)
+        self.assertEqual(progress.errors, 0)
+        self.assertEqual(
+            sorted(self.written.keys()),
+            sorted([FEDORA_URL.format(i) for i in range(20, 30)]))
+
+    def test_run_xml(self):
+        xml_path = os.path.join(self.directory, "bibs.xml")
+        with open(xml_path, 'wb') as xml_file:
+            writer = pymarc.XMLWriter(xml_file)
+            for control_number in self.control_numbers:
+                writer.write(marc_record(control_number))
+            writer.close(close_fh=False)
+        pipeline = BatchPipeline(
+            FakeIngester,
+            self.write,
+            workers=2,
+            chunk_size=4,
+            error_path=self.error_path)
+        progress = pipeline.run(xml_path, start=10)
+        self.assertEqual(progress.completed, 37)
+        self.assertEqual(progress.errors, 1)
+        self.assertIn(b"Title 46", self.written[FEDORA_URL.format(46)])
+
+    def test_run_corrupt(self):
+        with open(self.marc_path, 'ab') as marc_file:
+            marc_file.write(b"12x45 truncated")
+        pipeline = BatchPipeline(
+            FakeIngester,
+            self.write,
+            workers=2,
+            chunk_size=4,
+            error_path=self.error_path)
+        self.assertRaises(RuntimeError, pipeline.run, self.marc_path)
+        # Records read before the corrupt leader are still written
+        self.assertEqual(len(self.written), 46)
+
+    def test_run_commit(self):
+        committed = []
+
+        def write(url, turtle):
+            if url == FEDORA_URL.format(7):
+                raise IOError("fedora unavailable")
+            self.write(url, turtle)
+
+        pipeline = BatchPipeline(
+            FakeIngester,
+            write,
+            workers=2,
+            chunk_size=4,
+            error_path=self.error_path,
+            commit=committed.append)
+        progress = pipeline.run(self.marc_path)
+        self.assertEqual(progress.errors, 2)
+        # Only records whose graphs were all written are committed
+        self.assertEqual(
+            sorted(committed),
+            sorted(set(self.control_numbers) - {'bad', '7'}))
+
+    def test_progress_order(self):
+        output = io.StringIO()
+        progress = ProgressReport(output=output)
+        for i in [2, 1]:
+            progress.done(i)
+        self.assertEqual(progress.completed, 0)
+        self.assertEqual(output.getvalue(), "")
+        progress.done(0)
+        self.assertEqual(progress.completed, 3)
+        self.assertTrue(output.getvalue().startswith(". 0 "))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#-------------------------------------------------------------------------------
+# Name:         test_registry
+# Purpose:      Unit tests for the uuid and Fedora URL registry
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.registry import IdRegistry
+
+FEDORA_URL = "http://localhost:8080/rest/{}"
+
+
+class PagedTripleStore(object):
+    """Returns subject and uuid bindings like TripleStore.__get_uuids__"""
+
+    def __init__(self, total):
+        self.bindings = [
+            {"subject": {"value": FEDORA_URL.format(i)},
+             "uuid": {"value": "uuid-{}".format(i)}} for i in range(total)]
+        self.pages = 0
+
+    def __get_uuids__(self, offset=0, limit=10000):
+        self.pages += 1
+        return self.bindings[offset:offset+limit]
+
+
+class TestIdRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "registry.db")
+        self.registry = IdRegistry(self.path)
+
+    def test_add(self):
+        self.registry.add("uuid-1", FEDORA_URL.format(1))
+        self.assertEqual(self.registry.url("uuid-1"), FEDORA_URL.format(1))
+        self.assertEqual(self.registry.uuid(FEDORA_URL.format(1)), "uuid-1")
+        self.assertIsNone(self.registry.url("uuid-2"))
+
+    def test_remove(self):
+        self.registry.add_many([("uuid-1", FEDORA_URL.format(1)),
+                                ("uuid-2", FEDORA_URL.format(2))])
+        self.registry.remove(uuid="uuid-1")
+        self.registry.remove(url=FEDORA_URL.format(2))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_locations(self):
+        self.registry.add("uuid-1", FEDORA_URL.format(1))
+        self.registry.add_locations([("uuid-1", "bibframe", "Work"),
+                                     ("uuid-2", "bibframe", "Instance")])
+        self.assertEqual(self.registry.location("uuid-1"), ("bibframe", "Work"))
+        self.assertIsNone(self.registry.location("uuid-3"))
+        self.registry.remove(url=FEDORA_URL.format(1))
+        self.assertIsNone(self.registry.location("uuid-1"))
+        # Rebuilding from Fuseki keeps the locations
+        self.registry.rebuild(PagedTripleStore(0))
+        self.assertEqual(self.registry.location("uuid-2"),
+                         ("bibframe", "Instance"))
+        self.registry.remove_many(["uuid-2"])
+        self.assertIsNone(self.registry.location("uuid-2"))
+
+    def test_persistent(self):
+        self.registry.add("uuid-1", FEDORA_URL.format(1))
+        self.assertEqual(
+            IdRegistry(self.path).url("uuid-1"),
+            FEDORA_URL.format(1))
+
+    def test_rebuild(self):
+        self.registry.add("stale", FEDORA_URL.format("stale"))
+        triplestore = PagedTripleStore(25)
+        self.assertEqual(self.registry.rebuild(triplestore, page_size=10), 25)
+        self.assertEqual(triplestore.pages, 3)
+        self.assertIsNone(self.registry.url("stale"))
+        self.assertEqual(self.registry.url("uuid-24"), FEDORA_URL.format(24))
+
+    def tearDown(self):
+        self.registry.connection.close()
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
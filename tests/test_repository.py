@@ -0,0 +1,278 @@
+#-------------------------------------------------------------------------------
+# Name:         test_repository
+# Purpose:      Unit tests for the repository module's helper functions
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import configparser
+import falcon
+import falcon.testing
+import json
+import os
+import rdflib
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository import diff_sparql, field_name, fields_sparql, graph_diff
+from repository import Search, to_term
+from repository.utilities.namespaces import BF, FEDORA, LDP, RDF
+
+WORK = rdflib.URIRef('http://localhost:8080/rest/work/1')
+
+WORK_TURTLE = """@prefix bf: <http://bibframe.org/vocab/> .
+@prefix fedora: <http://fedora.info/definitions/v4/repository#> .
+@prefix ldp: <http://www.w3.org/ns/ldp#> .
+
+<http://localhost:8080/rest/work/1> a bf:Work, ldp:Container ;
+    fedora:uuid "1234" ;
+    bf:label "Russell Crowe" ;
+    bf:title "Russell Crowe :" ;
+    bf:subject <http://localhost:8080/rest/topic/1> ."""
+
+
+class TestGraphDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.current = rdflib.Graph().parse(data=WORK_TURTLE, format='turtle')
+        self.desired = rdflib.Graph()
+        for triple in self.current:
+            self.desired.add(triple)
+
+    def test_no_changes(self):
+        removed, added = graph_diff(self.current, self.desired)
+        self.assertEqual(len(removed), 0)
+        self.assertEqual(len(added), 0)
+
+    def test_replace_literal(self):
+        self.desired.set((WORK, BF.label, rdflib.Literal("Crowe, Russell")))
+        removed, added = graph_diff(self.current, self.desired)
+        self.assertEqual(
+            list(removed),
+            [(WORK, BF.label, rdflib.Literal("Russell Crowe"))])
+        self.assertEqual(
+            list(added),
+            [(WORK, BF.label, rdflib.Literal("Crowe, Russell"))])
+
+    def test_server_managed(self):
+        # Fedora's triples are missing from a client's desired graph
+        self.desired.remove((WORK, FEDORA.uuid, None))
+        self.desired.remove((WORK, RDF.type, LDP.Container))
+        removed, added = graph_diff(self.current, self.desired)
+        self.assertEqual(len(removed), 0)
+        self.assertEqual(len(added), 0)
+
+    def test_predicates(self):
+        desired = rdflib.Graph()
+        desired.add((WORK, BF.title, rdflib.Literal("Russell Crowe")))
+        removed, added = graph_diff(
+            self.current,
+            desired,
+            set(desired.predicates()))
+        self.assertEqual(
+            list(removed),
+            [(WORK, BF.title, rdflib.Literal("Russell Crowe :"))])
+        self.assertEqual(len(added), 1)
+
+    def test_diff_sparql(self):
+        self.desired.remove((WORK, BF.subject, None))
+        removed, added = graph_diff(self.current, self.desired)
+        sparql = diff_sparql(removed, added)
+        self.assertIn(
+            "DELETE {\n<http://localhost:8080/rest/work/1> "
+            "<http://bibframe.org/vocab/subject> "
+            "<http://localhost:8080/rest/topic/1> .",
+            sparql)
+        self.assertTrue(sparql.endswith("INSERT {\n\n} WHERE {\n}"))
+
+    def test_diff_sparql_bnodes(self):
+        title = rdflib.BNode()
+        self.current.add((WORK, BF.title, title))
+        self.current.add((title, BF.titleValue, rdflib.Literal("Hamlet")))
+        removed, added = graph_diff(self.current, self.desired)
+        sparql = diff_sparql(removed, added)
+        # Blank nodes are matched by variables instead of their labels
+        self.assertNotIn("_:", sparql)
+        self.assertIn(
+            "OPTIONAL {\n",
+            sparql)
+        self.assertIn(
+            '?b0 <http://bibframe.org/vocab/titleValue> "Hamlet" .\n',
+            sparql.split("WHERE")[1])
+        self.assertIn(
+            "<http://localhost:8080/rest/work/1> "
+            "<http://bibframe.org/vocab/title> ?b0 .\n",
+            sparql.split("INSERT")[0])
+
+    def test_field_name(self):
+        self.assertEqual(field_name(BF.label), 'bf:label')
+        self.assertEqual(field_name(RDF.type), 'type')
+        self.assertEqual(
+            field_name(rdflib.URIRef('http://example.org/label')),
+            'http://example.org/label')
+
+
+class TestFieldChanges(unittest.TestCase):
+
+    def test_to_term(self):
+        self.assertEqual(to_term('bf:title'), BF.title)
+        self.assertEqual(to_term(WORK), WORK)
+        self.assertEqual(to_term({'@id': str(WORK)}), WORK)
+        self.assertEqual(
+            to_term('Russell Crowe : the biography'),
+            rdflib.Literal('Russell Crowe : the biography'))
+
+    def test_fields_sparql(self):
+        sparql = fields_sparql(
+            WORK,
+            [(BF.title, [rdflib.Literal("Russell Crowe")]),
+             (BF.subject, [])])
+        self.assertIn(
+            "DELETE WHERE { <http://localhost:8080/rest/work/1> "
+            "<http://bibframe.org/vocab/title> ?object } ;", 
+            sparql)
+        self.assertIn(
+            "DELETE WHERE { <http://localhost:8080/rest/work/1> "
+            "<http://bibframe.org/vocab/subject> ?object } ;",
+            sparql)
+        self.assertIn(
+            '<http://localhost:8080/rest/work/1> '
+            '<http://bibframe.org/vocab/title> "Russell Crowe" .',
+            sparql)
+        self.assertEqual(sparql.count("INSERT DATA"), 1)
+
+    def test_fields_sparql_named_graph(self):
+        sparql = fields_sparql(
+            WORK,
+            [(BF.title, [rdflib.Literal("Russell Crowe")])],
+            WORK)
+        self.assertIn(
+            "WITH <http://localhost:8080/rest/work/1> DELETE {",
+            sparql)
+        self.assertIn(
+            'INSERT DATA {\nGRAPH <http://localhost:8080/rest/work/1> {',
+            sparql)
+
+
+class FakeIndices(object):
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def stats(self):
+        self.calls += 1
+        return {"indices": {name: {} for name in self.names}}
+
+
+class FakeSearchIndex(object):
+    """Elastic search client with one Work document in the bibframe index,
+    records partial updates"""
+
+    def __init__(self):
+        self.indices = FakeIndices(["marc", "bibframe"])
+        self.updates = []
+
+    def exists(self, index, id):
+        return index == "bibframe" and id == "1234"
+
+    def get(self, index, id):
+        return {"_index": index, "_type": "Work", "_id": id}
+
+    def update(self, index, doc_type, id, body):
+        self.updates.append((index, doc_type, id, body))
+
+
+class FakeTripleStore(object):
+
+    named_graphs = False
+
+    def __init__(self):
+        self.updates = []
+
+    def __update__(self, sparql):
+        self.updates.append(sparql)
+
+
+class TestLocate(unittest.TestCase):
+
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "ELASTICSEARCH": {"host": "localhost", "port": "9200"}})
+        self.search = Search(config)
+        self.search.search_index = FakeSearchIndex()
+        self.search.triplestore = FakeTripleStore()
+        self.search.registry.add("1234", str(WORK))
+        self.changes = [{"predicate": "bf:title", "object": "A"}]
+
+    def test_registered(self):
+        self.search.registry.add_locations([("1234", "bibframe", "Work")])
+        self.search.__update_fields__("1234", self.changes)
+        self.assertEqual(self.search.search_index.indices.calls, 0)
+        self.assertEqual(
+            self.search.search_index.updates,
+            [("bibframe", "Work", "1234", 
+              {"doc": {"bf:title": ["A"]}})])
+
+    def test_fallback(self):
+        self.search.__update_fields__("1234", self.changes)
+        self.search.__update_fields__("1234", self.changes)
+        # Only the first update searches the indices
+        self.assertEqual(self.search.search_index.indices.calls, 1)
+        self.assertEqual(self.search.registry.location("1234"), 
+                         ("bibframe", "Work"))
+        self.assertEqual(len(self.search.search_index.updates), 2)
+
+
+class TestSearchPatch(unittest.TestCase):
+
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "ELASTICSEARCH": {"host": "localhost", "port": "9200"}})
+        self.search = Search(config)
+        self.updates = []
+        self.search.__update_fields__ = lambda doc_id, changes: \
+            self.updates.append((doc_id, changes))
+        api = falcon.API()
+        api.add_route("/search", self.search)
+        self.client = falcon.testing.TestClient(api)
+
+    def test_params(self):
+        result = self.client.simulate_patch(
+            "/search",
+            params={"uuid": "1234", "predicate": "bf:title", "object": "A"})
+        self.assertEqual(result.status_code, 202)
+        self.assertEqual(
+            self.updates,
+            [("1234", [{"predicate": "bf:title", "object": "A"}])])
+
+    def test_form(self):
+        result = self.client.simulate_patch(
+            "/search",
+            body="uuid=1234&predicate=bf%3Atitle&object=Russell+Crowe",
+            headers={"Content-Type": "application/x-www-form-urlencoded"})
+        self.assertEqual(result.status_code, 202)
+        self.assertEqual(
+            self.updates,
+            [("1234", [{"predicate": "bf:title", "object": "Russell Crowe"}])])
+
+    def test_json(self):
+        changes = [{"predicate": "bf:title", "object": "A"},
+                   {"predicate": "bf:subject", "object": []}]
+        result = self.client.simulate_patch(
+            "/search",
+            body=json.dumps({"uuid": "1234", "changes": changes}),
+            headers={"Content-Type": "application/json"})
+        self.assertEqual(result.status_code, 202)
+        self.assertEqual(self.updates, [("1234", changes)])
+        result = self.client.simulate_patch(
+            "/search",
+            body="uuid=1234",
+            headers={"Content-Type": "application/json"})
+        self.assertEqual(result.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
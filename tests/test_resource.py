@@ -0,0 +1,983 @@
+#-------------------------------------------------------------------------------
+# Name:         test_resource
+# Purpose:      Unit tests for Fedora Resources against a fake Fedora server
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import configparser
+import datetime
+import falcon
+import falcon.testing
+import hashlib
+import io
+import json
+import os
+import rdflib
+import re
+import sys
+import threading
+import unittest
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.resources.fedora import DigestStream, FedoraTransaction
+from repository.resources.fedora import Container, Resource, ResourceBatch
+from repository.utilities.ingesters import GraphIngester
+from repository.utilities.namespaces import BF, FEDORA, LDP
+from tests.test_offline import JSON_LD
+
+MASTER = bytes(range(256)) * 1024
+
+TITLE_TURTLE = """@prefix bf: <http://bibframe.org/vocab/> .
+
+<> bf:label "{0}" ;
+    bf:title [ bf:titleValue "{0}" ] ."""
+
+
+class FakeFedoraHandler(BaseHTTPRequestHandler):
+    """Stores binaries and RDF Resources in memory like Fedora 4. A Digest
+    header that doesn't match the binary is rejected with 409, with corrupt
+    set the stored digest never matches the binary. Resources created in a
+    transaction are moved out of it on commit and dropped on rollback."""
+
+    def __body__(self):
+        if 'Content-Length' in self.headers:
+            return self.rfile.read(int(self.headers['Content-Length']))
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def __send__(self, status, body=b"", headers={}):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __url__(self, path):
+        return "http://localhost:{}{}".format(
+            self.server.server_port,
+            path)
+
+    def do_DELETE(self):
+        self.requests.append(('DELETE', self.path))
+        tx_path = None
+        if self.path.startswith("/rest/tx:"):
+            tx_path = "/".join(self.path.split("/")[:3])
+        root = self.path.replace(tx_path, "/rest", 1) if tx_path else self.path
+        paths = [path for path in self.resources
+                 if path == root or path.startswith(root + "/")]
+        if len(paths) < 1:
+            self.__send__(404)
+            return
+        if tx_path is not None:
+            # Deleted when the transaction is committed
+            self.deletes.setdefault(tx_path, []).extend(paths)
+        else:
+            for path in paths:
+                self.resources.pop(path)
+        self.__send__(204)
+
+    def do_GET(self):
+        self.requests.append(('GET', self.path))
+        if self.path.endswith("/fcr:metadata"):
+            path = self.path[:-len("/fcr:metadata")]
+            resource = self.resources.get(path)
+            if resource is None:
+                self.__send__(404)
+                return
+            self.__send__(
+                200,
+                '<{}> <http://www.loc.gov/premis/rdf/v1#hasMessageDigest> '
+                '<urn:sha1:{}> .\n'.format(
+                    self.__url__(path),
+                    resource['digest']).encode(),
+                {'Content-Type': 'application/n-triples'})
+            return
+        resource = self.resources.get(self.path)
+        if resource is None:
+            self.__send__(404)
+            return
+        body = resource['body']
+        headers = {'Content-Type': resource['mimetype'],
+                   'Accept-Ranges': 'bytes',
+                   'ETag': '"{}"'.format(resource['digest'])}
+        byte_range = self.headers.get('Range')
+        if byte_range is None:
+            self.__send__(200, body, headers)
+            return
+        first, last = byte_range.split("=")[-1].split("-")
+        first, last = int(first), int(last or len(body) - 1)
+        if first >= len(body):
+            headers['Content-Range'] = 'bytes */{}'.format(len(body))
+            self.__send__(416, b"", headers)
+            return
+        last = min(last, len(body) - 1)
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+            first,
+            last,
+            len(body))
+        self.__send__(206, body[first:last+1], headers)
+
+    def __transaction__(self):
+        if self.path == "/rest/fcr:tx":
+            FakeFedoraHandler.transactions += 1
+            self.__send__(201, headers={"Location": self.__url__(
+                "/rest/tx:{}".format(FakeFedoraHandler.transactions))})
+            return
+        tx_path, action = self.path.split("/fcr:tx")
+        paths = [path for path in self.resources
+                 if path.startswith(tx_path + "/")]
+        deletes = self.deletes.pop(tx_path, [])
+        if action == "/fcr:commit":
+            for path in deletes:
+                self.resources.pop(path, None)
+            for path in paths:
+                resource = self.resources.pop(path)
+                resource['body'] = resource['body'].replace(
+                    self.__url__(tx_path).encode(),
+                    self.__url__("/rest").encode())
+                self.resources[path.replace(tx_path, "/rest", 1)] = resource
+        elif action == "/fcr:rollback":
+            for path in paths:
+                self.resources.pop(path)
+        self.__send__(204)
+
+    def do_POST(self):
+        self.requests.append(('POST', self.path))
+        if "fcr:tx" in self.path:
+            self.__transaction__()
+            return
+        body = self.__body__()
+        digest = hashlib.sha1(body).hexdigest()
+        expected = self.headers.get('Digest')
+        if expected and expected.split("=", 1)[-1] != digest:
+            self.__send__(409, b"Checksum Mismatch")
+            return
+        if self.corrupt:
+            digest = hashlib.sha1(body + b"corrupt").hexdigest()
+        path = "/".join([self.path, uuid.uuid4().hex])
+        mimetype = self.headers.get('Content-Type')
+        if mimetype == 'text/turtle':
+            url = self.__url__(path)
+            # Fedora knows the owl prefix used by ingest_turtle
+            graph = rdflib.Graph().parse(
+                data=b"@prefix owl: <http://www.w3.org/2002/07/owl#> .\n" + 
+                     body,
+                format='turtle',
+                publicID=url)
+            graph.add((rdflib.URIRef(url),
+                       FEDORA.uuid,
+                       rdflib.Literal(path.split("/")[-1])))
+            # Fedora's root and transactions end with a slash
+            parent = self.__url__(self.path)
+            if re.match(r"^/rest(/tx:\d+)?$", self.path):
+                parent += "/"
+            graph.add((rdflib.URIRef(url),
+                       FEDORA.hasParent,
+                       rdflib.URIRef(parent)))
+            body = graph.serialize(format='nt')
+            mimetype = 'application/n-triples'
+        self.resources[path] = {
+            'body': body,
+            'chunked': 'Content-Length' not in self.headers,
+            'digest': digest,
+            'mimetype': mimetype}
+        self.__send__(201, self.__url__(path).encode())
+
+    def do_PUT(self):
+        self.requests.append(('PUT', self.path))
+        self.__body__()
+        self.__send__(204)
+
+    def __match__(self, graph, patterns, binding):
+        # Binds the variables of the patterns to the first match in graph
+        if len(patterns) < 1:
+            return binding
+        pattern = [binding.get(term, term) for term in patterns[0]]
+        for triple in graph.triples(tuple([
+                None if str(term).startswith("urn:var:") else term
+                for term in pattern])):
+            match = dict(binding)
+            for term, value in zip(pattern, triple):
+                if str(term).startswith("urn:var:"):
+                    match[term] = value
+            match = self.__match__(graph, patterns[1:], match)
+            if match is not None:
+                return match
+
+    def do_PATCH(self):
+        """Applies a DELETE, INSERT and OPTIONAL WHERE SPARQL update, rdflib
+        can't parse SPARQL here so variables are read as urn:var: IRIs"""
+        self.requests.append(('PATCH', self.path))
+        resource = self.resources.get(self.path)
+        graph = rdflib.Graph().parse(data=resource['body'], format='nt')
+        delete, insert, where = re.search(
+            r"DELETE {\n(.*)} INSERT {\n(.*)} WHERE {\n(.*)}$",
+            self.__body__().decode(),
+            re.S).groups()
+        def triples(section):
+            return list(rdflib.Graph().parse(
+                data=re.sub(r"\?(\w+)", r"<urn:var:\1>", section),
+                format='nt'))
+        patterns = triples(where.replace("OPTIONAL {", "").replace("}", ""))
+        binding = self.__match__(graph, patterns, {}) or {}
+        for triple in triples(delete):
+            graph.remove(tuple([binding.get(term, term) for term in triple]))
+        for triple in triples(insert):
+            graph.add(triple)
+        resource['body'] = graph.serialize(format='nt')
+        self.__send__(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    """Fake Fuseki and Elastic search, stores the triples of INSERT DATA
+    updates in graph and evaluates container listings and subtrees against
+    them, answers other SPARQL queries with the bindings set on the class, 
+    records SPARQL updates and bulk requests and finds documents by id 
+    in docs"""
+
+    def __term__(self, term):
+        if term.startswith("<"):
+            return rdflib.URIRef(term[1:-1])
+        prefix, name = term.split(":")
+        return rdflib.URIRef({"fedora": str(FEDORA), 
+                              "ldp": str(LDP)}[prefix] + name)
+
+    def __subtree__(self, query):
+        roots = [rdflib.URIRef(root) for root in re.findall(
+            r"<([^>]+)>",
+            re.search(r"VALUES \?root {([^}]*)}", query).group(1))]
+        # ?root is either the subject or the object of the property path
+        start, predicate, end = re.search(
+            r"VALUES \?root {[^}]*}\s*(\S+) (\S+)\* (\S+) \.",
+            query).groups()
+        predicate = self.__term__(predicate)
+        members, queue = set(), list(roots)
+        while len(queue) > 0:
+            member = queue.pop()
+            if member in members:
+                continue
+            members.add(member)
+            if start == "?root":
+                queue.extend(self.graph.objects(member, predicate))
+            else:
+                queue.extend(self.graph.subjects(predicate, member))
+        subjects = set(members)
+        for member in members:
+            for object_ in self.graph.objects(subject=member):
+                if str(object_).startswith(str(member) + "#"):
+                    subjects.add(object_)
+        bindings = []
+        for subject in sorted(subjects):
+            row = {"subject": {"type": "uri", "value": str(subject)}}
+            uuid_ = self.graph.value(subject=subject, predicate=FEDORA.uuid)
+            if uuid_ is not None:
+                row["uuid"] = {"type": "literal", "value": str(uuid_)}
+            bindings.append(row)
+        return bindings
+
+    def __children__(self, query):
+        # ?child is either the subject or the object of the first pattern
+        pattern = re.search(r"WHERE {\s*(\S+) (\S+) (\S+) \.", query)
+        subject, predicate, object_ = [self.__term__(term) 
+                                       if term != "?child" else None
+                                       for term in pattern.groups()]
+        children = [triple[0] if subject is None else triple[2]
+                    for triple in self.graph.triples(
+                        (subject, predicate, object_))]
+        after = re.search(r'STR\(\?child\) > "(.*)"', query).group(1)
+        limit = int(re.search(r"LIMIT (\d+)", query).group(1))
+        bindings = []
+        for child in sorted([child for child in children 
+                             if str(child) > after])[:limit]:
+            row = {"child": {"type": "uri", "value": str(child)}}
+            uuid_ = self.graph.value(subject=child, predicate=FEDORA.uuid)
+            if uuid_ is not None:
+                row["uuid"] = {"type": "literal", "value": str(uuid_)}
+            bindings.append(row)
+        return bindings
+
+    def __body__(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def __send__(self, body):
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        body = self.__body__()
+        path = self.path.split("?")[0]
+        if path == "/ds/query":
+            form = urllib.parse.parse_qs(body.decode())
+            query = form['query'][0]
+            self.queries.append(query)
+            bindings = self.bindings
+            if "?child" in query:
+                bindings = self.__children__(query)
+            elif "?root" in query:
+                bindings = self.__subtree__(query)
+            self.__send__({"results": {"bindings": bindings}})
+        elif path == "/ds/update":
+            form = urllib.parse.parse_qs(body.decode())
+            update = form['update'][0]
+            self.updates.append(update)
+            if "INSERT DATA {" in update and "GRAPH" not in update:
+                self.graph.parse(
+                    data=update[update.index("{") + 1:update.rindex("}")],
+                    format='nt')
+            self.__send__({})
+        elif path.endswith("/_update"):
+            self.updates.append(json.loads(body.decode()))
+            self.__send__({"result": "updated"})
+        elif path == "/_search":
+            ids = json.loads(body.decode())['query']['ids']['values']
+            self.__send__({"hits": {"hits": [
+                {"_index": "bibframe", "_type": "Work", "_id": doc_id}
+                for doc_id in ids if doc_id in self.docs]}})
+        elif path == "/_bulk":
+            lines = body.decode().splitlines()
+            actions = [json.loads(line) for line in lines]
+            self.bulks.append(actions)
+            self.__send__({"took": 1, "errors": False, "items": [
+                {op: dict(meta, status=200)} for action in actions
+                for op, meta in action.items()]})
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FedoraTestCase(unittest.TestCase):
+    """Runs a fake Fedora and a Resource configured to use it"""
+
+    def setUp(self):
+        FakeFedoraHandler.resources = {}
+        FakeFedoraHandler.requests = []
+        FakeFedoraHandler.corrupt = False
+        FakeFedoraHandler.transactions = 0
+        FakeFedoraHandler.deletes = {}
+        self.server = HTTPServer(('localhost', 0), FakeFedoraHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.config = configparser.ConfigParser()
+        self.config.read_dict({
+            "FEDORA": {"host": "localhost",
+                       "port": str(self.server.server_port)},
+            "ELASTICSEARCH": {"host": "localhost", "port": "9200"}})
+        self.resource = Resource(self.config)
+        self.rest_url = self.resource.rest_url
+
+    def path(self, url):
+        return url.split(str(self.server.server_port))[-1]
+
+    def graph(self, title, work=None):
+        subject = rdflib.URIRef("http://catalog/{}".format(uuid.uuid4()))
+        graph = rdflib.Graph()
+        graph.add((subject, BF.titleValue, rdflib.Literal(title)))
+        if work is not None:
+            graph.add((subject, BF.instanceOf, rdflib.URIRef(work)))
+        return graph
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class TestResourceConfig(FedoraTestCase):
+
+    def test_cache_size(self):
+        # configparser returns every option as a string
+        self.config.read_dict({"FEDORA": {"cache_size": "2"}})
+        resource = Resource(self.config)
+        self.assertEqual(resource.graphs.graphs.size, 2)
+        self.assertEqual(resource.serializations.size, 2)
+        for key in range(3):
+            resource.serializations.set(key, b"")
+        self.assertEqual(len(resource.serializations), 2)
+
+
+class TestNewBinary(FedoraTestCase):
+
+    def test_digest_stream(self):
+        stream = DigestStream(io.BytesIO(MASTER), chunk_size=1000)
+        self.assertEqual(b"".join(stream), MASTER)
+        self.assertEqual(stream.length, len(MASTER))
+        self.assertEqual(stream.sha1.hexdigest(),
+                         hashlib.sha1(MASTER).hexdigest())
+        self.assertEqual(stream.md5.hexdigest(),
+                         hashlib.md5(MASTER).hexdigest())
+
+    def test_streamed(self):
+        metadata_url = self.resource.__new_binary__(
+            self.rest_url,
+            io.BytesIO(MASTER),
+            'image/tiff',
+            digest="sha1={}".format(hashlib.sha1(MASTER).hexdigest()))
+        self.assertTrue(metadata_url.endswith("/fcr:metadata"))
+        stored = list(FakeFedoraHandler.resources.values())
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored[0]['body'], MASTER)
+        self.assertTrue(stored[0]['chunked'])
+        self.assertEqual(stored[0]['mimetype'], 'image/tiff')
+
+    def test_digest_mismatch(self):
+        with self.assertRaises(falcon.HTTPConflict):
+            self.resource.__new_binary__(
+                self.rest_url,
+                io.BytesIO(MASTER),
+                'image/tiff',
+                digest="sha1={}".format(hashlib.sha1(b"other").hexdigest()))
+        self.assertEqual(FakeFedoraHandler.resources, {})
+
+    def test_fixity_check(self):
+        FakeFedoraHandler.corrupt = True
+        with self.assertRaises(falcon.HTTPConflict):
+            self.resource.__new_binary__(
+                self.rest_url,
+                MASTER,
+                'image/tiff')
+        # The corrupt binary is deleted from Fedora
+        self.assertEqual(FakeFedoraHandler.resources, {})
+        self.assertEqual(FakeFedoraHandler.requests[-1][0], 'DELETE')
+
+
+class TestStreamBinary(FedoraTestCase):
+
+    def setUp(self):
+        super(TestStreamBinary, self).setUp()
+        metadata_url = self.resource.__new_binary__(
+            self.rest_url,
+            MASTER,
+            'audio/wav')
+        self.resource.searcher.registry.add("master", metadata_url)
+        api = falcon.API()
+        api.add_route("/Resource/{id}", self.resource)
+        self.client = falcon.testing.TestClient(api)
+
+    def test_whole(self):
+        result = self.client.simulate_get(
+            "/Resource/master",
+            params={"binary": "true"})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.content, MASTER)
+        self.assertEqual(result.headers['content-type'], 'audio/wav')
+        self.assertEqual(result.headers['content-length'], str(len(MASTER)))
+        self.assertEqual(result.headers['accept-ranges'], 'bytes')
+        self.assertIn('etag', result.headers)
+
+    def test_range(self):
+        result = self.client.simulate_get(
+            "/Resource/master",
+            params={"binary": "true"},
+            headers={"Range": "bytes=1000-1999"})
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.content, MASTER[1000:2000])
+        self.assertEqual(result.headers['content-length'], '1000')
+        self.assertEqual(
+            result.headers['content-range'],
+            'bytes 1000-1999/{}'.format(len(MASTER)))
+
+    def test_unsatisfiable_range(self):
+        result = self.client.simulate_get(
+            "/Resource/master",
+            params={"binary": "true"},
+            headers={"Range": "bytes={}-".format(len(MASTER))})
+        self.assertEqual(result.status_code, 416)
+        self.assertEqual(
+            result.headers['content-range'],
+            'bytes */{}'.format(len(MASTER)))
+
+
+class RecordingTripleStore(object):
+    """Records the graphs loaded into Fuseki"""
+
+    named_graphs = False
+
+    def __init__(self, fail=False):
+        self.loaded = []
+        self.fail = fail
+
+    def __load__(self, graph, name=None):
+        self.loaded.append((str(name), graph))
+
+    def __load_many__(self, graphs):
+        if self.fail:
+            raise falcon.HTTPInternalServerError("Fuseki is down", "")
+        for graph in graphs:
+            self.loaded.append((None, graph))
+
+
+class TestMultiGet(FedoraTestCase):
+
+    def setUp(self):
+        super(TestMultiGet, self).setUp()
+        self.urls = []
+        for title in ["Hamlet", "Macbeth"]:
+            resource = Resource(self.config, self.resource.searcher)
+            url = resource.__create__(rdf=self.graph(title), load=False)
+            self.resource.searcher.registry.add(resource.uuid, url)
+            self.urls.append(url)
+        api = falcon.API()
+        api.add_route("/Resource", self.resource)
+        self.client = falcon.testing.TestClient(api)
+
+    def get(self, headers=None):
+        return self.client.simulate_get(
+            "/Resource",
+            params={"ids": ",".join([url.split("/")[-1]
+                                     for url in self.urls])},
+            headers=headers)
+
+    def test_default(self):
+        for headers in [None, {"Accept": "*/*"}]:
+            result = self.get(headers)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(result.headers['content-type'],
+                             'application/ld+json')
+
+    def test_nquads(self):
+        result = self.get({"Accept": "application/n-quads"})
+        self.assertEqual(result.headers['content-type'],
+                         'application/n-quads')
+        graphs = set([line.split(" ")[-2]
+                      for line in result.text.splitlines()
+                      if len(line) > 0 and not line.startswith("#")])
+        self.assertEqual(graphs,
+                         set(["<{}>".format(url) for url in self.urls]))
+
+    def test_not_acceptable(self):
+        self.assertEqual(self.get({"Accept": "text/html"}).status_code, 406)
+
+
+class TestFedoraTransaction(FedoraTestCase):
+
+    def setUp(self):
+        super(TestFedoraTransaction, self).setUp()
+        self.triplestore = RecordingTripleStore()
+        self.resource.searcher.triplestore = self.triplestore
+        self.transaction = FedoraTransaction(
+            self.config,
+            self.resource.searcher)
+        self.transaction.begin()
+
+    def __create__(self, graph):
+        return Resource(self.config, self.resource.searcher).__create__(
+            rdf=graph,
+            transaction=self.transaction)
+
+    def test_commit(self):
+        self.assertEqual(self.transaction.token, "tx:1")
+        work_url = self.__create__(self.graph("Hamlet"))
+        instance_url = self.__create__(self.graph("Hamlet", work_url))
+        self.assertTrue(instance_url.startswith(self.transaction.url))
+        # Nothing is loaded or registered before the commit
+        self.assertEqual(self.triplestore.loaded, [])
+        committed = self.transaction.commit()
+        self.assertEqual(committed, [
+            url.replace(self.transaction.url, self.rest_url)
+            for url in [work_url, instance_url]])
+        self.assertEqual(
+            sorted(FakeFedoraHandler.resources),
+            sorted([self.path(url) for url in committed]))
+        # Links between the transaction's Resources are rewritten
+        name, graph = self.triplestore.loaded[1]
+        self.assertEqual(name, committed[1])
+        self.assertEqual(
+            graph.value(subject=rdflib.URIRef(committed[1]),
+                        predicate=BF.instanceOf),
+            rdflib.URIRef(committed[0]))
+        self.assertEqual(
+            self.resource.searcher.registry.url(committed[0].split("/")[-1]),
+            committed[0])
+
+    def test_rollback(self):
+        self.__create__(self.graph("Hamlet"))
+        self.transaction.rollback()
+        self.assertEqual(FakeFedoraHandler.resources, {})
+        self.assertEqual(self.transaction.pending, [])
+        self.assertEqual(self.triplestore.loaded, [])
+
+    def test_keep_alive(self):
+        self.transaction.keep_alive(60)
+        self.assertEqual(FakeFedoraHandler.requests[-1][1], "/rest/fcr:tx")
+        # A transaction idle for more than a day is refreshed
+        self.transaction.refreshed -= datetime.timedelta(days=1, seconds=5)
+        self.transaction.keep_alive(60)
+        self.assertEqual(FakeFedoraHandler.requests[-1],
+                         ('POST', '/rest/tx:1/fcr:tx'))
+
+
+class TestResourceBatch(FedoraTestCase):
+
+    NQUADS = """<http://catalog/work1> <http://bibframe.org/vocab/titleValue> "Hamlet" <http://catalog/work1> .
+<http://catalog/work2> <http://bibframe.org/vocab/titleValue> "Macbeth" <http://catalog/work2> .
+"""
+
+    MULTIPART = (b"--batch\r\n"
+        b'Content-Disposition: form-data; name="hamlet"\r\n'
+        b"Content-Type: text/turtle\r\n\r\n"
+        b'<http://catalog/work1> <http://bibframe.org/vocab/titleValue> "Hamlet" .\r\n'
+        b"--batch\r\n"
+        b'Content-Disposition: form-data; name="macbeth"\r\n'
+        b"Content-Type: application/n-triples\r\n\r\n"
+        b'<http://catalog/work2> <http://bibframe.org/vocab/titleValue> "Macbeth" .\r\n'
+        b"--batch--\r\n")
+
+    def setUp(self):
+        super(TestResourceBatch, self).setUp()
+        self.batch = ResourceBatch(self.config, self.resource.searcher)
+        self.triplestore = RecordingTripleStore()
+        self.resource.searcher.triplestore = self.triplestore
+        api = falcon.API()
+        api.add_route("/Resource/batch", self.batch)
+        self.client = falcon.testing.TestClient(api)
+
+    def test_nquads(self):
+        result = self.client.simulate_post(
+            "/Resource/batch",
+            body=self.NQUADS,
+            headers={"Content-Type": "application/n-quads"})
+        self.assertEqual(result.status_code, 201)
+        results = json.loads(result.text)["results"]
+        self.assertEqual(
+            sorted([row["item"] for row in results]),
+            ["http://catalog/work1", "http://catalog/work2"])
+        # Created in one transaction and committed
+        self.assertEqual(FakeFedoraHandler.transactions, 1)
+        self.assertEqual(
+            sorted(FakeFedoraHandler.resources),
+            sorted([self.path(row["uri"]) for row in results]))
+        for row in results:
+            self.assertTrue(row["uri"].startswith(self.rest_url + "/"))
+            self.assertNotIn("tx:", row["uri"])
+            self.assertEqual(
+                self.resource.searcher.registry.url(row["uuid"]),
+                row["uri"])
+        # Fuseki is loaded with the committed URLs
+        self.assertEqual(len(self.triplestore.loaded), 2)
+        for name, graph in self.triplestore.loaded:
+            self.assertIn(
+                str(next(iter(graph.subjects()))),
+                [row["uri"] for row in results])
+
+    def test_multipart(self):
+        result = self.client.simulate_post(
+            "/Resource/batch",
+            body=self.MULTIPART,
+            headers={"Content-Type": "multipart/form-data; boundary=batch"})
+        self.assertEqual(result.status_code, 201)
+        self.assertEqual(
+            sorted([row["item"] for row in json.loads(result.text)["results"]]),
+            ["hamlet", "macbeth"])
+        self.assertEqual(len(FakeFedoraHandler.resources), 2)
+
+    def test_unsupported_part(self):
+        result = self.client.simulate_post(
+            "/Resource/batch",
+            body=self.MULTIPART.replace(b"text/turtle", b"image/tiff"),
+            headers={"Content-Type": "multipart/form-data; boundary=batch"})
+        self.assertEqual(result.status_code, 415)
+        self.assertEqual(FakeFedoraHandler.transactions, 0)
+
+    def test_rollback(self):
+        self.triplestore.fail = True
+        result = self.client.simulate_post(
+            "/Resource/batch",
+            body=self.NQUADS,
+            headers={"Content-Type": "application/n-quads"})
+        self.assertEqual(result.status_code, 207)
+        results = json.loads(result.text)["results"]
+        self.assertEqual([row["status"] for row in results], [500, 500])
+        self.assertIn("Fuseki is down", results[0]["error"])
+        self.assertEqual(FakeFedoraHandler.resources, {})
+
+
+class ServicesTestCase(FedoraTestCase):
+    """Runs a fake Fedora and fake Fuseki and Elastic search"""
+
+    def setUp(self):
+        FakeServicesHandler.bindings = []
+        FakeServicesHandler.queries = []
+        FakeServicesHandler.updates = []
+        FakeServicesHandler.bulks = []
+        FakeServicesHandler.docs = set()
+        FakeServicesHandler.graph = rdflib.Graph()
+        self.services = HTTPServer(('localhost', 0), FakeServicesHandler)
+        self.services_thread = threading.Thread(
+            target=self.services.serve_forever)
+        self.services_thread.start()
+        super(ServicesTestCase, self).setUp()
+        port = str(self.services.server_port)
+        self.config.read_dict({
+            "FUSEKI": {"host": "localhost", "port": port, "datastore": "ds"},
+            "ELASTICSEARCH": {"host": "localhost", "port": port}})
+        self.resource = Resource(self.config)
+
+    def tearDown(self):
+        super(ServicesTestCase, self).tearDown()
+        self.services.shutdown()
+        self.services.server_close()
+        self.services_thread.join()
+
+
+class TestContainerListing(ServicesTestCase):
+
+    def setUp(self):
+        super(TestContainerListing, self).setUp()
+        api = falcon.API()
+        api.add_route("/Resource", self.resource)
+        api.add_route("/Container", Container(
+            self.config, 
+            self.resource.searcher))
+        api.add_route("/Container/{id}", Container(
+            self.config, 
+            self.resource.searcher))
+        self.client = falcon.testing.TestClient(api)
+
+    def post(self, id=None):
+        params = {"rdf": self.graph("Hamlet").serialize(
+            format='turtle').decode()}
+        if id is not None:
+            params["id"] = id
+        result = self.client.simulate_post("/Resource", params=params)
+        self.assertEqual(result.status_code, 201)
+        return json.loads(result.text)
+
+    def test_new_children(self):
+        container = self.post()
+        # Only the new children's graphs are loaded into Fuseki
+        children = sorted([self.post(self.path(container["uri"]).split(
+                               "/rest/")[-1])["uri"] for i in range(3)])
+        result = self.client.simulate_get(
+            "/Container/{}".format(container["message"].split("=")[-1]))
+        page = json.loads(result.text)
+        self.assertEqual(page["@id"], container["uri"])
+        self.assertEqual([child["@id"] for child in page["ldp:contains"]],
+                         children)
+        root = json.loads(self.client.simulate_get("/Container").text)
+        self.assertTrue(root["@id"].endswith("/rest/"))
+        self.assertEqual([child["@id"] for child in root["ldp:contains"]],
+                         [container["uri"]])
+
+
+class LabelIngester(GraphIngester):
+    """Creates every subject in order, deduplicating by bf:label"""
+
+    def __init__(self, **kwargs):
+        super(LabelIngester, self).__init__(**kwargs)
+        self.subjects.sort(key=lambda row: str(row[0]))
+        self.dedup_predicates = [BF.label]
+
+    def __process_subject__(self, row):
+        self.__add_or_get_graph__(
+            subject=row[0],
+            graph=row[1],
+            graph_type=BF.Work)
+
+
+class TestGraphIngester(ServicesTestCase):
+
+    def test_ingest(self):
+        graph = rdflib.Graph()
+        for work in ["http://catalog/a-work", "http://catalog/c-work"]:
+            graph.add((rdflib.URIRef(work), BF.label, rdflib.Literal("Hamlet")))
+        graph.add((rdflib.URIRef("http://catalog/b-instance"),
+                   BF.instanceOf,
+                   rdflib.URIRef("http://catalog/a-work")))
+        ingester = LabelIngester(
+            config=self.config,
+            graph=graph,
+            base_url="http://catalog",
+            search=self.resource.searcher)
+        ingester.ingest()
+        # The second Hamlet matches the first before Fuseki has either
+        self.assertEqual(len(FakeFedoraHandler.resources), 2)
+        instances = [rdflib.Graph().parse(data=resource['body'], format='nt')
+                     for resource in FakeFedoraHandler.resources.values()
+                     if b"instanceOf" in resource['body']]
+        work_url = next(instances[0].objects(predicate=BF.instanceOf))
+        # The Instance links to the Work created earlier in the ingest
+        self.assertIn(self.path(str(work_url)), FakeFedoraHandler.resources)
+
+
+@unittest.skipUnless(JSON_LD, "rdflib-jsonld isn't installed")
+class TestUpdateByDiff(ServicesTestCase):
+
+    def setUp(self):
+        super(TestUpdateByDiff, self).setUp()
+        api = falcon.API()
+        api.add_route("/Resource", self.resource)
+        api.add_route("/Resource/{id}", self.resource)
+        self.client = falcon.testing.TestClient(api)
+        result = json.loads(self.client.simulate_post(
+            "/Resource",
+            params={"rdf": TITLE_TURTLE.format("Hamlet")}).text)
+        self.uuid = result["message"].split("=")[-1]
+        self.url = result["uri"]
+        self.resource.searcher.registry.add(self.uuid, self.url)
+        self.resource.searcher.registry.add_locations(
+            [(self.uuid, "bibframe", "Work")])
+
+    def titles(self):
+        graph = rdflib.Graph().parse(
+            data=FakeFedoraHandler.resources[self.path(self.url)]['body'],
+            format='nt')
+        return sorted([str(graph.value(subject=title, 
+                                       predicate=BF.titleValue))
+                       for title in graph.objects(
+                           subject=rdflib.URIRef(self.url),
+                           predicate=BF.title)])
+
+    def test_put(self):
+        result = self.client.simulate_put(
+            "/Resource/{}".format(self.uuid),
+            body=TITLE_TURTLE.format("Macbeth"),
+            headers={"Content-Type": "text/turtle"})
+        self.assertEqual(result.status_code, 200)
+        # The blank node title is replaced, not added beside the old one
+        self.assertEqual(self.titles(), ["Macbeth"])
+
+    def test_patch(self):
+        result = self.client.simulate_patch(
+            "/Resource/{}".format(self.uuid),
+            body='@prefix bf: <http://bibframe.org/vocab/> .\n'
+                 '<> bf:title [ bf:titleValue "Othello" ] .',
+            headers={"Content-Type": "text/turtle"})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(self.titles(), ["Othello"])
+
+
+class TestCascadeDelete(ServicesTestCase):
+
+    def setUp(self):
+        super(TestCascadeDelete, self).setUp()
+        self.work_url = self.__create__(self.rest_url)
+        self.instance_url = self.__create__(self.work_url)
+        self.other_url = self.__create__(self.rest_url)
+        FakeServicesHandler.updates = []
+
+    def __create__(self, post_url):
+        # Loads only the new Resource's graph into Fuseki, so only the 
+        # child carries the link to its parent
+        resource = Resource(self.config, self.resource.searcher)
+        resource.rest_url = post_url
+        url = resource.__create__(rdf=self.graph("Hamlet"))
+        FakeServicesHandler.docs.add(resource.uuid)
+        # A hash resource has no uuid
+        FakeServicesHandler.graph.add((
+            rdflib.URIRef(url),
+            BF.note,
+            rdflib.URIRef(url + "#hash")))
+        FakeServicesHandler.graph.add((
+            rdflib.URIRef(url + "#hash"),
+            BF.label,
+            rdflib.Literal("Note")))
+        return url
+
+    def test_subtree(self):
+        graph = FakeServicesHandler.graph
+        self.assertIsNone(graph.value(subject=rdflib.URIRef(self.work_url),
+                                      predicate=LDP.contains))
+        self.assertEqual(
+            graph.value(subject=rdflib.URIRef(self.instance_url),
+                        predicate=FEDORA.hasParent),
+            rdflib.URIRef(self.work_url))
+        result = self.resource.__delete__([self.work_url])
+        query = FakeServicesHandler.queries[0]
+        self.assertIn("fedora:hasParent*", query)
+        self.assertEqual(query.count("<{}>".format(self.work_url)), 2)
+        self.assertEqual(result["subjects"], sorted([
+            self.work_url, 
+            self.work_url + "#hash",
+            self.instance_url,
+            self.instance_url + "#hash"]))
+        # Fedora deletes the subtree with one DELETE
+        self.assertEqual(
+            [request for request in FakeFedoraHandler.requests
+             if request[0] == 'DELETE'],
+            [('DELETE', self.path(self.work_url))])
+        self.assertEqual(
+            list(FakeFedoraHandler.resources),
+            [self.path(self.other_url)])
+        # Fuseki triples are deleted with one update
+        self.assertEqual(len(FakeServicesHandler.updates), 1)
+        for subject in result["subjects"]:
+            self.assertIn("<{}>".format(subject), 
+                          FakeServicesHandler.updates[0])
+        # Elastic search documents are deleted with one bulk request
+        self.assertEqual(len(FakeServicesHandler.bulks), 1)
+        self.assertEqual(
+            sorted([action["delete"]["_id"]
+                    for action in FakeServicesHandler.bulks[0]]),
+            result["uuids"])
+        self.assertIsNone(self.resource.searcher.registry.url(
+            self.work_url.split("/")[-1]))
+        self.assertEqual(
+            self.resource.searcher.registry.url(self.other_url.split("/")[-1]),
+            self.other_url)
+
+    def test_bulk_delete(self):
+        api = falcon.API()
+        api.add_route("/Resource", self.resource)
+        client = falcon.testing.TestClient(api)
+        result = client.simulate_delete(
+            "/Resource",
+            params={"ids": ",".join([self.work_url.split("/")[-1],
+                                     self.other_url.split("/")[-1]])})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(json.loads(result.text)["uuids"]), 3)
+        # Many roots are deleted in one transaction
+        self.assertEqual(FakeFedoraHandler.transactions, 1)
+        self.assertEqual(FakeFedoraHandler.resources, {})
+        self.assertEqual(len(FakeServicesHandler.updates), 1)
+        self.assertEqual(len(FakeServicesHandler.bulks), 1)
+
+    def test_named_graphs(self):
+        triplestore = self.resource.searcher.triplestore
+        triplestore.named_graphs = True
+        triplestore.__delete_subjects__([self.work_url, self.instance_url])
+        self.assertEqual(
+            FakeServicesHandler.updates[0],
+            "DROP SILENT GRAPH <{}> ;\nDROP SILENT GRAPH <{}>".format(
+                self.work_url,
+                self.instance_url))
+
+    def test_update_triple_named_graph(self):
+        triplestore = self.resource.searcher.triplestore
+        triplestore.named_graphs = True
+        triplestore.__update_triple__(
+            self.work_url + "#title",
+            "bf:titleValue",
+            "Hamlet")
+        # The hash subject is updated in its Resource's graph
+        self.assertIn(
+            "GRAPH <{}> {{".format(self.work_url),
+            FakeServicesHandler.updates[-1])
+        self.assertIn(
+            '<{}#title> bf:titleValue  "Hamlet"'.format(self.work_url),
+            FakeServicesHandler.updates[-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#-------------------------------------------------------------------------------
+# Name:         test_shards
+# Purpose:      Unit tests for the BIBFRAME shard allocator
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.shards import AllocatorManager
+from repository.utilities.transforming.shards import ShardAllocator
+
+# Nothing listens here, any request to seed a counter fails the test
+FEDORA_URL = "http://localhost:1"
+
+
+class FakeRedis(object):
+    """Implements the redis.StrictRedis commands used by the allocator"""
+
+    def __init__(self):
+        self.values = dict()
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def exists(self, key):
+        return key in self.values
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def setnx(self, key, value):
+        self.values.setdefault(key, value)
+
+
+def allocate_many(allocator, count):
+    for i in range(count):
+        allocator.allocate("Work")
+
+
+class TestShardAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "shards.json")
+        with open(self.path, "w") as counters_file:
+            json.dump({"Work": 9998, "test/Person": 0}, counters_file)
+
+    def test_allocate(self):
+        allocator = ShardAllocator(FEDORA_URL, path=self.path, shard_size=5000)
+        self.assertEqual(allocator.allocate("Work"), 2)
+        self.assertEqual(allocator.allocate("Work"), 2)
+        self.assertEqual(allocator.allocate("Work"), 3)
+        self.assertEqual(allocator.allocate("Person", "test"), 1)
+
+    def test_persistent(self):
+        allocator = ShardAllocator(FEDORA_URL, path=self.path, flush_every=2)
+        allocator.allocate("Work")
+        allocator.allocate("Work")
+        self.assertEqual(
+            ShardAllocator(FEDORA_URL, path=self.path).counters["Work"],
+            10000)
+        allocator.allocate("Person", "test")
+        allocator.save()
+        self.assertEqual(
+            ShardAllocator(FEDORA_URL, path=self.path).counters["test/Person"],
+            1)
+
+    def test_redis(self):
+        fake_redis = FakeRedis()
+        fake_redis.setnx("bibframe:shards:Work", 4999)
+        first = ShardAllocator(FEDORA_URL, redis_client=fake_redis)
+        second = ShardAllocator(FEDORA_URL, redis_client=fake_redis)
+        self.assertEqual(first.allocate("Work"), 1)
+        self.assertEqual(second.allocate("Work"), 2)
+        self.assertEqual(fake_redis.values["bibframe:shards:Work"], 5001)
+
+    def test_manager(self):
+        manager = AllocatorManager()
+        manager.start()
+        try:
+            allocator = manager.ShardAllocator(FEDORA_URL, path=self.path)
+            processes = [multiprocessing.Process(
+                             target=allocate_many,
+                             args=(allocator, 25))
+                         for i in range(3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            allocator.save()
+        finally:
+            manager.shutdown()
+        self.assertEqual(
+            ShardAllocator(FEDORA_URL, path=self.path).counters["Work"],
+            9998 + 75)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#-------------------------------------------------------------------------------
+# Name:         test_titles
+# Purpose:      Unit tests for matching BIBFRAME Titles in MongoDB
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import os
+import sys
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming import titles
+from repository.utilities.transforming.titles import TitleMatcher
+
+
+class FakeCursor(list):
+
+    def limit(self, count):
+        return FakeCursor(self[:count])
+
+
+class FakeCollection(object):
+    """Evaluates $or queries of field equality like pymongo.Collection"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.indexes = []
+        self.queries = 0
+
+    def create_index(self, keys):
+        self.indexes.append(keys)
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return FakeCursor([document for document in self.documents
+                           if any([all([document.get(field) == value
+                                        for field, value in row.items()])
+                                   for row in query["$or"]])])
+
+    def find_one(self, query, projection=None):
+        self.queries += 1
+        for document in self.documents:
+            if all([document.get(field) == value
+                    for field, value in query.items()]):
+                return document
+
+
+class TestTitleMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection([
+            {"_id": 1, "titleValue": "Russell Crowe"},
+            {"_id": 2, "label": "Russell Crowe the biography"},
+            {"_id": 3,
+             "titleValue": "Russell Crowe",
+             "subtitle": "the biography"}])
+        self.matcher = TitleMatcher(self.collection)
+
+    def test_indexes(self):
+        self.assertEqual(len(self.collection.indexes), 4)
+
+    def test_priority(self):
+        title_id = self.matcher.match(
+            titleValue="Russell Crowe",
+            subtitle="the biography",
+            label="Russell Crowe the biography")
+        self.assertEqual(title_id, 3)
+        self.assertEqual(self.collection.queries, 1)
+        self.assertEqual(
+            self.matcher.match(titleValue="Russell Crowe", label="Gladiator"),
+            1)
+        self.assertIsNone(self.matcher.match(titleValue="Gladiator"))
+
+    def test_title_value_last(self):
+        self.assertEqual(
+            self.matcher.match(titleValue="Russell Crowe", label="Gladiator"),
+            1)
+        # The $or misses, then the title value alone is queried
+        self.assertEqual(self.collection.queries, 2)
+
+    def test_limit(self):
+        collection = FakeCollection(
+            [{"_id": i, "label": "Poems"} for i in range(3)] +
+            [{"_id": 3, "label": "Poems", "authorizedAccessPoint": "Poems /"}])
+        matcher = TitleMatcher(collection)
+        match_limit, titles.MATCH_LIMIT = titles.MATCH_LIMIT, 2
+        try:
+            title_id = matcher.match(
+                authorizedAccessPoint="Poems /",
+                label="Poems")
+        finally:
+            titles.MATCH_LIMIT = match_limit
+        self.assertEqual(title_id, 3)
+
+    def test_cache(self):
+        self.matcher.match(titleValue="Russell Crowe")
+        self.matcher.match(titleValue="Russell Crowe")
+        self.assertEqual(self.collection.queries, 1)
+        self.matcher.add(4, titleValue="Gladiator", id="http://catalog/1title")
+        self.assertEqual(
+            self.matcher.match(titleValue="Gladiator", id="http://catalog/1title"),
+            4)
+        self.assertEqual(self.collection.queries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
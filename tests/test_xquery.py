@@ -0,0 +1,116 @@
+#-------------------------------------------------------------------------------
+# Name:         test_xquery
+# Purpose:      Unit tests for the pooled MARC2BIBFRAME xquery client
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     GPLv3
+#-------------------------------------------------------------------------------
+import io
+import os
+import pymarc
+import rdflib
+import sys
+import threading
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from repository.utilities.transforming.xquery import BIBFRAME_NS
+from repository.utilities.transforming.xquery import XQueryClient
+from repository.utilities.transforming.xquery import XQueryError
+from repository.utilities.transforming.xquery import XQueryServer
+
+CATALOG = rdflib.Namespace("http://catalog/")
+
+
+def marc_record(control_number, title):
+    record = pymarc.Record()
+    record.add_field(pymarc.Field(tag='001', data=control_number))
+    record.add_field(pymarc.Field(
+        tag='245',
+        indicators=['0', '0'],
+        subfields=[pymarc.Subfield('a', title)]))
+    return record
+
+
+def fake_convert(marc_xml):
+    """Stands in for Saxon, converting each record to a Work with a Title"""
+    records = pymarc.parse_xml_to_array(io.BytesIO(marc_xml))
+    if len(records) < 1:
+        raise ValueError("No MARC records")
+    graph = rdflib.Graph()
+    for record in records:
+        number = record['001'].data
+        work, title = CATALOG["{}work".format(number)], rdflib.BNode()
+        graph.add((work, rdflib.RDF.type, BIBFRAME_NS.Work))
+        graph.add((work,
+                   BIBFRAME_NS.derivedFrom,
+                   CATALOG["{}.marcxml.xml".format(number)]))
+        graph.add((work, BIBFRAME_NS.workTitle, title))
+        graph.add((title, BIBFRAME_NS.titleValue, rdflib.Literal(record.title)))
+    return graph.serialize(format='xml')
+
+
+class TestXQueryClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = XQueryServer(("localhost", 0), fake_convert)
+        self.connections = 0
+        self.server.verify_request = self.__count__
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = XQueryClient(
+            "localhost",
+            self.server.server_address[1],
+            pool_size=2)
+
+    def __count__(self, request, client_address):
+        self.connections += 1
+        return True
+
+    def test_convert(self):
+        for number in ["1", "2", "3"]:
+            marc_xml = pymarc.record_to_xml(
+                marc_record(number, "Title {}".format(number)),
+                namespace=True)
+            graph = self.client.convert(marc_xml)
+            self.assertEqual(
+                list(graph.objects(predicate=BIBFRAME_NS.titleValue)),
+                [rdflib.Literal("Title {}".format(number))])
+        self.assertEqual(self.connections, 1)
+
+    def test_convert_many(self):
+        records = [marc_record(str(i), "Title {}".format(i)) for i in range(5)]
+        graphs = self.client.convert_many(records)
+        self.assertEqual(len(graphs), 5)
+        for i, graph in enumerate(graphs):
+            self.assertEqual(len(graph), 4)
+            self.assertEqual(
+                list(graph.objects(predicate=BIBFRAME_NS.titleValue)),
+                [rdflib.Literal("Title {}".format(i))])
+
+    def test_duplicate_control_numbers(self):
+        records = [marc_record(str(i), "Title {}".format(i)) for i in range(4)]
+        records[3]['001'].data = "1"
+        graphs = self.client.convert_many(records)
+        # Both records with 001 1 keep their own graph
+        for i, graph in enumerate(graphs):
+            self.assertEqual(
+                list(graph.objects(predicate=BIBFRAME_NS.titleValue)),
+                [rdflib.Literal("Title {}".format(i))])
+
+    def test_error(self):
+        with self.assertRaises(XQueryError):
+            self.client.rdf_xml(b"<collection/>")
+        # Connection is still usable after an error
+        self.client.convert(pymarc.record_to_xml(
+            marc_record("1", "Title"), namespace=True))
+        self.assertEqual(self.connections, 1)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()